@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+This script is a single command-line entry point to the daily Census divisions
+climate averages workflow, with the subcommands:
+
+    transform   transform the Census boundaries coordinates (as in
+                transformCoordinates.py)
+    fetch       pull the latest daily climate readings only
+    compute     generate the divisions averages (as in getCDAverages.py) from
+                the raw data already pulled, or after pulling with --fetch
+    backfill    recalculate any date range of the divisions averages in month
+                or year chunks calculated in parallel
+    export      export the output store to CSV or the indexed binary format
+    status      print the state of the raw data, output and last run
+
+Paths and other configuration values are given as options instead of being
+hard-coded, e.g.
+
+    python climateCLI.py compute --directory DATA --set province=QC --fetch
+
+Heavy packages (pandas, shapely, pyproj) are only imported by the subcommands
+that need them, so status starts without them and transform and fetch only
+import what they use.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# DEFINE REQUIRED VARIABLES
+
+# Census boundaries files to transform (input file and output folder/file name pairs)
+transform_files = [["lcd_000b16a_e.shp", "census_divisions"], ["lcsd000b16a_e.shp", "census_subdivisions"]]
+
+# Source coordinate system of the Census boundaries using parameters given by StatsCan
+lcc = "+proj=lcc +lon_0=-91.866667 +lat_0=63.390675 +lat_1=49.000000 +lat_2=77.000000 +x_0=6200000 +y_0=3000000"
+
+# Output coordinate system of the Census boundaries
+wgs84 = "epsg:4326"
+
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+import sys
+import json
+import argparse
+from pipelineConfig import getConfig, getOutputExists
+
+###############################################################################
+# DEFINE COMMAND FUNCTIONS
+
+# Define function to get the configuration given by the command line options
+def getCommandConfig(args):
+    """
+    Returns the complete configuration (see getConfig) from the JSON file of
+    --config, the --directory option and the --set KEY=VALUE options, in that
+    order of precedence (values of --set are read as JSON if possible, e.g.
+    numbers, true or null, and else as strings).
+    """
+    config = {}
+    if args.config is not None:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    if args.directory is not None:
+        config["directory"] = args.directory
+    for setting in args.set:
+        if "=" not in setting:
+            raise ValueError("ERROR! Configuration values must be given as KEY=VALUE, not " + setting + ".")
+        key, value = setting.split("=", 1)
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return getConfig(config)
+
+# Define function to run the transform command
+def runTransform(args):
+    """
+    Transforms the coordinates of the Census boundaries files in directory
+    from the source to the output coordinate system.
+    """
+    import pyproj as pj
+    from transformFunctions import applyTransforms
+    os.chdir(args.directory or ".")
+    transformation = pj.Transformer.from_proj(args.source, args.target, always_xy = True)
+    applyTransforms(transformation, [tuple(pair) for pair in args.files], workers = args.workers)
+    for inputfile, outputfile in args.files:
+        print("\n" + inputfile + " coordinates successfully transformed to " + outputfile + ".")
+
+# Define function to run the fetch command
+def runFetch(args):
+    """
+    Pulls the latest daily climate readings to the raw data of directory,
+    without calculating any averages.
+    """
+    from fetchFunctions import fetchClimate, getRecalcStart
+    config = getCommandConfig(args)
+    fetchClimate(config, getRecalcStart(config))
+
+# Define function to run the compute command
+def runCompute(args):
+    """
+    Generates the daily climate averages by Census division (see runPipeline)
+    from the raw data already pulled, or after pulling the latest readings if
+    --fetch is given.
+    """
+    from pipeline import runPipeline
+    runPipeline(getCommandConfig(args), fetch = args.fetch)
+
+# Define function to run the backfill command
+def runBackfillCommand(args):
+    """
+    Recalculates the divisions averages between --start and --end in chunks
+    calculated in parallel (see runBackfill).
+    """
+    from pipeline import runBackfill
+    runBackfill(getCommandConfig(args), args.start, args.end, chunk = args.chunk, workers = args.workers)
+
+# Define function to run the export command
+def runExport(args):
+    """
+    Exports the whole output to CSV (from the output store) or to the indexed
+    binary format (see saveClimateIndex).
+    """
+    config = getCommandConfig(args)
+    if args.to == "csv":
+        from fetchFunctions import exportPartitions
+        output_store = os.path.join(config["output_dir"], config["output_store"])
+        if not os.path.exists(output_store):
+            raise ValueError("ERROR! There is no output store " + output_store + " to export.")
+        outputfile = os.path.join(config["output_dir"], config["outputfile"])
+        exportPartitions(output_store, "date", ["cduid", "date"], outputfile)
+        print("\nOutput store exported to " + outputfile + ".")
+    else:
+        from pipeline import saveDivisionIndex
+        if config["output_index"] is None:
+            raise ValueError("ERROR! The index folder must be given with --set output_index=FOLDER.")
+        if not getOutputExists(config):
+            raise ValueError("ERROR! There is no output to export.")
+        rows = saveDivisionIndex(config)
+        print("\n" + str(rows) + " divisions averages saved to " + config["output_index"] + ".")
+
+# Define function to run the status command
+def runStatus(args):
+    """
+    Prints the date of the raw data, whether the output and index exist, and
+    the stages of the last run report, without importing pandas.
+    """
+    config = getCommandConfig(args)
+    directory = config["directory"]
+    output_dir = config["output_dir"]
+    print("Project directory: " + directory)
+    if config["master_format"] == "csv":
+        climate_dir = os.path.join(directory, "daily_climate")
+        files = os.listdir(climate_dir) if os.path.exists(climate_dir) else []
+        print("Raw climate data: " + (", ".join(files) or "none"))
+    else:
+        updated_file = os.path.join(directory, config["climate_store"], "last_update.txt")
+        last_update = "none"
+        if os.path.exists(updated_file):
+            with open(updated_file) as f:
+                last_update = f.read()
+        print("Raw climate store last updated: " + last_update)
+    output = config["outputfile"] if config["output_format"] == "csv" else config["output_store"]
+    print("Output " + output + ": " + ("exists" if getOutputExists(config) else "missing"))
+    if config["output_index"] is not None:
+        index_exists = os.path.exists(os.path.join(output_dir, config["output_index"], "index.json"))
+        print("Index " + config["output_index"] + ": " + ("exists" if index_exists else "missing"))
+    report_file = os.path.join(output_dir, config["run_report"])
+    if not os.path.exists(report_file):
+        print("Last run: none")
+        return
+    with open(report_file) as f:
+        report = json.load(f)
+    print("Last run: " + report["started"] + " (" + str(report.get("total_seconds")) + "s, peak memory " +
+          str(report.get("peak_rss_mb")) + " MB, workers " + str(report.get("workers_peak_rss_mb")) + " MB)")
+    for record in report.get("stages", []):
+        increase = record.get("peak_rss_increase_mb")
+        print("  " + record["stage"].ljust(13) + str(record.get("seconds")).rjust(10) + "s" +
+              ("" if increase is None else ("  peak +" + str(increase) + " MB").ljust(17)) +
+              ("  cached" if record.get("cached") else ""))
+
+# Define function to get the command line parser
+def getParser():
+    """
+    Returns the command line parser with one subparser per command.
+    """
+    config_parser = argparse.ArgumentParser(add_help = False)
+    config_parser.add_argument("--directory", help = "project directory (DATA folder)")
+    config_parser.add_argument("--config", help = "JSON file of configuration values (see pipelineConfig.py)")
+    config_parser.add_argument("--set", action = "append", default = [], metavar = "KEY=VALUE",
+                               help = "configuration value, e.g. province=QC or output_format=parquet")
+    parser = argparse.ArgumentParser(description = "Daily climate averages by Census division.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    transform = commands.add_parser("transform", help = "transform the Census boundaries coordinates")
+    transform.add_argument("--directory", help = "project directory (DATA folder)")
+    transform.add_argument("--files", nargs = 2, action = "append", metavar = ("INPUT", "OUTPUT"),
+                           help = "input shapefile and output folder/file name (repeat for several files)")
+    transform.add_argument("--source", default = lcc, help = "source coordinate system")
+    transform.add_argument("--target", default = wgs84, help = "output coordinate system")
+    transform.add_argument("--workers", type = int, default = 2, help = "files transformed at the same time")
+    transform.set_defaults(function = runTransform)
+    fetch = commands.add_parser("fetch", parents = [config_parser], help = "pull the latest climate readings")
+    fetch.set_defaults(function = runFetch)
+    compute = commands.add_parser("compute", parents = [config_parser], help = "generate the divisions averages")
+    compute.add_argument("--fetch", action = "store_true", help = "pull the latest climate readings first")
+    compute.set_defaults(function = runCompute)
+    backfill = commands.add_parser("backfill", parents = [config_parser], help = "recalculate a date range")
+    backfill.add_argument("--start", help = "first date to recalculate (default start_date)")
+    backfill.add_argument("--end", help = "last date to recalculate (default end_date)")
+    backfill.add_argument("--chunk", choices = ["month", "year"], default = "month", help = "length of chunks")
+    backfill.add_argument("--workers", type = int, default = 4, help = "chunks calculated at the same time")
+    backfill.set_defaults(function = runBackfillCommand)
+    export = commands.add_parser("export", parents = [config_parser], help = "export the output")
+    export.add_argument("--to", choices = ["csv", "index"], default = "csv", help = "export format")
+    export.set_defaults(function = runExport)
+    status = commands.add_parser("status", parents = [config_parser], help = "print the state of the workflow")
+    status.set_defaults(function = runStatus)
+    return parser
+
+###############################################################################
+# RUN COMMAND
+if __name__ == "__main__":
+    args = getParser().parse_args()
+    if args.command == "transform" and args.files is None:
+        args.files = transform_files
+    try:
+        args.function(args)
+    except ValueError as error:
+        sys.exit(str(error))
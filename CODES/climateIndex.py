@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+This script defines functions to save the daily Census divisions climate
+averages (created by getCDAverages.py) to an indexed binary format and to
+query divisions and date ranges from it through memory-mapped arrays, without
+reading the whole output. It only requires numpy and pandas, so it can be
+imported by dashboards and models that read the averages.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+import json
+import pandas as pd
+import numpy as np
+
+###############################################################################
+# FUNCTIONS TO SAVE AND QUERY THE DIVISIONS CLIMATE INDEX
+
+# Define function to save divisions climate averages to an indexed binary format
+def saveClimateIndex(df_cd, index_dir):
+    """
+    Saves the divisions climate averages df_cd to index_dir as a (divisions x
+    dates x variables) float64 array of all columns other than cduid and date
+    (values.npy) with a (divisions x dates) array flagging the rows present 
+    in df_cd (present.npy), divisions sorted by code and dates running daily
+    from the first to the last date, and the division codes, first date and
+    variables in index.json. Each file is written to a temporary file first
+    and then moved into place. Load with loadClimateIndex.
+
+    Parameters
+    ----------
+    df_cd : dataframe
+        Panel dataframe of daily climate averages by Census division (columns
+        cduid, date and one column per climate variable).
+    index_dir : str
+        Directory of the index.
+
+    Returns
+    -------
+    None.
+    """
+    index_vars = [col for col in df_cd.columns if col not in ["cduid", "date"]]
+    cduids = np.sort(df_cd.cduid.unique())
+    dates = pd.DatetimeIndex(df_cd.date)
+    start_date = dates.min()
+    num_dates = (dates.max() - start_date).days + 1
+    row = np.searchsorted(cduids, df_cd.cduid.to_numpy())
+    col = (dates - start_date).days
+    values = np.full((len(cduids), num_dates, len(index_vars)), np.nan)
+    values[row, col] = df_cd[index_vars].to_numpy(dtype = float)
+    present = np.zeros((len(cduids), num_dates), dtype = bool)
+    present[row, col] = True
+    os.makedirs(index_dir, exist_ok = True)
+    for name, array in [("values.npy", values), ("present.npy", present)]:
+        path = os.path.join(index_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+    path = os.path.join(index_dir, "index.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({"cduids": cduids.tolist(), "start_date": str(start_date.date()), "num_dates": num_dates,
+                   "variables": index_vars}, f)
+    os.replace(path + ".tmp", path)
+
+# Define function to open the divisions climate index
+def loadClimateIndex(index_dir):
+    """
+    Returns the divisions climate index saved by saveClimateIndex, with the
+    arrays memory-mapped so that only the parts queried are read.
+
+    Parameters
+    ----------
+    index_dir : str
+        Directory of the index.
+
+    Raises
+    ------
+    ValueError
+        If the arrays do not match the division codes and dates of the index
+        (e.g. if the index is being rewritten).
+
+    Returns
+    -------
+    dictionary
+        Index with division codes (cduids), first date (start_date),
+        variables, and memory-mapped values and present arrays.
+    """
+    with open(os.path.join(index_dir, "index.json")) as f:
+        meta = json.load(f)
+    values = np.load(os.path.join(index_dir, "values.npy"), mmap_mode = "r")
+    present = np.load(os.path.join(index_dir, "present.npy"), mmap_mode = "r")
+    shape = (len(meta["cduids"]), meta["num_dates"])
+    if values.shape != shape + (len(meta["variables"]),) or present.shape != shape:
+        raise ValueError("ERROR! The arrays of the climate index in " + index_dir + " do not match index.json.")
+    return {"cduids": np.array(meta["cduids"]), "start_date": np.datetime64(meta["start_date"], "D"),
+            "variables": meta["variables"], "values": values, "present": present}
+
+# Define function to query divisions and dates from the divisions climate index
+def queryClimateIndex(index, cduids = None, start_date = None, end_date = None, variables = None,
+                      as_frame = True):
+    """
+    Returns the climate averages of the given divisions between start_date and
+    end_date from an index opened with loadClimateIndex, reading only the
+    requested divisions and dates.
+
+    Parameters
+    ----------
+    index : dictionary
+        Index (see loadClimateIndex).
+    cduids : list of ints, optional
+        Division codes to return, or None for all divisions. The default is
+        None.
+    start_date : datetime, optional
+        First date to return, or None for the first date of the index. The
+        default is None.
+    end_date : datetime, optional
+        Last date to return, or None for the last date of the index. The
+        default is None.
+    variables : list of str, optional
+        Variables to return, or None for all variables. The default is None.
+    as_frame : bool, optional
+        Return a panel dataframe ordered by division and date (as the output
+        file, without missing rows) if True, or the arrays if False. The
+        default is True.
+
+    Raises
+    ------
+    ValueError
+        If a division code or variable is not in the index.
+
+    Returns
+    -------
+    dataframe or dictionary
+        Panel dataframe with columns cduid, date and variables, or dictionary
+        of division codes (cduid), dates (date), (divisions x dates x
+        variables) values and (divisions x dates) present arrays.
+    """
+    all_cduids = index["cduids"]
+    if cduids is None:
+        pos = np.arange(len(all_cduids))
+    else:
+        cduids = np.asarray(cduids)
+        pos = np.minimum(np.searchsorted(all_cduids, cduids), len(all_cduids) - 1)
+        if not (all_cduids[pos] == cduids).all():
+            raise ValueError("ERROR! Divisions " + str(list(cduids[all_cduids[pos] != cduids])) + " are not in the climate index.")
+    if variables is None:
+        variables = index["variables"]
+    missing = [var for var in variables if var not in index["variables"]]
+    if len(missing) > 0:
+        raise ValueError("ERROR! Variables " + str(missing) + " are not in the climate index.")
+    var_pos = [index["variables"].index(var) for var in variables]
+    num_dates = index["present"].shape[1]
+    first = 0 if start_date is None else int((np.datetime64(pd.Timestamp(start_date).date(), "D") - index["start_date"]).astype(int))
+    last = num_dates - 1 if end_date is None else int((np.datetime64(pd.Timestamp(end_date).date(), "D") - index["start_date"]).astype(int))
+    first, last = max(first, 0), min(last, num_dates - 1)
+    if last < first:
+        first, last = 0, -1
+    values = index["values"][pos, first:last + 1][:, :, var_pos]
+    present = index["present"][pos, first:last + 1]
+    dates = index["start_date"] + np.arange(first, last + 1)
+    if not as_frame:
+        return {"cduid": all_cduids[pos], "date": dates, "values": values, "present": present}
+    row, col = np.nonzero(present)
+    df = pd.DataFrame({"cduid": all_cduids[pos][row], "date": pd.DatetimeIndex(dates[col])})
+    for k, var in enumerate(variables):
+        df[var] = values[row, col, k]
+    return df
@@ -0,0 +1,867 @@
+# -*- coding: utf-8 -*-
+"""
+This script defines the functions that pull the daily climate readings and
+save them to the raw data (the fetch stage of pipeline.py and the fetch 
+command of climateCLI.py). They only require pandas (and pyarrow for the 
+columnar stores), so pulling the latest readings does not import shapely or
+pyshp.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+import time
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from datetime import datetime, timedelta
+from pipelineConfig import getOutputExists
+
+###############################################################################
+# FUNCTIONS REQUIRED BY pipeline.py
+
+# Columns of the climate-daily API items collection (of an empty pull)
+climate_columns = ["x", "y", "ID", "STATION_NAME", "CLIMATE_IDENTIFIER", "PROVINCE_CODE", "LOCAL_DATE", 
+                   "LOCAL_YEAR", "LOCAL_MONTH", "LOCAL_DAY"] + \
+                  [var + suffix for var in ["MEAN_TEMPERATURE", "MIN_TEMPERATURE", "MAX_TEMPERATURE", 
+                                            "TOTAL_PRECIPITATION", "TOTAL_RAIN", "TOTAL_SNOW", "SNOW_ON_GROUND",
+                                            "DIRECTION_MAX_GUST", "SPEED_MAX_GUST", "COOLING_DEGREE_DAYS", 
+                                            "HEATING_DEGREE_DAYS", "MIN_REL_HUMIDITY", "MAX_REL_HUMIDITY"]
+                   for suffix in ["", "_FLAG"]]
+
+# Define function to get the climate-daily API query for a given date range
+def getClimateURL(api_url, start_date, end_date, limit = 1500000, startindex = 0, province = "ON"):
+    """
+    Returns URL of the climate-daily API query for daily climate readings of
+    the given province (Ontario by default, or all of Canada if province is 
+    None) between start_date and end_date in CSV format.
+
+    Parameters
+    ----------
+    api_url : str
+        URL of the climate-daily items collection (e.g. 
+        "https://api.weather.gc.ca/collections/climate-daily/items").
+    start_date : datetime
+        First date to pull.
+    end_date : datetime
+        Last date to pull.
+    limit : int, optional
+        Maximum number of readings to return. The default is 1500000.
+    startindex : int, optional
+        Index of first reading to return. The default is 0.
+    province : str, optional
+        2-letter province code (PROVINCE_CODE) of readings to return, or None 
+        for all provinces. The default is "ON".
+
+    Returns
+    -------
+    str
+        Query URL.
+    """
+    province_filter = ""
+    if province is not None:
+        province_filter = "&PROVINCE_CODE=" + province
+    return (api_url + "?datetime=" + str(start_date) + "%2000:00:00/" + str(end_date) + 
+            "%2000:00:00" + province_filter + "&sortby=PROVINCE_CODE,CLIMATE_IDENTIFIER,LOCAL_DATE" + 
+            "&f=csv&limit=" + str(limit) + "&startindex=" + str(startindex))
+
+# Define function to read daily climate readings from a CSV file or query
+def readClimateCSV(path, columns = None):
+    """
+    Returns dataframe of daily climate readings of CSV file or climate-daily
+    query path, with all columns (or only columns, which must include 
+    LOCAL_DATE) read as strings except LOCAL_DATE (see parseClimateDates).
+    """
+    return parseClimateDates(pd.read_csv(path, dtype = str, usecols = columns))
+
+# Define function to convert the dates of daily climate readings read as strings
+def parseClimateDates(master):
+    """
+    Returns master daily climate data with LOCAL_DATE converted to datetime.
+    The column is converted explicitly because read_csv only parses the 
+    dates of columns also read with dtype str from pandas 3 onwards.
+    """
+    master = master.copy()
+    master["LOCAL_DATE"] = pd.to_datetime(master.LOCAL_DATE)
+    return master
+
+# Define function to pull daily climate readings for a given date range
+def getClimateDaily(api_url, start_date, end_date, province = "ON"):
+    """
+    Returns dataframe of daily climate readings of the given province between 
+    start_date and end_date from the climate-daily API, with all columns read
+    as strings except LOCAL_DATE.
+
+    Parameters
+    ----------
+    api_url : str
+        URL of the climate-daily items collection.
+    start_date : datetime
+        First date to pull.
+    end_date : datetime
+        Last date to pull.
+    province : str, optional
+        2-letter province code of readings to pull, or None for all provinces.
+        The default is "ON".
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings.
+    """
+    url = getClimateURL(api_url, start_date, end_date, province = province)
+    return readClimateCSV(url)
+
+# Define function to pull one page of daily climate readings, retrying with backoff if it fails
+def getClimatePage(url, max_retries = 5, backoff = 1):
+    """
+    Returns dataframe of daily climate readings from one climate-daily API 
+    query, with all columns read as strings except LOCAL_DATE. Failed 
+    requests are retried after waiting backoff, 2 * backoff, 4 * backoff, ... 
+    seconds.
+
+    Parameters
+    ----------
+    url : str
+        Query URL (see getClimateURL).
+    max_retries : int, optional
+        Number of times to retry a failed request. The default is 5.
+    backoff : float, optional
+        Seconds to wait before the first retry. The default is 1.
+
+    Raises
+    ------
+    Exception
+        Last error raised by the request if all retries fail.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return readClimateCSV(url)
+        except pd.errors.EmptyDataError:
+            return getEmptyClimateDaily()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+# Define function to get an empty dataframe of daily climate readings
+def getEmptyClimateDaily():
+    """
+    Returns empty dataframe with the columns of climate_columns, read as 
+    strings except LOCAL_DATE (as a pull without readings).
+    """
+    return parseClimateDates(pd.DataFrame(columns = climate_columns, dtype = str))
+
+# Define function to pull daily climate readings in concurrent, resumable monthly pages, one month at a time
+def getClimateWindows(api_url, start_date, end_date, checkpoint_dir, max_workers = 4, 
+                      page_size = 100000, max_retries = 5, backoff = 1, province = "ON"):
+    """
+    Yields the daily climate readings of the given province between 
+    start_date and end_date from the climate-daily API one monthly window at
+    a time, in date order. The windows are pulled concurrently, each in pages
+    of page_size readings. Every completed page is saved to checkpoint_dir so
+    that an interrupted pull resumes from the pages still missing, and only
+    the pages of the window being yielded are read back into memory; 
+    checkpoint_dir is removed once the last window has been yielded. Pages 
+    are only resumed on the day they were pulled and with the same query (a 
+    checksum of the query URL and pull date is part of their names), so 
+    readings revised since are pulled again; other pages are removed.
+
+    Parameters
+    ----------
+    api_url : str
+        URL of the climate-daily items collection.
+    start_date : datetime
+        First date to pull.
+    end_date : datetime
+        Last date to pull.
+    checkpoint_dir : str
+        Directory to save completed pages.
+    max_workers : int, optional
+        Number of monthly windows to pull at the same time. The default is 4.
+    page_size : int, optional
+        Number of readings per page. The default is 100000.
+    max_retries : int, optional
+        Number of times to retry a failed page (see getClimatePage). The 
+        default is 5.
+    backoff : float, optional
+        Seconds to wait before the first retry of a failed page. The default 
+        is 1.
+    province : str, optional
+        2-letter province code of readings to pull, or None for all provinces.
+        The default is "ON".
+
+    Yields
+    ------
+    window_start : date
+        First date of the window.
+    window_end : date
+        Last date of the window.
+    dataframe
+        Dataframe containing the daily climate readings of the window, sorted
+        as returned by the API, with the columns of climate_columns if there 
+        are none.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    prefix = (province or "all") + "_"
+    pulled = str(pd.Timestamp.today().date())
+    windows = []
+    for month in pd.period_range(start = start_date, end = end_date, freq = "M"):
+        window_start = max(start_date, month.start_time).date()
+        window_end = min(end_date, month.end_time).date()
+        query = getClimateURL(api_url, window_start, window_end, page_size, 0, province) + pulled
+        checksum = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+        windows.append((prefix + str(window_start) + "_" + str(window_end) + "_" + checksum, window_start, window_end))
+    
+    # Remove pages of other queries or pulled on earlier days
+    os.makedirs(checkpoint_dir, exist_ok = True)
+    names = [name for name, _, _ in windows]
+    for file in os.listdir(checkpoint_dir):
+        if not any(file.startswith(name + "_") or file == name + ".done" for name in names):
+            os.remove(os.path.join(checkpoint_dir, file))
+    
+    # Pull the pages of one window in order, skipping pages already saved
+    def getWindow(window):
+        name, window_start, window_end = window
+        k = 0
+        while not os.path.exists(os.path.join(checkpoint_dir, name + ".done")):
+            path = os.path.join(checkpoint_dir, name + "_" + str(k) + ".csv")
+            if not os.path.exists(path):
+                url = getClimateURL(api_url, window_start, window_end, page_size, k * page_size, province)
+                page = getClimatePage(url, max_retries, backoff)
+                page.to_csv(path + ".tmp", index = False)
+                os.replace(path + ".tmp", path)
+                if len(page) < page_size:
+                    open(os.path.join(checkpoint_dir, name + ".done"), "w").close()
+            k += 1
+    
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        list(executor.map(getWindow, windows))
+    
+    # Combine the pages of each window in order
+    for name, window_start, window_end in windows:
+        data = []
+        k = 0
+        while os.path.exists(os.path.join(checkpoint_dir, name + "_" + str(k) + ".csv")):
+            path = os.path.join(checkpoint_dir, name + "_" + str(k) + ".csv")
+            try:
+                data.append(readClimateCSV(path))
+            except pd.errors.EmptyDataError:
+                pass
+            k += 1
+        data = [page for page in data if len(page) > 0]
+        if len(data) == 0:
+            yield window_start, window_end, getEmptyClimateDaily()
+            continue
+        readings = pd.concat(data, ignore_index = True)
+        readings = readings.drop_duplicates(subset = ["CLIMATE_IDENTIFIER", "LOCAL_DATE"], keep = "last")
+        readings = readings.sort_values(by = ["PROVINCE_CODE", "CLIMATE_IDENTIFIER", "LOCAL_DATE"], 
+                                        kind = "stable", ignore_index = True)
+        yield window_start, window_end, readings
+    shutil.rmtree(checkpoint_dir)
+
+# Define function to pull daily climate readings in concurrent, resumable monthly pages
+def getClimateDailyPaged(api_url, start_date, end_date, checkpoint_dir, max_workers = 4, 
+                         page_size = 100000, max_retries = 5, backoff = 1, province = "ON"):
+    """
+    Returns dataframe of daily climate readings of the given province between
+    start_date and end_date from the climate-daily API, as getClimateDaily. The
+    monthly windows of getClimateWindows are pulled concurrently and resumably
+    and then combined, so the whole date range is in memory at once.
+
+    Parameters
+    ----------
+    api_url : str
+        URL of the climate-daily items collection.
+    start_date : datetime
+        First date to pull.
+    end_date : datetime
+        Last date to pull.
+    checkpoint_dir : str
+        Directory to save completed pages.
+    max_workers : int, optional
+        Number of monthly windows to pull at the same time. The default is 4.
+    page_size : int, optional
+        Number of readings per page. The default is 100000.
+    max_retries : int, optional
+        Number of times to retry a failed page (see getClimatePage). The 
+        default is 5.
+    backoff : float, optional
+        Seconds to wait before the first retry of a failed page. The default 
+        is 1.
+    province : str, optional
+        2-letter province code of readings to pull, or None for all provinces.
+        The default is "ON".
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings, with the columns of 
+        climate_columns if there are none.
+    """
+    data = [readings for _, _, readings in getClimateWindows(api_url, start_date, end_date, checkpoint_dir, max_workers, 
+                                                             page_size, max_retries, backoff, province)]
+    data = [readings for readings in data if len(readings) > 0]
+    if len(data) == 0:
+        return getEmptyClimateDaily()
+    master = pd.concat(data, ignore_index = True)
+    master = master.drop_duplicates(subset = ["CLIMATE_IDENTIFIER", "LOCAL_DATE"], keep = "last")
+    master = master.sort_values(by = ["PROVINCE_CODE", "CLIMATE_IDENTIFIER", "LOCAL_DATE"], 
+                                kind = "stable", ignore_index = True)
+    return master
+
+# Define function to merge newly pulled daily climate readings into the master data
+def mergeClimateDaily(master, update, start_date, end_date):
+    """
+    Returns master daily climate data with all readings between start_date 
+    and end_date replaced by those in update, so that new, revised and 
+    removed readings in the window match a full pull. Readings are unique by
+    CLIMATE_IDENTIFIER and LOCAL_DATE and sorted as returned by the API.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing previously pulled daily climate readings.
+    update : dataframe
+        Dataframe containing daily climate readings pulled for start_date to 
+        end_date (see getClimateDaily).
+    start_date : datetime
+        First date of update.
+    end_date : datetime
+        Last date of update.
+
+    Returns
+    -------
+    dataframe
+        Merged daily climate readings.
+    """
+    in_window = (master.LOCAL_DATE >= pd.Timestamp(start_date)) & (master.LOCAL_DATE <= pd.Timestamp(end_date))
+    merged = pd.concat([master[~in_window], update], ignore_index = True)
+    merged = merged.drop_duplicates(subset = ["CLIMATE_IDENTIFIER", "LOCAL_DATE"], keep = "last")
+    merged = merged.sort_values(by = ["PROVINCE_CODE", "CLIMATE_IDENTIFIER", "LOCAL_DATE"], 
+                                kind = "stable", ignore_index = True)
+    return merged
+
+# Define function to convert daily climate readings read as strings to numeric types
+def convertClimateTypes(master):
+    """
+    Returns master daily climate data with measurement and coordinate 
+    columns converted to floats and LOCAL_YEAR, LOCAL_MONTH and LOCAL_DAY 
+    converted to ints, and LOCAL_DATE converted to datetime (see 
+    parseClimateDates). Identifier, name and flag columns are unchanged.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily climate readings read as strings.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings with numeric types.
+    """
+    int_cols = ["LOCAL_YEAR", "LOCAL_MONTH", "LOCAL_DAY"]
+    str_cols = ["CLIMATE_IDENTIFIER", "STATION_NAME", "PROVINCE_CODE", "LOCAL_DATE", "ID"] + int_cols
+    dtypes = {}
+    for v in master:
+        if "_FLAG" not in v and v not in str_cols:
+            dtypes[v] = float
+        elif v in int_cols:
+            dtypes[v] = int
+    master = master.astype(dtypes)
+    if "LOCAL_DATE" in master:
+        master["LOCAL_DATE"] = pd.to_datetime(master.LOCAL_DATE)
+    return master
+
+# Define function to save a dataframe to a date-partitioned columnar store
+def savePartitions(df, store_dir, start_date, end_date, date_col, sort_cols):
+    """
+    Saves rows of df between start_date and end_date to store_dir as one 
+    compressed Parquet file per month (store_dir/YYYY/YYYY-MM.parquet). Rows
+    already stored for dates in this range are replaced (or removed if df has
+    no rows for a date); rows outside it are kept. Each file is written to a 
+    temporary file first and then moved into place, so an interrupted save 
+    never leaves a partially written file.
+
+    Parameters
+    ----------
+    df : dataframe
+        Dataframe to save.
+    store_dir : str
+        Directory of the store.
+    start_date : datetime
+        First date to replace.
+    end_date : datetime
+        Last date to replace.
+    date_col : str
+        Name of date column in df used for partitioning.
+    sort_cols : list of str
+        Columns to sort each file by.
+
+    Returns
+    -------
+    None.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    for month in pd.period_range(start = start_date, end = end_date, freq = "M"):
+        path = os.path.join(store_dir, str(month.year), str(month) + ".parquet")
+        in_month = (df[date_col] >= month.start_time) & (df[date_col] <= month.end_time)
+        update = df[in_month & (df[date_col] >= start_date) & (df[date_col] <= end_date)]
+        if os.path.exists(path):
+            stored = pd.read_parquet(path)
+            stored = stored[(stored[date_col] < start_date) | (stored[date_col] > end_date)]
+            update = pd.concat([stored.reindex(columns = df.columns), update], ignore_index = True)
+        if len(update) == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        update = update.sort_values(by = sort_cols, kind = "stable", ignore_index = True)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        update.to_parquet(path + ".tmp", index = False)
+        os.replace(path + ".tmp", path)
+
+# Define function to load a date range from a date-partitioned columnar store
+def loadPartitions(store_dir, date_col, start_date = None, end_date = None, columns = None):
+    """
+    Returns dataframe of rows between start_date and end_date from the store 
+    in store_dir (see savePartitions). Only the monthly files in the date 
+    range and the requested columns are read.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the store.
+    date_col : str
+        Name of date column used for partitioning.
+    start_date : datetime, optional
+        First date to load. The default is None, in which case all dates up to
+        end_date are loaded.
+    end_date : datetime, optional
+        Last date to load. The default is None, in which case all dates from 
+        start_date are loaded.
+    columns : list of str, optional
+        Columns to load. The default is None, in which case all stored 
+        columns are loaded.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing stored rows in partition order.
+    """
+    paths = sorted(os.path.join(store_dir, year, file) 
+                   for year in os.listdir(store_dir) if os.path.isdir(os.path.join(store_dir, year))
+                   for file in os.listdir(os.path.join(store_dir, year)) if file.endswith(".parquet"))
+    filters = []
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        paths = [p for p in paths if os.path.basename(p)[:7] >= str(start_date.to_period("M"))]
+        filters.append((date_col, ">=", start_date))
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        paths = [p for p in paths if os.path.basename(p)[:7] <= str(end_date.to_period("M"))]
+        filters.append((date_col, "<=", end_date))
+    data = [pd.read_parquet(p, columns = columns, filters = filters if filters else None) for p in paths]
+    if len(data) == 0:
+        return pd.DataFrame(columns = columns)
+    return pd.concat(data, ignore_index = True)
+
+# Define function to export a date-partitioned columnar store to a single CSV file
+def exportPartitions(store_dir, date_col, sort_cols, outputfile):
+    """
+    Saves all rows of the store in store_dir (see savePartitions) to CSV file 
+    outputfile, sorted by sort_cols. The file is written to a temporary file 
+    first and then moved into place.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the store.
+    date_col : str
+        Name of date column used for partitioning.
+    sort_cols : list of str
+        Columns to sort rows by.
+    outputfile : str
+        Path of CSV file.
+
+    Returns
+    -------
+    None.
+    """
+    df = loadPartitions(store_dir, date_col)
+    df = df.sort_values(by = sort_cols, kind = "stable", ignore_index = True)
+    df.to_csv(outputfile + ".tmp", index = False)
+    os.replace(outputfile + ".tmp", outputfile)
+
+# Define function to save daily climate readings to a date-partitioned columnar store
+def saveClimateStore(master, store_dir, start_date, end_date, columns = None):
+    """
+    Saves typed daily climate readings between start_date and end_date to 
+    the climate store in store_dir (see savePartitions), replacing readings 
+    already stored for dates in this range. All columns are stored by 
+    default, so any climate variable can be averaged later (see 
+    getClimateVars) without pulling the readings again.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily climate readings with numeric types (see 
+        convertClimateTypes).
+    store_dir : str
+        Directory of the climate store.
+    start_date : datetime
+        First date to replace.
+    end_date : datetime
+        Last date to replace.
+    columns : list of str, optional
+        Columns to store. The default is None, in which case all columns of
+        master are stored.
+
+    Raises
+    ------
+    ValueError
+        If readings are already stored before start_date without some of the
+        columns to store, in which case those older readings would have no 
+        values in those columns.
+
+    Returns
+    -------
+    None.
+    """
+    if columns is None:
+        columns = list(master.columns)
+    before = pd.Timestamp(start_date) - pd.Timedelta(days = 1)
+    stored = loadPartitions(store_dir, "LOCAL_DATE", before, before) if os.path.exists(store_dir) else None
+    if stored is not None and len(stored.columns) > 0:
+        missing = [col for col in columns if col not in stored]
+        if len(missing) > 0:
+            raise ValueError("ERROR! The climate store " + store_dir + " was saved without columns " + str(missing) +
+                             "; pull all days again with fetch_mode \"full\".")
+    savePartitions(master[columns], store_dir, start_date, end_date, "LOCAL_DATE", 
+                   ["PROVINCE_CODE", "CLIMATE_IDENTIFIER", "LOCAL_DATE"])
+
+# Define function to load daily climate readings for a date range from a columnar store
+def loadClimateStore(store_dir, start_date, end_date, columns = None):
+    """
+    Returns dataframe of daily climate readings between start_date and 
+    end_date from the climate store in store_dir (see saveClimateStore). Only
+    the monthly files in the date range and the requested columns are read.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the climate store.
+    start_date : datetime
+        First date to load.
+    end_date : datetime
+        Last date to load.
+    columns : list of str, optional
+        Columns to load. The default is None, in which case all stored 
+        columns are loaded.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings with numeric types, 
+        sorted as returned by the API.
+    """
+    master = loadPartitions(store_dir, "LOCAL_DATE", start_date, end_date, columns)
+    if "CLIMATE_IDENTIFIER" in master and "PROVINCE_CODE" in master:
+        master = master.sort_values(by = ["PROVINCE_CODE", "CLIMATE_IDENTIFIER", "LOCAL_DATE"], 
+                                    kind = "stable", ignore_index = True)
+    return master
+
+# Define function to get the number of rows of a CSV file that use a given amount of memory
+def getChunkSize(inputfile, memory_mb):
+    """
+    Returns the number of rows of CSV file inputfile that use about memory_mb
+    megabytes when read as strings, estimated from its first 1000 rows (at 
+    least 1000 rows).
+    """
+    sample = pd.read_csv(inputfile, dtype = str, nrows = 1000)
+    row_bytes = max(1, sample.memory_usage(deep = True).sum() / max(1, len(sample)))
+    return max(1000, int(memory_mb * 2 ** 20 / row_bytes))
+
+# Define function to split a CSV file of daily climate readings into monthly files with bounded memory
+def splitClimateFile(inputfile, output_dir, start_date, end_date, memory_mb = 512):
+    """
+    Saves the daily climate readings of CSV file inputfile between start_date
+    and end_date to one CSV file per month in output_dir (YYYY-MM.csv), 
+    keeping the order of the readings within each month and all values as 
+    read (as strings). The file is read in chunks of rows that use about 
+    memory_mb megabytes, estimated from its first rows, so the whole file is
+    never in memory. Any files already in output_dir are removed.
+
+    Parameters
+    ----------
+    inputfile : str
+        Path of CSV file of daily climate readings (see getClimateDaily).
+    output_dir : str
+        Directory of the monthly files.
+    start_date : datetime
+        First date to save.
+    end_date : datetime
+        Last date to save.
+    memory_mb : int, optional
+        Approximate memory used by each chunk of rows read, in megabytes. The
+        default is 512.
+
+    Returns
+    -------
+    int
+        Number of readings saved.
+    """
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    chunksize = getChunkSize(inputfile, memory_mb)
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    rows = 0
+    with pd.read_csv(inputfile, dtype = str, chunksize = chunksize) as reader:
+        for chunk in reader:
+            dates = pd.to_datetime(chunk.LOCAL_DATE)
+            in_range = (dates >= start_date) & (dates <= end_date)
+            chunk, dates = chunk[in_range], dates[in_range]
+            for month, part in chunk.groupby(dates.dt.to_period("M"), sort = False):
+                path = os.path.join(output_dir, str(month) + ".csv")
+                part.to_csv(path, mode = "a", header = not os.path.exists(path), index = False)
+            rows += len(chunk)
+    return rows
+
+# Define function to pull daily climate readings into a CSV file one month at a time
+def saveClimateDailyStreamed(api_url, start_date, end_date, checkpoint_dir, outputfile, old_file = None, 
+                             memory_mb = 512, max_workers = 4, province = "ON"):
+    """
+    Saves the daily climate readings between start_date and end_date pulled 
+    from the climate-daily API to CSV file outputfile one monthly window at a
+    time (see getClimateWindows), after the readings of CSV file old_file (if
+    given) outside that range, which are copied in chunks of about memory_mb 
+    megabytes. Neither the pull nor old_file is ever in memory at once. The 
+    readings are ordered by month and then as returned by the API, so the 
+    readings of each day are in the same order as in the master data of 
+    getClimateDailyPaged and mergeClimateDaily. The file is written to a 
+    temporary file first and then moved into place.
+
+    Parameters
+    ----------
+    api_url : str
+        URL of the climate-daily items collection.
+    start_date : datetime
+        First date to pull.
+    end_date : datetime
+        Last date to pull.
+    checkpoint_dir : str
+        Directory to save completed pages.
+    outputfile : str
+        Path of CSV file.
+    old_file : str, optional
+        Path of CSV file of daily climate readings previously pulled. The 
+        default is None.
+    memory_mb : int, optional
+        Approximate memory used by each chunk of rows of old_file read, in 
+        megabytes. The default is 512.
+    max_workers : int, optional
+        Number of monthly windows to pull at the same time. The default is 4.
+    province : str, optional
+        2-letter province code of readings to pull, or None for all provinces.
+        The default is "ON".
+
+    Returns
+    -------
+    int
+        Number of readings pulled.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    tmp_file = outputfile + ".tmp"
+    columns = None
+    if old_file is not None:
+        with pd.read_csv(old_file, dtype = str, chunksize = getChunkSize(old_file, memory_mb)) as reader:
+            for chunk in reader:
+                dates = pd.to_datetime(chunk.LOCAL_DATE)
+                chunk = chunk[(dates < start_date) | (dates > end_date)]
+                chunk.to_csv(tmp_file, mode = "a" if columns else "w", header = not columns, index = False)
+                columns = columns or list(chunk.columns)
+    rows = 0
+    for _, _, readings in getClimateWindows(api_url, start_date, end_date, checkpoint_dir, max_workers, 
+                                            province = province):
+        if len(readings) == 0 and columns:
+            continue
+        readings = readings if not columns else readings.reindex(columns = columns)
+        readings.to_csv(tmp_file, mode = "a" if columns else "w", header = not columns, index = False)
+        columns = columns or list(readings.columns)
+        rows += len(readings)
+    os.replace(tmp_file, outputfile)
+    return rows
+
+###############################################################################
+# DEFINE FETCH STAGE FUNCTIONS
+
+# Define function to get the last date of the raw daily climate data already pulled
+def getLastPull(config):
+    """
+    Returns the last date of the raw daily climate data in directory, read
+    from the name of the CSV master file (daily_climate_START_to_END.csv) or
+    from last_update.txt of the climate store, or None if there is no raw data
+    or its last date cannot be read.
+    """
+    if config["master_format"] == "csv":
+        climate_dir = os.path.join(config["directory"], "daily_climate")
+        old_files = os.listdir(climate_dir) if os.path.exists(climate_dir) else []
+        if len(old_files) == 0:
+            return None
+        last_pull = os.path.splitext(old_files[0])[0].split("_to_")[-1]
+    else:
+        updated_file = os.path.join(config["directory"], config["climate_store"], "last_update.txt")
+        if not os.path.exists(updated_file):
+            return None
+        with open(updated_file) as f:
+            last_pull = f.read().strip()
+    try:
+        return datetime.fromisoformat(last_pull).date()
+    except ValueError:
+        return None
+
+# Define function to get the first date to pull in incremental fetch mode
+def getFetchStart(config, last_pull):
+    """
+    Returns the first date to pull in incremental fetch mode: the first of the
+    last fetch_window days, or the day after last_pull if the raw data is 
+    older than that, so that no days are skipped. Returns start_date (a full
+    pull) if last_pull is None.
+    """
+    if last_pull is None:
+        return config["start_date"]
+    fetch_start = min(config["end_date"] - timedelta(config["fetch_window"]), last_pull + timedelta(1))
+    if fetch_start < config["end_date"] - timedelta(config["fetch_window"]):
+        print("\nRaw daily climate data last pulled on " + str(last_pull) + ", pulling from " + str(fetch_start) + " onwards.")
+    return max(config["start_date"], fetch_start)
+
+# Define function to get the first date to recalculate
+def getRecalcStart(config):
+    """
+    Returns start_date if the output of config does not exist yet, or else the
+    first of the last recalc_days days, or the day after the last pull if the
+    raw data is older than that (see getLastPull), so that days pulled after a
+    gap are also calculated.
+    """
+    if not getOutputExists(config):
+        return config["start_date"]
+    start = config["end_date"] - timedelta(config["recalc_days"])
+    last_pull = getLastPull(config)
+    if last_pull is not None:
+        start = min(start, last_pull + timedelta(1))
+    return max(config["start_date"], start)
+
+# Define function to pull the latest daily climate readings
+def fetchClimate(config, load_start, pull = True):
+    """
+    Updates the raw daily climate data in directory with today's data if it
+    hasn't been pulled already (and pull is True). If stream_master is True,
+    the readings are pulled and saved one month at a time (see 
+    getClimateWindows), so the pull is never in memory at once.
+
+    Parameters
+    ----------
+    config : dictionary
+        Complete configuration (see getConfig).
+    load_start : datetime
+        First date that will be loaded from the climate store.
+    pull : bool, optional
+        Pull the latest readings if True, or only use the raw data already in
+        directory if False. The default is True.
+
+    Raises
+    ------
+    ValueError
+        If pull is False and there is no raw data in directory (CSV master
+        format only).
+
+    Returns
+    -------
+    files : list of str
+        Paths of the raw data files to load.
+    master : dataframe
+        Raw daily climate readings if they were pulled (CSV master format only
+        and stream_master False) or None.
+    """
+    directory = config["directory"]
+    start = config["start_date"]
+    today = config["end_date"]
+    checkpoint = os.path.join(directory, config["fetch_checkpoint"])
+    master = None
+    if config["master_format"] == "csv":
+        climate_dir = os.path.join(directory, "daily_climate")
+        todayfile = "daily_climate_" + str(start) + "_to_" + str(today) + ".csv"
+        old_files = os.listdir(climate_dir)
+        if todayfile not in old_files and not pull:
+            if len(old_files) == 0:
+                raise ValueError("ERROR! No raw daily climate data in " + climate_dir + ".")
+            todayfile = old_files[0]
+            print("\nClimate data not pulled, using " + todayfile + " already in folder.")
+        elif todayfile not in old_files and config["stream_master"]:
+            if config["fetch_mode"] == "incremental" and getLastPull(config) is not None:
+                fetch_start = getFetchStart(config, getLastPull(config))
+                old_file = os.path.join(climate_dir, old_files[0])
+            else:
+                fetch_start, old_file = start, None
+            rows = saveClimateDailyStreamed(config["api_url"], fetch_start, today, checkpoint, os.path.join(climate_dir, todayfile), 
+                                            old_file, config["stream_memory_mb"], config["fetch_workers"], config["province"])
+            print("\nPulled " + str(rows) + " readings from " + str(fetch_start) + " onwards.")
+
+            # Remove old master data
+            for file in old_files:
+                os.remove(os.path.join(climate_dir, file))
+            print("\nRaw daily climate data has been updated in folder.")
+        elif todayfile not in old_files:
+            if config["fetch_mode"] == "incremental" and getLastPull(config) is not None:
+                fetch_start = getFetchStart(config, getLastPull(config))
+                master = readClimateCSV(os.path.join(climate_dir, old_files[0]))
+                update = getClimateDailyPaged(config["api_url"], fetch_start, today, checkpoint, max_workers = config["fetch_workers"], province = config["province"])
+                master = mergeClimateDaily(master, update, fetch_start, today)
+                print("\nPulled " + str(len(update)) + " readings from " + str(fetch_start) + " onwards.")
+            else:
+                master = getClimateDailyPaged(config["api_url"], start, today, checkpoint, max_workers = config["fetch_workers"], province = config["province"])
+
+            # Save new master to directory and remove old master data
+            master.to_csv(os.path.join(climate_dir, todayfile), index = False)
+            for file in old_files:
+                os.remove(os.path.join(climate_dir, file))
+            print("\nRaw daily climate data has been updated in folder.")
+        else:
+            print("\nToday's climate data update is already in folder.")
+        return [os.path.join(climate_dir, todayfile)], master
+    else:
+        store = os.path.join(directory, config["climate_store"])
+        updated_file = os.path.join(store, "last_update.txt")
+        last_update = ""
+        if os.path.exists(updated_file):
+            with open(updated_file) as f:
+                last_update = f.read()
+        if last_update != str(today) and not pull:
+            print("\nClimate data not pulled, using climate store last updated on " + (last_update or "---") + ".")
+        elif last_update != str(today):
+            if config["fetch_mode"] == "incremental":
+                fetch_start = getFetchStart(config, getLastPull(config))
+            else:
+                fetch_start = start
+            if config["stream_master"]:
+                for window_start, window_end, update in getClimateWindows(config["api_url"], fetch_start, today, checkpoint, max_workers = config["fetch_workers"], province = config["province"]):
+                    saveClimateStore(convertClimateTypes(update), store, window_start, window_end)
+            else:
+                update = convertClimateTypes(getClimateDailyPaged(config["api_url"], fetch_start, today, checkpoint, max_workers = config["fetch_workers"], province = config["province"]))
+                saveClimateStore(update, store, fetch_start, today)
+            with open(updated_file, "w") as f:
+                f.write(str(today))
+            print("\nRaw daily climate data has been updated in folder.")
+        else:
+            print("\nToday's climate data update is already in folder.")
+        months = pd.period_range(start = load_start, end = today, freq = "M")
+        return [os.path.join(store, str(month.year), str(month) + ".parquet") for month in months], None
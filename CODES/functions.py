@@ -9,74 +9,132 @@ Last updated: ---
 """
 ###############################################################################
 # IMPORT REQUIRED PACKAGES
+import os
+import time
+import json
+import cProfile
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import shapefile as sf
+import shapely
+from shapely import STRtree, points, distance
 from shapely.geometry import Point
-from shapely.geometry.polygon import Polygon
 
 ###############################################################################
-# FUNCTIONS REQUIRED BY transformCoordinates.py
+# FUNCTIONS REQUIRED BY buildGeometryBundle.py
 
-# Define apply transformation function
-def applyTransform(transformation, inputfile, outputfile):
+# Define function to save the boundaries of one province to a compact geometry bundle
+def buildGeometryBundle(inputfile, outputfile, province):
     """
-    Returns shapefile with transformed coordinates projections.
-    
+    Saves the records and boundaries of all shapes of shapefile inputfile in 
+    the given province (or all provinces if province is None) to Parquet file
+    outputfile. Boundaries are stored as WKB polygons or multipolygons with 
+    all parts (e.g. islands and holes) preserved, along with their bounding 
+    boxes (minx, miny, maxx, maxy) and centroids (centroid_x, centroid_y). 
+    Load with loadGeometryBundle.
+
     Parameters
     ----------
-    transformation : pyproj.Transformer.from_proj
-        Function defining type of coordinate transformation to apply to the 
-        shapes of inputfile.
-    inputfile : shapefile
-        Input shapefile whose shape coordinates will be transformed by 
-        transformation.
-    outputfile : shapefile
-        Output shapefile with identical records as inputfile and shape 
-        coordinates that have been transformed by transformation.
+    inputfile : str
+        Path of shapefile with WGS-84 coordinates (without extension).
+    outputfile : str
+        Path of Parquet file.
+    province : str
+        2-digit province code (field PRUID) of shapes to keep, or None to keep
+        all shapes.
 
     Returns
     -------
     None.
 
     """
-    # Read in input data
-    data = sf.Reader("./" + outputfile + "/" + inputfile, encoding="latin1")
-    
-    # Write out required attributes
-    shape_data = data.shapes()
-    nonshape_data = data.records()
-    
-    # Write output data
-    output = sf.Writer("./" + outputfile + "/" + outputfile)
-    
-    # Duplicate fields
-    fields = data.fields
-    for name in fields:
-        if type(name) == "tuple":
-            continue
-        else:
-            args = name
-            output.field(*args)
+    data = sf.Reader(inputfile, encoding="latin1")
+    field_names = [field[0] for field in data.fields if field[0] != "DeletionFlag"]
+    province_pos = field_names.index("PRUID")
+    rows = []
+    geometries = []
+    for shape_record in data.iterShapeRecords():
+        if province is None or shape_record.record[province_pos] == province:
+            rows.append(list(shape_record.record))
+            geometries.append(shapely.geometry.shape(shape_record.shape.__geo_interface__))
+    bundle = pd.DataFrame(rows, columns = field_names)
+    bundle["wkb"] = shapely.to_wkb(geometries)
+    bounds = shapely.bounds(geometries).reshape(-1, 4)
+    for k, name in enumerate(["minx", "miny", "maxx", "maxy"]):
+        bundle[name] = bounds[:, k]
+    centroids = shapely.centroid(geometries)
+    bundle["centroid_x"] = shapely.get_x(centroids)
+    bundle["centroid_y"] = shapely.get_y(centroids)
+    os.makedirs(os.path.dirname(os.path.abspath(outputfile)), exist_ok = True)
+    bundle.to_parquet(outputfile + ".tmp", index = False)
+    os.replace(outputfile + ".tmp", outputfile)
+
+# Define function to save a lookup grid of the subdivisions of a geometry bundle
+def buildSubdivisionGrid(bundlefile, outputfile, cell_size = 0.01):
+    """
+    Saves a lookup grid of the Census subdivisions of geometry bundle 
+    bundlefile (see buildGeometryBundle) to NumPy file outputfile. The 
+    extent of the subdivisions is divided into square cells of cell_size 
+    degrees and each cell stores the position (in the subdivision codes saved
+    as csduid) of the subdivision containing the whole cell, -1 if the cell 
+    is outside all subdivisions or -2 if a subdivision boundary crosses the 
+    cell, in which case points in the cell need an exact test. Load with 
+    loadSubdivisionGrid.
+
+    Parameters
+    ----------
+    bundlefile : str
+        Path of Parquet file of Census subdivisions.
+    outputfile : str
+        Path of NumPy (.npz) file.
+    cell_size : float, optional
+        Width and height of cells in degrees. The default is 0.01.
+
+    Returns
+    -------
+    None.
+
+    """
+    subdivisions = loadGeometryBundle(bundlefile)
+    records = getBoundaryRecords(subdivisions)
+    polygons = subdivisions.geometry.values
+    minx, miny = subdivisions.minx.min(), subdivisions.miny.min()
+    num_cols = int(np.ceil((subdivisions.maxx.max() - minx) / cell_size)) + 1
+    num_rows = int(np.ceil((subdivisions.maxy.max() - miny) / cell_size)) + 1
+    cells = np.full((num_rows, num_cols), -1, dtype = np.int32)
+    tree = STRtree(polygons)
+    boundary_tree = STRtree(shapely.boundary(polygons))
     
-    # Duplicate records
-    for row in nonshape_data:
-        args = row
-        output.record(*args)
-        
-    # Apply transformations to polygons
-    for i in range(0, len(shape_data)):
-        points_list = []
-        for pt in transformation.itransform(data.shape(i).points):
-            points_list.append([pt[0], pt[1]])
-        output.poly([points_list])
-            
-    # Save file
-    output.close()
+    # Label each row of cells by the subdivision containing its centre, then mark the cells crossed by a 
+    # boundary (padded, so points rounded into a neighbouring cell are still tested exactly)
+    pad = cell_size * 1e-6
+    x0 = minx + np.arange(num_cols) * cell_size
+    for row in range(num_rows):
+        y0 = np.full(num_cols, miny + row * cell_size)
+        pt_idx, sd_idx = tree.query(points(x0 + cell_size / 2, y0 + cell_size / 2), predicate = "within")
+        cells[row, pt_idx] = sd_idx
+        boxes = shapely.box(x0 - pad, y0 - pad, x0 + cell_size + pad, y0 + cell_size + pad)
+        box_idx, _ = boundary_tree.query(boxes, predicate = "intersects")
+        cells[row, box_idx] = -2
+    os.makedirs(os.path.dirname(outputfile) or ".", exist_ok = True)
+    np.savez_compressed(outputfile, cells = cells, csduid = np.array([str(record[0]) for record in records]),
+                        origin = np.array([minx, miny]), cell_size = np.array(cell_size))
 
 ###############################################################################
 # FUNCTIONS REQUIRED BY getCDAverages.py
 
+# Data shared by getSDAvgs worker processes (see initSDWorker)
+sd_worker = {}
+
+# Climate variables averaged by default (output column name: climate-daily API column)
+climate_vars = {"avg_temp": "MEAN_TEMPERATURE",
+                "min_temp": "MIN_TEMPERATURE",
+                "max_temp": "MAX_TEMPERATURE",
+                "avg_precip": "TOTAL_PRECIPITATION"}
+
 # Define function to get average with given list
 def getListAvg(num_list):
     """
@@ -97,8 +155,335 @@ def getListAvg(num_list):
     else: 
         return np.nan
 
+# Define function to get the output column names of climate variables
+def getClimateVars(variables = None):
+    """
+    Returns dictionary of output column names to climate-daily API columns of
+    the API columns in variables (or climate_vars if None). Columns of 
+    climate_vars keep their output names and other columns are averaged to 
+    their lower case name (e.g. SNOW_ON_GROUND to snow_on_ground).
+
+    Parameters
+    ----------
+    variables : list of str, optional
+        Climate-daily API columns to average. The default is None.
+
+    Returns
+    -------
+    dictionary, str -> str
+        Output column name of each API column, in the order of variables.
+    """
+    if variables is None:
+        return dict(climate_vars)
+    names = {var: name for name, var in climate_vars.items()}
+    return {names.get(var, var.lower()): var for var in variables}
+
+# Define function to get the readings of climate variables to average
+def getClimateValues(master, var_names, exclude_flags = None):
+    """
+    Returns (readings x variables) float array of the columns var_names of 
+    master, and a boolean array of the same shape flagging the readings 
+    excluded from the averages because their flag column (e.g. 
+    MEAN_TEMPERATURE_FLAG) is one of exclude_flags. Excluded readings are nan
+    in the values array.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily climate readings with numeric types.
+    var_names : list of str
+        Climate-daily API columns to average.
+    exclude_flags : list of str, optional
+        Flags of readings to exclude (e.g. ["E"] for estimated readings), or 
+        None to keep all readings. The default is None.
+
+    Raises
+    ------
+    ValueError
+        If a column of var_names is not in master.
+
+    Returns
+    -------
+    values : array
+        Readings of each variable.
+    excluded : array
+        True for readings excluded from the averages.
+    """
+    missing = [var for var in var_names if var not in master]
+    if len(missing) > 0:
+        raise ValueError("ERROR! Climate variables " + str(missing) + " are not in the daily climate data.")
+    values = master[var_names].to_numpy(dtype = float, copy = True)
+    excluded = np.zeros(values.shape, dtype = bool)
+    if exclude_flags:
+        for k, var in enumerate(var_names):
+            if var + "_FLAG" in master:
+                excluded[:, k] = master[var + "_FLAG"].isin(exclude_flags).to_numpy()
+        values[excluded] = np.nan
+    return values, excluded
+
+# Define function to load Census boundaries from a geometry bundle
+def loadGeometryBundle(bundlefile):
+    """
+    Returns dataframe of Census boundaries saved by buildGeometryBundle, with
+    boundaries as shapely geometries in column geometry. The dataframe can be
+    used in place of a shapefile by all functions that take subdivisions or 
+    divisions (see getBoundaryRecords and getBoundaryPolygons).
+
+    Parameters
+    ----------
+    bundlefile : str
+        Path of Parquet file.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing one row per boundary with shapefile record 
+        fields, geometry, bounding box and centroid columns.
+    """
+    bundle = pd.read_parquet(bundlefile)
+    bundle["geometry"] = shapely.from_wkb(bundle.pop("wkb").values)
+    return bundle
+
+# Define function to get the records of Census boundaries
+def getBoundaryRecords(boundaries):
+    """
+    Returns list of records (lists of field values in shapefile order) of 
+    Census boundaries read from a shapefile or geometry bundle.
+
+    Parameters
+    ----------
+    boundaries : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) of Census 
+        boundaries.
+
+    Returns
+    -------
+    list of lists
+        Records of all boundaries.
+    """
+    if isinstance(boundaries, pd.DataFrame):
+        extra_cols = ["geometry", "minx", "miny", "maxx", "maxy", "centroid_x", "centroid_y"]
+        return boundaries.drop(columns = [c for c in extra_cols if c in boundaries]).values.tolist()
+    else:
+        return boundaries.records()
+
+# Define function to get the polygons of Census boundaries
+def getBoundaryPolygons(boundaries, id_list):
+    """
+    Returns list of polygons of the Census boundaries at indices id_list. 
+    Boundaries keep all their parts (e.g. islands and holes), read from the 
+    shapefile as in buildGeometryBundle, so that shapefiles and geometry 
+    bundles give the same polygons.
+
+    Parameters
+    ----------
+    boundaries : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) of Census 
+        boundaries.
+    id_list : list of ints
+        List containing indices of boundaries.
+
+    Returns
+    -------
+    list of shapely.geometry.polygon.Polygon
+        Polygons (or multipolygons) of boundaries in id_list.
+    """
+    if isinstance(boundaries, pd.DataFrame):
+        return list(boundaries.geometry.values[list(id_list)])
+    else:
+        return [shapely.geometry.shape(boundaries.shape(i).__geo_interface__) for i in id_list]
+
+# Define function to load a subdivisions lookup grid
+def loadSubdivisionGrid(gridfile):
+    """
+    Returns dictionary of the arrays of the subdivisions lookup grid saved by
+    buildSubdivisionGrid (cells, csduid, origin and cell_size).
+    """
+    with np.load(gridfile) as grid:
+        return {key: grid[key] for key in grid.files}
+
+# Define function to look up the cells of a subdivisions lookup grid containing points
+def getGridCells(grid, x, y):
+    """
+    Returns array of the values of the cells of a subdivisions lookup grid
+    (see buildSubdivisionGrid) containing each point: the position in 
+    grid["csduid"] of the subdivision containing the point, -1 if the point
+    is outside all subdivisions (or has no coordinates) or -2 if the point 
+    needs an exact test against the subdivisions boundaries.
+
+    Parameters
+    ----------
+    grid : dictionary, str -> array
+        Subdivisions lookup grid (see loadSubdivisionGrid).
+    x : array
+        Longitudes of points.
+    y : array
+        Latitudes of points.
+
+    Returns
+    -------
+    array of ints
+        Grid value of each point.
+    """
+    cell_size = float(grid["cell_size"])
+    cols = np.floor((np.asarray(x, dtype = float) - grid["origin"][0]) / cell_size)
+    rows = np.floor((np.asarray(y, dtype = float) - grid["origin"][1]) / cell_size)
+    num_rows, num_cols = grid["cells"].shape
+    inside = (cols >= 0) & (cols < num_cols) & (rows >= 0) & (rows < num_rows)
+    values = np.full(len(cols), -1, dtype = np.int32)
+    values[inside] = grid["cells"][rows[inside].astype(np.int64), cols[inside].astype(np.int64)]
+    return values
+
+# Define function to match weather station locations to the Census subdivisions containing them
+def getStationSubdivisions(stations, subdivisions, id_list, grid = None):
+    """
+    Returns dataframe matching each distinct weather station and location to 
+    the Census subdivisions whose boundary polygon contains it. Containment is 
+    tested once per station location using a spatial index (STRtree) of 
+    subdivision polygons instead of once per station reading. If a 
+    subdivisions lookup grid is given, locations in cells inside a single
+    subdivision are matched by array lookup (see getGridCells) and only 
+    locations in cells crossed by a boundary are tested exactly.
+    
+    Parameters
+    ----------
+    stations : dataframe
+        Dataframe containing weather station identifiers (column 
+        CLIMATE_IDENTIFIER), longitudes (column x) and latitudes (column y).
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) containing 
+        Census subdivisions with WGS-84 coordinates.
+    id_list : list of ints
+        List containing indices based on subdivisions of Census subdivisions 
+        to which weather stations can be matched.
+    grid : dictionary, str -> array, optional
+        Lookup grid of the subdivisions (see loadSubdivisionGrid), or None to
+        test all locations exactly. The default is None.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing station identifier (CLIMATE_IDENTIFIER), 
+        longitude (x), latitude (y) and position in id_list (sd_pos) of each 
+        subdivision containing the station. Stations outside all subdivisions
+        are dropped.
+    """
+    locations = stations[["CLIMATE_IDENTIFIER", "x", "y"]].drop_duplicates(ignore_index = True)
+    if grid is not None:
+        records = getBoundaryRecords(subdivisions)
+        positions = {str(records[i][0]): k for k, i in enumerate(id_list)}
+        grid_pos = np.array([positions.get(uid, -1) for uid in grid["csduid"]], dtype = np.int64)
+        cells = getGridCells(grid, locations.x.values, locations.y.values)
+        matches = locations[cells >= 0].reset_index(drop = True)
+        matches["sd_pos"] = grid_pos[cells[cells >= 0]]
+        matches = matches[matches.sd_pos >= 0]
+        if (cells == -2).any():
+            matches = pd.concat([matches, getStationSubdivisions(locations[cells == -2], subdivisions, id_list)])
+        return matches.reset_index(drop = True)
+    polygons = getBoundaryPolygons(subdivisions, id_list)
+    tree = STRtree(polygons)
+    pt_idx, sd_idx = tree.query(points(locations.x.values, locations.y.values), 
+                                predicate = "within")
+    matches = locations.iloc[pt_idx].reset_index(drop = True)
+    matches["sd_pos"] = sd_idx
+    return matches
+
+# Define function to get a hash of the contents of a list of files
+def getFileHash(file_list, extra = ""):
+    """
+    Returns SHA-256 hex digest of the contents of all files in file_list, used
+    to detect when input data such as boundary shapefiles have changed.
+
+    Parameters
+    ----------
+    file_list : list of str
+        Paths of files to hash, in order. Missing files are skipped.
+    extra : str, optional
+        Additional text to include in the hash (e.g. list of subdivisions 
+        used). The default is "".
+
+    Returns
+    -------
+    str
+        Hex digest of file contents and extra.
+    """
+    digest = hashlib.sha256()
+    for path in file_list:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    digest.update(extra.encode("utf-8"))
+    return digest.hexdigest()
+
+# Define function to match weather stations to subdivisions using an on-disk cache
+def getCachedStationSubdivisions(stations, subdivisions, id_list, cache_file, fingerprint, grid = None):
+    """
+    Returns dataframe matching each distinct weather station and location to 
+    the Census subdivisions containing it, as getStationSubdivisions. Matches
+    are read from cache_file and only stations that are new or have moved 
+    since the last run are tested against subdivision boundaries. The cache is
+    rebuilt from scratch if it was created with a different fingerprint.
+
+    Parameters
+    ----------
+    stations : dataframe
+        Dataframe containing weather station identifiers (column 
+        CLIMATE_IDENTIFIER), longitudes (column x) and latitudes (column y).
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) containing 
+        Census subdivisions with WGS-84 coordinates.
+    id_list : list of ints
+        List containing indices based on subdivisions of Census subdivisions 
+        to which weather stations can be matched.
+    cache_file : str
+        Path of CSV file storing station to subdivision matches.
+    fingerprint : str
+        Hash identifying subdivisions and id_list (see getFileHash).
+    grid : dictionary, str -> array, optional
+        Lookup grid of the subdivisions used to match new stations (see 
+        getStationSubdivisions). The default is None.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing station identifier (CLIMATE_IDENTIFIER), 
+        longitude (x), latitude (y) and position in id_list (sd_pos) of each 
+        subdivision containing the station.
+    """
+    records = getBoundaryRecords(subdivisions)
+    cols = ["CLIMATE_IDENTIFIER", "x", "y", "csduid", "fingerprint"]
+    cache = pd.DataFrame(columns = cols)
+    if os.path.exists(cache_file):
+        cache = pd.read_csv(cache_file, dtype = {"CLIMATE_IDENTIFIER": str, "csduid": str, 
+                                                 "fingerprint": str}, 
+                            float_precision = "round_trip")
+        cache = cache[cache.fingerprint == fingerprint]
+    
+    # Geo-test only stations not already in cache
+    locations = stations[["CLIMATE_IDENTIFIER", "x", "y"]].drop_duplicates(ignore_index = True)
+    known = pd.merge(locations, cache[["CLIMATE_IDENTIFIER", "x", "y"]].drop_duplicates(), 
+                     on = ["CLIMATE_IDENTIFIER", "x", "y"], how = "left", indicator = True)
+    new = known.loc[known._merge == "left_only", ["CLIMATE_IDENTIFIER", "x", "y"]]
+    if len(new) > 0:
+        new_matches = getStationSubdivisions(new, subdivisions, id_list, grid = grid)
+        new_matches["csduid"] = [records[id_list[k]][0] for k in new_matches.sd_pos]
+        new_matches = pd.merge(new, new_matches.drop(columns = "sd_pos"), 
+                               on = ["CLIMATE_IDENTIFIER", "x", "y"], how = "left")
+        new_matches["fingerprint"] = fingerprint
+        cache = pd.concat([cache, new_matches[cols]], ignore_index = True)
+        cache.to_csv(cache_file, index = False)
+    
+    # Convert cached subdivision codes to positions in id_list
+    positions = {records[i][0]: k for k, i in enumerate(id_list)}
+    matches = pd.merge(locations, cache, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    matches = matches[matches.csduid.isin(positions.keys())].reset_index(drop = True)
+    matches["sd_pos"] = [positions[uid] for uid in matches.csduid]
+    return matches[["CLIMATE_IDENTIFIER", "x", "y", "sd_pos"]]
+
 # Define function to get a dataframe of average daily climate (temp, precipitation) by Census subdivisions
-def getSDAvgs(master, subdivisions, id_list, start_date, end_date):
+def getSDAvgs(master, subdivisions, id_list, start_date, end_date, engine = "strtree", 
+              matches = None, workers = 1, variables = None, exclude_flags = None):
     """
     Returns dataframe containing daily series of average climate variables by 
     Census subdivisions.
@@ -108,8 +493,9 @@ def getSDAvgs(master, subdivisions, id_list, start_date, end_date):
     master : dataframe
         Dataframe containing daily temperature and precipitation readings from
         all Canadian weather stations from January 1, 2018 onwards.
-    subdivisions : shapefile
-        Shapefile containing Census subdivisions with WGS-84 coordinates.
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) containing 
+        Census subdivisions with WGS-84 coordinates.
     id_list : list of ints
         List containing indices based on subdivisions of Census subdivisions 
         for which to generate averages. 
@@ -117,52 +503,318 @@ def getSDAvgs(master, subdivisions, id_list, start_date, end_date):
         Date to begin averages calculation.
     end_date : datetime
         Date to end averages calculation.
+    engine : str, optional
+        Method used to match weather stations to subdivisions. "strtree" 
+        matches each station location once with getStationSubdivisions and 
+        averages by group; "loop" tests every station reading against every 
+        subdivision polygon on every day. The default is "strtree".
+    variables : list of str, optional
+        Climate-daily API columns to average (see getClimateVars), or None 
+        for the columns of climate_vars. The default is None.
+    exclude_flags : list of str, optional
+        Readings whose flag column (e.g. MEAN_TEMPERATURE_FLAG) is one of 
+        exclude_flags are left out of the averages of that variable (see
+        getClimateValues). The default is None.
+
+    Raises
+    ------
+    ValueError
+        If engine is not one of "strtree" or "loop".
 
     Returns
     -------
     dataframe
-        Panel dataframe containing time series daily average temperature and 
-        precipitation variables by Census subdivision.
-    """
-    records = subdivisions.records()
-    data = []
-    for i in id_list:
-        polygon = Polygon(subdivisions.shape(i).points)
-        for single_date in pd.date_range(start=start_date, end=end_date):
-            sub_master = master[master.LOCAL_DATE == single_date]
-            day_list = []
-            station_id = []
-            avg_temp = []
-            min_temp = []
-            max_temp = []
-            avg_precip = []
-            count = 0
-            for j in range(0, len(sub_master)):
-                point = Point(sub_master.iloc[j, 0], sub_master.iloc[j, 1])
-                if polygon.contains(point):
-                    station_id.append(sub_master.iloc[j, 3])
-                    avg_temp.append(sub_master.iloc[j, 10])
-                    min_temp.append(sub_master.iloc[j, 12])
-                    max_temp.append(sub_master.iloc[j, 14])
-                    avg_precip.append(sub_master.iloc[j, 16])
-                    count += 1
-            for item in [0, 3, 5]:
-                day_list.append(records[i][item])
-            day_list.append(single_date)
-            day_list.append(station_id)
-            for var in [avg_temp, min_temp, max_temp, avg_precip]:
-                day_list.append(getListAvg(var))
-            data.append(day_list)
-    col_names = ["csduid", "puid", "cduid", "date", "wsuid_list", "avg_temp", 
-                 "min_temp", "max_temp", "avg_precip"]     
-    return pd.DataFrame(data, columns = col_names)
+        Panel dataframe containing time series of the daily averages of each
+        climate variable by Census subdivision.
+    """
+    if workers > 1:
+        dates = pd.date_range(start=start_date, end=end_date)
+        sub_master = master[master.LOCAL_DATE.isin(dates)]
+        if engine == "strtree" and matches is None:
+            matches = getStationSubdivisions(sub_master, subdivisions, id_list)
+        blocks = np.array_split(np.arange(len(id_list)), min(len(id_list), workers * 4))
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        if isinstance(subdivisions, pd.DataFrame):
+            source = subdivisions
+        else:
+            source = (os.path.abspath(os.path.splitext(subdivisions.shp.name)[0]), subdivisions.encoding)
+        with ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = initSDWorker, 
+                                 initargs = (source, sub_master, id_list, start_date, end_date, engine, 
+                                             matches, variables, exclude_flags)) as executor:
+            data = list(executor.map(getSDAvgsBlock, [list(block) for block in blocks]))
+        return pd.concat(data, ignore_index = True)
+    
+    records = getBoundaryRecords(subdivisions)
+    var_map = getClimateVars(variables)
+    var_names = list(var_map.values())
+    col_names = ["csduid", "puid", "cduid", "date", "wsuid_list"] + list(var_map)
+    if engine == "strtree":
+        dates = pd.date_range(start=start_date, end=end_date)
+        sub_master = master[master.LOCAL_DATE.isin(dates)]
+        values, excluded = getClimateValues(sub_master, var_names, exclude_flags)
+        sub_master = sub_master[["x", "y", "CLIMATE_IDENTIFIER", "LOCAL_DATE"]].reset_index(drop = True)
+        valid_names = [var + "_valid" for var in var_names]
+        for k, var in enumerate(var_names):
+            sub_master[var] = values[:, k]
+            sub_master[valid_names[k]] = ~excluded[:, k]
+        sub_master["row"] = sub_master.index
+        
+        # Match each station reading to its subdivisions, keeping reading order within each day
+        if matches is None:
+            matches = getStationSubdivisions(sub_master, subdivisions, id_list)
+        matched = pd.merge(sub_master, matches, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+        matched = matched.sort_values(by = ["sd_pos", "LOCAL_DATE", "row"], kind = "stable")
+        
+        # Average all variables at once, adding readings in order with np.add.at so sums match getListAvg
+        # exactly, and returning nan if any station reading that is not excluded is missing (as getListAvg)
+        grouped = matched.groupby(["sd_pos", "LOCAL_DATE"], sort = True)
+        group = grouped.ngroup().to_numpy()
+        group_index = grouped.size().index
+        valid = matched[valid_names].to_numpy(dtype = bool)
+        sums = np.zeros((len(group_index), len(var_names)))
+        counts = np.zeros((len(group_index), len(var_names)))
+        np.add.at(sums, group, np.where(valid, matched[var_names].to_numpy(dtype = float), 0))
+        np.add.at(counts, group, valid)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            avgs = pd.DataFrame(np.where(counts > 0, sums / counts, np.nan), columns = var_names, index = group_index)
+        avgs["wsuid_list"] = grouped.CLIMATE_IDENTIFIER.agg(list)
+        
+        # Expand to every subdivision and date, including those without stations
+        full_index = pd.MultiIndex.from_product([range(len(id_list)), dates], 
+                                                names = ["sd_pos", "LOCAL_DATE"])
+        avgs = avgs.reindex(full_index)
+        df = pd.DataFrame({"csduid": [records[id_list[k]][0] for k in full_index.get_level_values(0)],
+                           "puid": [records[id_list[k]][3] for k in full_index.get_level_values(0)],
+                           "cduid": [records[id_list[k]][5] for k in full_index.get_level_values(0)],
+                           "date": full_index.get_level_values(1),
+                           "wsuid_list": [x if isinstance(x, list) else [] for x in avgs.wsuid_list]})
+        for name, var in zip(col_names[5:], var_names):
+            df[name] = avgs[var].values
+        return df
+    elif engine == "loop":
+        data = []
+        values, excluded = getClimateValues(master, var_names, exclude_flags)
+        local_dates = master.LOCAL_DATE.to_numpy()
+        for i, polygon in zip(id_list, getBoundaryPolygons(subdivisions, id_list)):
+            for single_date in pd.date_range(start=start_date, end=end_date):
+                day_rows = np.flatnonzero(local_dates == single_date.to_datetime64())
+                day_list = []
+                station_id = []
+                var_lists = [[] for var in var_names]
+                for j in day_rows:
+                    point = Point(master.x.iat[j], master.y.iat[j])
+                    if polygon.contains(point):
+                        station_id.append(master.CLIMATE_IDENTIFIER.iat[j])
+                        for k in range(len(var_names)):
+                            if not excluded[j, k]:
+                                var_lists[k].append(values[j, k])
+                for item in [0, 3, 5]:
+                    day_list.append(records[i][item])
+                day_list.append(single_date)
+                day_list.append(station_id)
+                for var_list in var_lists:
+                    day_list.append(getListAvg(var_list))
+                data.append(day_list)
+        return pd.DataFrame(data, columns = col_names)
+    else:
+        raise ValueError("ERROR! Subdivision averages engine must be one of \"strtree\" or \"loop\".")
+
+# Define function to load the data shared by all getSDAvgs worker processes once per process
+def initSDWorker(source, master, id_list, start_date, end_date, engine, matches, variables, exclude_flags):
+    """
+    Stores the arguments of a parallel getSDAvgs call in the worker process. 
+    Source is either a subdivisions geometry bundle or the path and encoding
+    of the subdivisions shapefile, which is opened once.
+
+    Returns
+    -------
+    None.
+    """
+    sd_worker.clear()
+    if isinstance(source, pd.DataFrame):
+        subdivisions = source
+    else:
+        subdivisions = sf.Reader(source[0], encoding = source[1])
+    sd_worker.update({"subdivisions": subdivisions, 
+                      "master": master, "id_list": id_list, "start_date": start_date, 
+                      "end_date": end_date, "engine": engine, "matches": matches, "variables": variables,
+                      "exclude_flags": exclude_flags})
+
+# Define function to get subdivision averages for one block of subdivisions in a worker process
+def getSDAvgsBlock(positions):
+    """
+    Returns getSDAvgs dataframe for the subdivisions at the given positions of 
+    id_list, using the data loaded by initSDWorker.
+
+    Parameters
+    ----------
+    positions : list of ints
+        Contiguous positions in id_list of subdivisions to average.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing time series of the daily averages of each
+        climate variable by Census subdivision.
+    """
+    matches = sd_worker["matches"]
+    if matches is not None:
+        matches = matches[(matches.sd_pos >= positions[0]) & (matches.sd_pos <= positions[-1])].copy()
+        matches["sd_pos"] = matches.sd_pos - positions[0]
+    return getSDAvgs(sd_worker["master"], sd_worker["subdivisions"], 
+                     [sd_worker["id_list"][k] for k in positions], sd_worker["start_date"], 
+                     sd_worker["end_date"], sd_worker["engine"], matches, 
+                     variables = sd_worker["variables"], exclude_flags = sd_worker["exclude_flags"])
+
+# Define function to get compact arrays of average daily climate by Census subdivisions
+def getSDAvgsCompact(master, subdivisions, id_list, start_date, end_date, matches = None, 
+                     dtype = np.float32, variables = None, exclude_flags = None):
+    """
+    Returns the subdivisions averages of getSDAvgs (strtree engine) in a 
+    compact format: one (subdivisions x days) array of the given type per 
+    climate variable, indexed by position in id_list and date, with the 
+    weather stations of each subdivision and day stored once as offsets into 
+    an array of station indices instead of one list per row.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily temperature and precipitation readings.
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle containing Census subdivisions.
+    id_list : list of ints
+        List containing indices based on subdivisions of Census subdivisions 
+        for which to generate averages. 
+    start_date : datetime
+        Date to begin averages calculation.
+    end_date : datetime
+        Date to end averages calculation.
+    matches : dataframe, optional
+        Station to subdivision matches (see getStationSubdivisions), found 
+        with getStationSubdivisions if None. The default is None.
+    dtype : numpy type, optional
+        Type of the averages arrays. The default is np.float32.
+    variables : list of str, optional
+        Climate-daily API columns to average (see getClimateVars), or None 
+        for the columns of climate_vars. The default is None.
+    exclude_flags : list of str, optional
+        Readings whose flag column is one of exclude_flags are left out of 
+        the averages of that variable (see getClimateValues). The default is
+        None.
+
+    Returns
+    -------
+    dictionary, str -> array
+        Arrays of subdivision codes (csduid, puid, cduid), dates (date), 
+        output names of the climate variables (variables), averages of each
+        variable (e.g. avg_temp, indexed by [subdivision, date]), station 
+        identifiers (station_ids) and station membership: the stations of 
+        subdivision k on date t are 
+        station_ids[stations[offsets[c]:offsets[c + 1]]] with 
+        c = k * number of dates + t.
+    """
+    records = getBoundaryRecords(subdivisions)
+    var_map = getClimateVars(variables)
+    dates = pd.date_range(start=start_date, end=end_date)
+    sub_master = master[master.LOCAL_DATE.isin(dates)]
+    values, excluded = getClimateValues(sub_master, list(var_map.values()), exclude_flags)
+    sub_master = sub_master[["x", "y", "CLIMATE_IDENTIFIER", "LOCAL_DATE"]].reset_index(drop = True)
+    sub_master["row"] = sub_master.index
+    if matches is None:
+        matches = getStationSubdivisions(sub_master, subdivisions, id_list)
+    
+    # Code each matched reading by subdivision and date cell, keeping reading order within each cell
+    matched = pd.merge(sub_master, matches, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    matched["cell"] = matched.sd_pos.to_numpy() * len(dates) + dates.get_indexer(matched.LOCAL_DATE)
+    matched = matched.sort_values(by = ["cell", "row"], kind = "stable")
+    cell = matched.cell.to_numpy()
+    values, excluded = values[matched.row.to_numpy()], excluded[matched.row.to_numpy()]
+    num_cells = len(id_list) * len(dates)
+    station_ids, stations = np.unique(matched.CLIMATE_IDENTIFIER.to_numpy(dtype = str), return_inverse = True)
+    compact = {"csduid": np.array([int(records[i][0]) for i in id_list]),
+               "puid": np.array([int(records[i][3]) for i in id_list]),
+               "cduid": np.array([int(records[i][5]) for i in id_list]),
+               "date": dates.values,
+               "variables": np.array(list(var_map)),
+               "station_ids": station_ids,
+               "stations": stations.astype(np.int32),
+               "offsets": np.concatenate([[0], np.cumsum(np.bincount(cell, minlength = num_cells))])}
+    
+    # Average each variable, adding readings in order (nan if any station reading that is not excluded is
+    # missing, as getListAvg)
+    counts = np.bincount(cell, minlength = num_cells)
+    for k, name in enumerate(var_map):
+        var_counts = counts
+        if excluded[:, k].any():
+            var_counts = np.bincount(cell, weights = ~excluded[:, k], minlength = num_cells)
+        sums = np.zeros(num_cells)
+        np.add.at(sums, cell, np.where(excluded[:, k], 0, values[:, k]))
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            avgs = np.where(var_counts > 0, sums / var_counts, np.nan)
+        compact[name] = avgs.astype(dtype).reshape(len(id_list), len(dates))
+    return compact
+
+# Define function to expand compact subdivisions averages to the getSDAvgs dataframe
+def getSDAvgsFrame(compact):
+    """
+    Returns the getSDAvgs panel dataframe of compact subdivisions averages 
+    (see getSDAvgsCompact), with integer subdivision and division codes.
+    """
+    col_names = list(compact["variables"])
+    num_sds, num_dates = compact[col_names[0]].shape
+    stations = compact["station_ids"][compact["stations"]].tolist()
+    offsets = compact["offsets"]
+    df = pd.DataFrame({"csduid": np.repeat(compact["csduid"], num_dates),
+                       "puid": np.repeat(compact["puid"], num_dates),
+                       "cduid": np.repeat(compact["cduid"], num_dates),
+                       "date": np.tile(compact["date"], num_sds),
+                       "wsuid_list": [stations[offsets[c]:offsets[c + 1]] for c in range(num_sds * num_dates)]})
+    for name in col_names:
+        df[name] = compact[name].ravel().astype(float)
+    return df
+
+# Define function to get population weighted average daily climate by Census divisions from compact subdivisions averages
+def getCDAvgsCompact(compact, pop):
+    """
+    Returns the getCDAvgs dataframe of compact subdivisions averages (see 
+    getSDAvgsCompact) merged with subdivisions population estimates pop 
+    (columns cduid, csduid and pop), without expanding them to a dataframe.
+    """
+    col_names = ["cduid", "date"] + list(compact["variables"])
+    sd_pop = pop.groupby(["cduid", "csduid"], sort = False)["pop"].sum()
+    uids = pd.MultiIndex.from_arrays([compact["cduid"], compact["csduid"]])
+    in_pop = uids.isin(sd_pop.index)
+    cduid_list = list(dict.fromkeys(compact["cduid"][in_pop].tolist()))
+    group = pd.Index(cduid_list).get_indexer(compact["cduid"][in_pop])
+    weights = sd_pop.reindex(uids[in_pop]).to_numpy(dtype = float)[:, None]
+    num_dates = len(compact["date"])
+    
+    # Accumulate in subdivision order with np.add.at, as getCDAvgs
+    avgs = {}
+    for name in col_names[2:]:
+        values = compact[name][in_pop].astype(float)
+        valid = ~np.isnan(values)
+        wt_sum = np.zeros((len(cduid_list), num_dates))
+        pop_sum = np.zeros((len(cduid_list), num_dates))
+        np.add.at(wt_sum, group, np.where(valid, values * weights, 0))
+        np.add.at(pop_sum, group, np.where(valid, weights, 0))
+        has_data = np.zeros((len(cduid_list), num_dates), dtype = bool)
+        np.logical_or.at(has_data, group, valid)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            avgs[name] = np.where(has_data, wt_sum / pop_sum, np.nan).ravel()
+    full_index = pd.MultiIndex.from_product([cduid_list, pd.DatetimeIndex(compact["date"])], 
+                                            names = ["cduid", "date"])
+    return pd.DataFrame(avgs, index = full_index)[col_names[2:]].reset_index()
 
 # Define function to get weighted mean of all non-null values
 def getWtAvg(df, col):
     """
     Gets weighted mean of all non-null values of given the variable in column 
     col in dataframe df. Weighting is done using Census subdivision population 
-    estimates (column 10 of df).
+    estimates (column pop of df).
 
     Parameters
     ----------
@@ -181,10 +833,11 @@ def getWtAvg(df, col):
     wt_sum = 0
     pop = 0
     count_empty = 0
+    pop_col = df.columns.get_loc("pop")
     for i in range(0, len(df)):
         if str(df.iloc[i, col]) != "nan":
-            wt_sum += df.iloc[i, col] * df.iloc[i, 10]
-            pop += df.iloc[i, 10]
+            wt_sum += df.iloc[i, col] * df.iloc[i, pop_col]
+            pop += df.iloc[i, pop_col]
         else:
             count_empty += 1
     if count_empty == len(df):
@@ -192,6 +845,231 @@ def getWtAvg(df, col):
     else:
         return wt_sum / pop
     
+# Define function to get a dataframe of population weighted average daily climate by Census divisions
+def getCDAvgs(df_pop, start_date, end_date, engine = "groupby", variables = None):
+    """
+    Returns dataframe containing daily series of climate variables by Census
+    divisions, as the population weighted mean of all non-null subdivision 
+    averages in each division (see getWtAvg).
+
+    Parameters
+    ----------
+    df_pop : dataframe
+        Dataframe containing subdivision climate averages (see getSDAvgs) 
+        merged with subdivision population estimates (column pop).
+    start_date : datetime
+        Date to begin averages calculation.
+    end_date : datetime
+        Date to end averages calculation.
+    engine : str, optional
+        Method used to calculate weighted means. "groupby" calculates all 
+        divisions, dates and variables in a single grouped operation; "loop" 
+        calls getWtAvg for each division, date and variable. The default is 
+        "groupby".
+    variables : list of str, optional
+        Climate-daily API columns averaged in df_pop (see getClimateVars), or
+        None for the columns of climate_vars. The default is None.
+
+    Raises
+    ------
+    ValueError
+        If engine is not one of "groupby" or "loop".
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing time series of the daily weighted averages
+        of each climate variable by Census division, ordered by division (in 
+        order of first appearance in df_pop) and date.
+    """
+    col_names = ["cduid", "date"] + list(getClimateVars(variables))
+    cduid_list = list(dict.fromkeys(list(df_pop.cduid)))
+    dates = pd.date_range(start=start_date, end=end_date)
+    if engine == "groupby":
+        full_index = pd.MultiIndex.from_product([cduid_list, dates], names = ["cduid", "date"])
+        group = full_index.get_indexer(pd.MultiIndex.from_arrays([df_pop.cduid, df_pop.date]))
+        in_range = group >= 0
+        values = df_pop[col_names[2:]].to_numpy(dtype = float)[in_range]
+        pop = df_pop["pop"].to_numpy(dtype = float)[in_range, None]
+        valid = ~np.isnan(values)
+        
+        # Accumulate in row order with np.add.at so sums match getWtAvg exactly
+        wt_sum = np.zeros((len(full_index), values.shape[1]))
+        pop_sum = np.zeros((len(full_index), values.shape[1]))
+        np.add.at(wt_sum, group[in_range], np.where(valid, values * pop, 0))
+        np.add.at(pop_sum, group[in_range], np.where(valid, pop, 0))
+        has_data = np.zeros((len(full_index), values.shape[1]), dtype = bool)
+        np.logical_or.at(has_data, group[in_range], valid)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            avgs = np.where(has_data, wt_sum / pop_sum, np.nan)
+        df_cd = pd.DataFrame(avgs, columns = col_names[2:], index = full_index).reset_index()
+        return df_cd
+    elif engine == "loop":
+        data = []
+        for uid in cduid_list:
+            sub_df = df_pop[df_pop.cduid == uid]
+            for single_date in dates:
+                sub_df_date = sub_df[sub_df.date == single_date]
+                if len(sub_df_date) != 0:
+                    data.append([uid, single_date] + [getWtAvg(sub_df_date, df_pop.columns.get_loc(name)) 
+                                                      for name in col_names[2:]])
+                else:
+                    data.append([uid, single_date] + [np.nan] * len(col_names[2:]))
+        return pd.DataFrame(data, columns = col_names)
+    else:
+        raise ValueError("ERROR! Divisions averages engine must be one of \"groupby\" or \"loop\".")
+    
+# Define function to get population weighted average daily climate by Census divisions directly from station readings
+def getCDAvgsSparse(master, subdivisions, id_list, pop, start_date, end_date, matches = None, 
+                    variables = None, exclude_flags = None):
+    """
+    Returns the same dataframe as getCDAvgs applied to the output of 
+    getSDAvgs merged with pop, without building the subdivision panel. The 
+    station to subdivision membership and the subdivision to division 
+    population weights are built once as sparse matrices, and all days are
+    averaged with sparse products of (days x stations) observation matrices:
+    subdivision means are station sums divided by station counts (missing if 
+    any station reading is missing, as getListAvg) and division means are sums
+    of population weighted subdivision means divided by the population of 
+    subdivisions with a mean on that day. Requires scipy.
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily temperature and precipitation readings.
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle containing Census subdivisions.
+    id_list : list of ints
+        List containing indices based on subdivisions of Census subdivisions 
+        to average.
+    pop : dataframe
+        Subdivisions population estimates (columns cduid, csduid and pop).
+    start_date : datetime
+        Date to begin averages calculation.
+    end_date : datetime
+        Date to end averages calculation.
+    matches : dataframe, optional
+        Station to subdivision matches (see getStationSubdivisions), found 
+        with getStationSubdivisions if None. The default is None.
+    variables : list of str, optional
+        Climate-daily API columns to average (see getClimateVars), or None 
+        for the columns of climate_vars. The default is None.
+    exclude_flags : list of str, optional
+        Readings whose flag column is one of exclude_flags are left out of 
+        the averages of that variable (see getClimateValues). The default is
+        None.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing time series of the daily weighted averages
+        of each climate variable by Census division, ordered by division and 
+        date as getCDAvgs.
+    """
+    from scipy import sparse
+    records = getBoundaryRecords(subdivisions)
+    var_map = getClimateVars(variables)
+    col_names = ["cduid", "date"] + list(var_map)
+    dates = pd.date_range(start=start_date, end=end_date)
+    sub_master = master[master.LOCAL_DATE.isin(dates)]
+    values, excluded = getClimateValues(sub_master, list(var_map.values()), exclude_flags)
+    if matches is None:
+        matches = getStationSubdivisions(sub_master, subdivisions, id_list)
+    
+    # Index stations (by identifier and location) in reading order, so that sparse products add up 
+    # readings and subdivisions in the same order as getListAvg and getWtAvg
+    stations = sub_master[["CLIMATE_IDENTIFIER", "x", "y"]].drop_duplicates(ignore_index = True)
+    stations = pd.merge(stations, matches[["CLIMATE_IDENTIFIER", "x", "y"]].drop_duplicates(), 
+                        on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    stations["station"] = stations.index
+    readings = sub_master[["CLIMATE_IDENTIFIER", "x", "y", "LOCAL_DATE"]].assign(row = np.arange(len(sub_master)))
+    readings = pd.merge(readings, stations, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    values, excluded = values[readings.row.to_numpy()], excluded[readings.row.to_numpy()]
+    day = dates.get_indexer(readings.LOCAL_DATE)
+    station = readings.station.to_numpy()
+    shape = (len(dates), len(stations))
+    
+    # Build station to subdivision membership and subdivision to division population weights once
+    station_pos = pd.merge(matches, stations, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    membership = sparse.csr_matrix((np.ones(len(station_pos)), (station_pos.station, station_pos.sd_pos)),
+                                   shape = (len(stations), len(id_list)))
+    sd_pop = pop.groupby(["cduid", "csduid"], sort = False)["pop"].sum()
+    sd_pos, cd_pos, weights = [], [], []
+    cduid_list = []
+    for k, i in enumerate(id_list):
+        uids = (int(records[i][5]), int(records[i][0]))
+        if uids in sd_pop.index:
+            if uids[0] not in cduid_list:
+                cduid_list.append(uids[0])
+            sd_pos.append(k)
+            cd_pos.append(cduid_list.index(uids[0]))
+            weights.append(float(sd_pop[uids]))
+    sd_weights = sparse.csr_matrix((weights, (sd_pos, cd_pos)), shape = (len(id_list), len(cduid_list)))
+    sd_in_cd = sparse.csr_matrix((np.ones(len(sd_pos)), (sd_pos, cd_pos)), shape = sd_weights.shape)
+    
+    # Average each variable over all days with sparse products (station counts are only recounted for 
+    # variables with excluded readings)
+    counts = sparse.csr_matrix((np.ones(len(day)), (day, station)), shape = shape) @ membership
+    counts.sort_indices()
+    all_rows, all_cols = counts.nonzero()
+    all_n = np.asarray(counts[all_rows, all_cols]).ravel()
+    avgs = {}
+    for k, name in enumerate(col_names[2:]):
+        rows, cols, n = all_rows, all_cols, all_n
+        if excluded[:, k].any():
+            counts = sparse.csr_matrix(((~excluded[:, k]).astype(float), (day, station)), shape = shape) @ membership
+            counts.sort_indices()
+            counts.eliminate_zeros()
+            rows, cols = counts.nonzero()
+            n = np.asarray(counts[rows, cols]).ravel()
+        missing = np.isnan(values[:, k]) & ~excluded[:, k]
+        sums = sparse.csr_matrix((np.where(np.isnan(values[:, k]), 0, values[:, k]), (day, station)), 
+                                 shape = shape) @ membership
+        num_missing = sparse.csr_matrix((missing.astype(float), (day, station)), shape = shape) @ membership
+        sums.sort_indices()
+        num_missing.sort_indices()
+        ok = np.asarray(num_missing[rows, cols]).ravel() == 0
+        means = sparse.csr_matrix((np.asarray(sums[rows, cols]).ravel()[ok] / n[ok], (rows[ok], cols[ok])), 
+                                  shape = counts.shape)
+        has_mean = sparse.csr_matrix((np.ones(ok.sum()), (rows[ok], cols[ok])), shape = counts.shape)
+        wt_sum = (means @ sd_weights).toarray()
+        pop_sum = (has_mean @ sd_weights).toarray()
+        has_data = (has_mean @ sd_in_cd).toarray() > 0
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            avgs[name] = np.where(has_data, wt_sum / pop_sum, np.nan).T.ravel()
+    full_index = pd.MultiIndex.from_product([cduid_list, dates], names = ["cduid", "date"])
+    return pd.DataFrame(avgs, index = full_index)[col_names[2:]].reset_index()
+
+# Define function to drop dates with too few Census divisions with observations
+def dropSparseDates(df_cd, num_divisions, num_closest, col = "avg_temp"):
+    """
+    Returns df_cd without the dates on which more than num_divisions - 
+    num_closest divisions have no average of col (average temperature by 
+    default), i.e. dates on which there are too few divisions with 
+    observations to fill the others with the average of the num_closest 
+    closest divisions.
+
+    Parameters
+    ----------
+    df_cd : dataframe
+        Panel dataframe of Census division averages (see getCDAvgs).
+    num_divisions : int
+        Number of Census divisions.
+    num_closest : int
+        Number of closest divisions averaged to fill divisions without 
+        observations.
+    col : str, optional
+        Climate variable whose averages are counted. The default is 
+        "avg_temp".
+
+    Returns
+    -------
+    dataframe
+        df_cd without sparse dates.
+    """
+    null_count = df_cd[col].isnull().groupby(df_cd.date).sum()
+    return df_cd[df_cd.date.isin(null_count[null_count <= num_divisions - num_closest].index)]
+
 # Define function to get a given number of closest divisions to a given division
 def closestDivisions(polygon_dict, point_dict, num_closest):
         """
@@ -242,6 +1120,194 @@ def closestDivisions(polygon_dict, point_dict, num_closest):
         else:
             raise ValueError("ERROR! There are fewer Census divisions than the number of closest divisions you're looking for.")
 
+# Define function to rank all Census divisions by distance to each division
+def getDivisionNeighbours(divisions, cduid_list):
+    """
+    Returns a dictionary that contains, for each Census division in 
+    cduid_list, a list of all other divisions in cduid_list ranked from 
+    closest to farthest. Distances are measured from the division boundary 
+    polygon to the centroid of the other division's polygon (as in 
+    closestDivisions) and are calculated once as a full distance matrix. Ties
+    are ranked in shapefile record order.
+
+    Parameters
+    ----------
+    divisions : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) containing 
+        Census divisions with WGS-84 coordinates.
+    cduid_list : list of ints
+        List of Census division codes to rank.
+
+    Returns
+    -------
+    neighbours : dictionary, int -> list of ints
+        Dictionary of Census division codes and a list of all other division 
+        codes ordered by distance.
+
+    """
+    records = getBoundaryRecords(divisions)
+    id_list = [i for i in range(0, len(records)) if int(records[i][0]) in cduid_list]
+    polygons = {}
+    for i, polygon in zip(id_list, getBoundaryPolygons(divisions, id_list)):
+        polygons[int(records[i][0])] = polygon
+    uids = list(polygons.keys())
+    centroids = [polygons[uid].centroid for uid in uids]
+    distances = distance(np.array(list(polygons.values()))[:, None], np.array(centroids)[None, :])
+    neighbours = {}
+    for k, uid in enumerate(uids):
+        ranked = np.argsort(distances[k], kind = "stable")
+        neighbours[uid] = [uids[r] for r in ranked if r != k]
+    return neighbours
+
+# Define function to get a given number of closest divisions with data from a ranked list
+def closestAvailable(ranked, available, num_closest):
+    """
+    Returns the first num_closest Census divisions in ranked that are in 
+    available.
+
+    Parameters
+    ----------
+    ranked : list of ints
+        List of Census division codes ordered by distance to a given division
+        (see getDivisionNeighbours).
+    available : set of ints
+        Set of Census division codes with data on a given day.
+    num_closest : int
+        Number of divisions to return.
+
+    Raises
+    ------
+    ValueError
+        If num_closest is greater than the number of possible Census 
+        divisions to search through in available (as closestDivisions).
+
+    Returns
+    -------
+    list of ints
+        List of division codes of the num_closest closest available divisions.
+
+    """
+    candidates = [uid for uid in ranked if uid in available]
+    if num_closest < len(candidates) - 1:
+        return candidates[:num_closest]
+    else:
+        raise ValueError("ERROR! There are fewer Census divisions than the number of closest divisions you're looking for.")
+
+# Define function to fill missing division climate variables with the average of the closest divisions
+def fillDivisions(df_cd, neighbours, num_closest, engine = "array"):
+    """
+    Returns dataframe df_cd where every missing climate variable value is 
+    replaced by the mean of that variable over the num_closest closest Census
+    divisions with a non-missing value on the same day. Only originally 
+    non-missing values are used to fill missing values.
+
+    Parameters
+    ----------
+    df_cd : dataframe
+        Panel dataframe containing daily climate variables (columns 2 
+        onwards) by Census division (column cduid) and date (column date).
+    neighbours : dictionary, int -> list of ints
+        Dictionary of Census division codes and a list of all other division 
+        codes ordered by distance (see getDivisionNeighbours).
+    num_closest : int
+        Number of closest divisions to average.
+    engine : str, optional
+        Method used to fill missing values. "array" fills all variables in a 
+        single pass over a (division x date x variable) array; "loop" fills 
+        one variable and missing value at a time. The default is "array".
+
+    Raises
+    ------
+    ValueError
+        If num_closest is greater than the number of possible Census 
+        divisions with data on a day with missing values, or if engine is not
+        one of "array" or "loop".
+
+    Returns
+    -------
+    dataframe
+        Dataframe df_cd with missing values filled in.
+
+    """
+    col_names = list(df_cd.columns)
+    if engine == "array":
+        df_cd = df_cd.reset_index(drop = True)
+        if len(df_cd) == 0:
+            return df_cd
+        cd_codes, cd_uids = pd.factorize(df_cd.cduid)
+        date_codes, _ = pd.factorize(df_cd.date)
+        num_cds, num_dates, num_vars = len(cd_uids), date_codes.max() + 1, len(col_names) - 2
+        
+        # Arrange values and missing cells as (division x date x variable) arrays
+        values = np.full((num_cds, num_dates, num_vars), np.nan)
+        values[cd_codes, date_codes] = df_cd.iloc[:, 2:].to_numpy(dtype = float)
+        missing = np.isnan(values)
+        present = np.zeros((num_cds, num_dates), dtype = bool)
+        present[cd_codes, date_codes] = True
+        available = present[:, :, None] & ~missing
+        
+        # Track the row order the "loop" engine would have when filling each variable (rows filled in 
+        # earlier variables are moved to the end, grouped by division) so sums are accumulated in the 
+        # same order
+        order_keys = np.zeros((num_cds, num_dates, num_vars), dtype = np.int64)
+        order = np.arange(len(df_cd))
+        for v in range(num_vars):
+            order_keys[cd_codes[order], date_codes[order], v] = np.arange(len(order))
+            null = missing[cd_codes[order], date_codes[order], v]
+            moved = order[null]
+            moved = moved[np.argsort(pd.factorize(cd_codes[moved])[0], kind = "stable")]
+            order = np.concatenate([order[~null], moved])
+        
+        filled = values.copy()
+        position = {uid: k for k, uid in enumerate(cd_uids)}
+        for k, uid in enumerate(cd_uids):
+            to_fill = missing[k] & present[k][:, None]
+            if not to_fill.any():
+                continue
+            ranked = np.array([position[r] for r in neighbours[uid] if r in position], dtype = np.int64)
+            for v in range(num_vars):
+                fill_dates = np.flatnonzero(to_fill[:, v])
+                if len(fill_dates) == 0:
+                    continue
+                donors = available[ranked][:, fill_dates, v]
+                if (donors.sum(axis = 0) - 1 <= num_closest).any():
+                    raise ValueError("ERROR! There are fewer Census divisions than the number of closest divisions you're looking for.")
+                chosen = donors & (np.cumsum(donors, axis = 0) <= num_closest)
+                _, rank_idx = np.nonzero(chosen.T)
+                donor_cds = ranked[rank_idx].reshape(len(fill_dates), num_closest)
+                donor_dates = np.repeat(fill_dates, num_closest).reshape(len(fill_dates), num_closest)
+                sort = np.argsort(order_keys[donor_cds, donor_dates, v], axis = 1, kind = "stable")
+                donor_values = np.take_along_axis(values[donor_cds, donor_dates, v], sort, axis = 1)
+                tot_sum = np.zeros(len(fill_dates))
+                for c in range(num_closest):
+                    tot_sum = tot_sum + donor_values[:, c]
+                filled[k, fill_dates, v] = tot_sum / num_closest
+        
+        df_filled = df_cd.copy()
+        df_filled.iloc[:, 2:] = filled[cd_codes, date_codes]
+        return df_filled
+    elif engine == "loop":
+        for v in range(2, len(col_names)):
+            data = []
+            fill = dict()
+            sub_df_cd = df_cd
+            for j in df_cd.index:
+                if str(df_cd.loc[j].iloc[v]) == "nan":
+                    fill[(df_cd.loc[j].cduid, df_cd.loc[j].date)] = list(df_cd.loc[j].values)
+                    sub_df_cd = sub_df_cd.drop(j)        
+            for uid in list(dict.fromkeys(list(key[0] for key in fill.keys()))):
+                for single_date in list(key[1] for key in fill.keys() if key[0] == uid):
+                    sub_data = fill[(uid, single_date)]
+                    sub_df = sub_df_cd[sub_df_cd.date == single_date]
+                    closest = closestAvailable(neighbours[uid], set(sub_df.cduid), num_closest)
+                    sub_df_date = sub_df[sub_df.cduid.isin(closest)]
+                    sub_data[v] = getAvg(sub_df_date, v)
+                    data.append(sub_data)
+            df_cd = pd.concat([sub_df_cd, pd.DataFrame(data, columns = col_names)], ignore_index = True)
+        return df_cd
+    else:
+        raise ValueError("ERROR! Gap filling engine must be one of \"array\" or \"loop\".")
+
 # Define function to get unweighted mean of all non-null values
 def getAvg(df, col):
         """
@@ -274,4 +1340,394 @@ def getAvg(df, col):
         if count_empty == len(df):
             return np.nan
         else:
-            return tot_sum / count   
\ No newline at end of file
+            return tot_sum / count
+
+###############################################################################
+# FUNCTIONS REQUIRED BY pipeline.py
+
+# Define function to get a hash of the contents of a dataframe
+def getFrameHash(df):
+    """
+    Returns SHA-256 hex digest of the column names, types and values of df, 
+    used to detect when the output of a pipeline stage has changed. Object 
+    columns (e.g. lists of weather stations) are hashed as strings.
+
+    Parameters
+    ----------
+    df : dataframe or dictionary, str -> array
+        Dataframe or dictionary of arrays (e.g. see getSDAvgsCompact) to hash.
+
+    Returns
+    -------
+    str
+        Hex digest of df.
+    """
+    if isinstance(df, dict):
+        digest = hashlib.sha256()
+        for key in sorted(df):
+            values = np.ascontiguousarray(df[key])
+            digest.update((key + str(values.dtype) + str(values.shape)).encode("utf-8"))
+            digest.update(values.tobytes())
+        return digest.hexdigest()
+    digest = hashlib.sha256(str(list(df.dtypes.items())).encode("utf-8"))
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            values = values.astype(str)
+        digest.update(pd.util.hash_pandas_object(values, index = False).values.tobytes())
+    return digest.hexdigest()
+
+# Define function to load the cached output of a pipeline stage
+def loadStageCache(cache_dir, stage, key):
+    """
+    Returns the output of stage and its hash (see getFrameHash) saved by 
+    saveStageCache under key, or None if there is no output cached under key.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the stage cache.
+    stage : str
+        Name of the stage.
+    key : str
+        Hash of the inputs of the stage.
+
+    Returns
+    -------
+    tuple (dataframe, str)
+        Cached output and output hash, or None.
+    """
+    path = os.path.join(cache_dir, stage + "_" + key + ".pkl")
+    if not os.path.exists(path):
+        return None
+    cached = pd.read_pickle(path)
+    return cached["output"], cached["hash"]
+
+# Define function to save the output of a pipeline stage to the cache
+def saveStageCache(cache_dir, stage, key, output, output_hash):
+    """
+    Saves the output of stage and its hash to cache_dir under key, replacing
+    any output of stage cached under another key. The file is written to a 
+    temporary file first and then moved into place.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the stage cache.
+    stage : str
+        Name of the stage.
+    key : str
+        Hash of the inputs of the stage.
+    output : dataframe
+        Output of the stage.
+    output_hash : str
+        Hash of output (see getFrameHash).
+
+    Returns
+    -------
+    None.
+    """
+    os.makedirs(cache_dir, exist_ok = True)
+    path = os.path.join(cache_dir, stage + "_" + key + ".pkl")
+    pd.to_pickle({"output": output, "hash": output_hash}, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    for file in os.listdir(cache_dir):
+        if file.startswith(stage + "_") and file.endswith(".pkl") and file != os.path.basename(path):
+            os.remove(os.path.join(cache_dir, file))
+
+###############################################################################
+# FUNCTIONS REQUIRED FOR CHANGE DETECTION OF pipeline.py
+
+# Define function to get a hash of each daily climate reading
+def getReadingHashes(master):
+    """
+    Returns dataframe of the weather station (CLIMATE_IDENTIFIER), date 
+    (LOCAL_DATE), location (x, y) and a 64-bit hash of all columns (hash) of
+    each daily climate reading, used to detect readings added, revised or 
+    removed since the last pull (see getChangedReadings).
+
+    Parameters
+    ----------
+    master : dataframe
+        Dataframe containing daily climate readings, unique by 
+        CLIMATE_IDENTIFIER and LOCAL_DATE.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing one row per reading of master.
+    """
+    hashes = master[["CLIMATE_IDENTIFIER", "LOCAL_DATE", "x", "y"]].reset_index(drop = True)
+    hashes["hash"] = pd.util.hash_pandas_object(master, index = False).values
+    return hashes
+
+# Define function to get the daily climate readings that changed since the last pull
+def getChangedReadings(hashes, old_hashes, start_date, end_date):
+    """
+    Returns dataframe of the weather station, date and location of the 
+    readings between start_date and end_date that were added, revised or 
+    removed between old_hashes and hashes (see getReadingHashes). Revised
+    readings of a station that has moved are returned at both locations.
+
+    Parameters
+    ----------
+    hashes : dataframe
+        Hashes of the readings of the current pull.
+    old_hashes : dataframe
+        Hashes of the readings of the last pull.
+    start_date : datetime
+        First date compared.
+    end_date : datetime
+        Last date compared.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing station identifier (CLIMATE_IDENTIFIER), date
+        (LOCAL_DATE), longitude (x) and latitude (y) of changed readings.
+    """
+    cols = ["CLIMATE_IDENTIFIER", "LOCAL_DATE", "x", "y"]
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    hashes = hashes[(hashes.LOCAL_DATE >= start_date) & (hashes.LOCAL_DATE <= end_date)]
+    old_hashes = old_hashes[(old_hashes.LOCAL_DATE >= start_date) & (old_hashes.LOCAL_DATE <= end_date)]
+    
+    # Compare hashes as nullable integers, so readings missing from one pull are not converted to floats
+    merged = pd.merge(hashes.astype({"hash": "UInt64"}), old_hashes.astype({"hash": "UInt64"}), 
+                      on = cols[:2], how = "outer", suffixes = ("", "_old"), indicator = True)
+    changed = merged[(merged._merge != "both") | (merged.hash != merged.hash_old)]
+    old_locations = changed[cols[:2] + ["x_old", "y_old"]].rename(columns = {"x_old": "x", "y_old": "y"})
+    changed = pd.concat([changed[cols], old_locations], ignore_index = True)
+    return changed.dropna(subset = ["x", "y"]).drop_duplicates(ignore_index = True)
+
+# Define function to get the subdivisions and dates whose averages depend on changed readings
+def getChangedSubdivisionDays(changed, matches, subdivisions, id_list):
+    """
+    Returns dataframe of the Census subdivisions (csduid), their divisions 
+    (cduid) and the dates (date) of the averages that depend on the changed
+    readings (see getChangedReadings), i.e. the subdivisions containing the
+    station of each changed reading on the date of the reading.
+
+    Parameters
+    ----------
+    changed : dataframe
+        Dataframe containing station identifier (CLIMATE_IDENTIFIER), date 
+        (LOCAL_DATE), longitude (x) and latitude (y) of changed readings.
+    matches : dataframe
+        Station to subdivision matches (see getStationSubdivisions).
+    subdivisions : shapefile or dataframe
+        Shapefile or geometry bundle (see loadGeometryBundle) containing 
+        Census subdivisions.
+    id_list : list of ints
+        List containing indices based on subdivisions of the Census 
+        subdivisions of matches.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing one row per changed subdivision and date, with
+        integer subdivision and division codes.
+    """
+    records = getBoundaryRecords(subdivisions)
+    matched = pd.merge(changed, matches, on = ["CLIMATE_IDENTIFIER", "x", "y"])
+    cells = pd.DataFrame({"csduid": [int(records[id_list[k]][0]) for k in matched.sd_pos],
+                          "cduid": [int(records[id_list[k]][5]) for k in matched.sd_pos],
+                          "date": matched.LOCAL_DATE.values})
+    return cells.drop_duplicates(ignore_index = True)
+
+# Define function to get the divisions whose filled climate variables depend on changed divisions
+def getFillDependents(df_old, df_new, changed, neighbours, num_closest):
+    """
+    Returns dataframe of the Census divisions and dates whose missing climate
+    variables are filled (see fillDivisions) with the average of at least one
+    changed division, before or after the change. A missing variable is 
+    filled with the num_closest closest divisions with data, so it depends on 
+    a changed division if the division is ranked before (or is) the 
+    num_closest-th closest division with data on that day.
+
+    Parameters
+    ----------
+    df_old : dataframe
+        Panel dataframe of Census division averages before gap filling (see
+        getCDAvgs) of the dates of changed, before the change.
+    df_new : dataframe
+        Panel dataframe of Census division averages before gap filling of the
+        dates of changed, after the change.
+    changed : dataframe
+        Dataframe containing the division (cduid) and date (date) of the 
+        changed division averages.
+    neighbours : dictionary, int -> list of ints
+        Dictionary of Census division codes and a list of all other division 
+        codes ordered by distance (see getDivisionNeighbours).
+    num_closest : int
+        Number of closest divisions averaged.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing the division (cduid) and date (date) of the 
+        dependent division averages, which may include changed divisions.
+    """
+    cduid_list = list(neighbours)
+    dates = pd.DatetimeIndex(sorted(set(changed.date)))
+    col_names = list(df_new.columns[2:])
+    full_index = pd.MultiIndex.from_product([cduid_list, dates], names = ["cduid", "date"])
+    shape = (len(cduid_list), len(dates), len(col_names))
+    
+    # Arrange availability of each variable before and after the change as (division x date x variable) arrays
+    available = []
+    for df in [df_old, df_new]:
+        values = df.set_index(["cduid", "date"])[col_names].reindex(full_index).to_numpy(dtype = float)
+        available.append(~np.isnan(values).reshape(shape))
+    is_changed = np.zeros(len(full_index), dtype = bool)
+    cell = full_index.get_indexer(pd.MultiIndex.from_arrays([changed.cduid, changed.date]))
+    is_changed[cell[cell >= 0]] = True
+    is_changed = is_changed.reshape(shape[:2])
+    
+    # Find the divisions ranked up to the num_closest-th division with data for each missing variable
+    dependent = np.zeros(shape[:2], dtype = bool)
+    position = {uid: k for k, uid in enumerate(cduid_list)}
+    for k, uid in enumerate(cduid_list):
+        ranked = np.array([position[r] for r in neighbours[uid] if r in position], dtype = np.int64)
+        for donors in [available[0][ranked], available[1][ranked]]:
+            used = np.cumsum(donors, axis = 0) - donors < num_closest
+            depends = (used & is_changed[ranked][:, :, None]).any(axis = 0)
+            dependent[k] |= (depends & ~available[1][k]).any(axis = 1)
+    cd_idx, date_idx = np.nonzero(dependent)
+    return pd.DataFrame({"cduid": [cduid_list[k] for k in cd_idx], "date": dates[date_idx]})
+
+###############################################################################
+# FUNCTIONS REQUIRED FOR RUN REPORTS OF pipeline.py
+
+# Profiler of the stage currently being profiled (see startStage)
+stage_profiler = {}
+
+# Define function to get the peak memory used by the current process or its worker processes
+def getPeakMemory(children = False):
+    """
+    Returns the peak resident set size of the current process in megabytes, 
+    using the resource module on Linux and macOS or psutil (if installed) on 
+    Windows, or if children is True the largest peak of its finished worker
+    processes (e.g. of sd_workers or backfill chunks; resource module only).
+
+    Parameters
+    ----------
+    children : bool, optional
+        Measure the worker processes instead of the current process. The 
+        default is False.
+
+    Returns
+    -------
+    float
+        Peak resident set size in megabytes or None if it cannot be measured.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        if os.uname().sysname == "Darwin":
+            return peak / 1024 ** 2
+        return peak / 1024
+    except ImportError:
+        pass
+    if children:
+        return None
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except (ImportError, AttributeError):
+        return None
+
+# Define function to start timing a stage of the run
+def startStage(report, stage, rows_in = None, profile_stage = None, profile_dir = "."):
+    """
+    Adds a record for stage to report and starts timing it, noting the peak
+    memory of the process and its worker processes so far (see endStage). 
+    If stage is profile_stage, the stage is also profiled with cProfile until
+    endStage is called and the statistics are saved to 
+    profile_dir/profile_<stage>.prof.
+
+    Parameters
+    ----------
+    report : dictionary
+        Run report, with a list of stage records in report["stages"].
+    stage : str
+        Name of the stage.
+    rows_in : int, optional
+        Number of input rows of the stage. The default is None.
+    profile_stage : str, optional
+        Name of the stage to profile. The default is None.
+    profile_dir : str, optional
+        Directory to save the profile to. The default is ".".
+
+    Returns
+    -------
+    None.
+    """
+    report.setdefault("stages", []).append({"stage": stage, "rows_in": rows_in, "start": time.perf_counter(),
+                                            "start_peak": getPeakMemory(), 
+                                            "start_workers_peak": getPeakMemory(children = True)})
+    if stage == profile_stage:
+        stage_profiler["profile"] = cProfile.Profile()
+        stage_profiler["file"] = os.path.join(profile_dir, "profile_" + stage + ".prof")
+        stage_profiler["profile"].enable()
+
+# Define function to finish timing the current stage of the run
+def endStage(report, rows_out = None):
+    """
+    Records the wall time, increase of the peak memory of the process and of
+    its largest worker process and number of output rows of the last stage 
+    started in report, and saves its profile if it is being profiled. Peak 
+    memory never decreases, so a stage that uses less memory than an earlier
+    stage records an increase of 0 (the peaks of the whole run are saved by 
+    saveRunReport). Memory of worker processes is only measured once they 
+    have finished and not on Windows (None).
+
+    Parameters
+    ----------
+    report : dictionary
+        Run report (see startStage).
+    rows_out : int, optional
+        Number of output rows of the stage. The default is None.
+
+    Returns
+    -------
+    None.
+    """
+    record = report["stages"][-1]
+    if stage_profiler:
+        stage_profiler["profile"].disable()
+        stage_profiler["profile"].dump_stats(stage_profiler["file"])
+        record["profile"] = stage_profiler["file"]
+        stage_profiler.clear()
+    record["seconds"] = round(time.perf_counter() - record.pop("start"), 4)
+    start_peak, peak = record.pop("start_peak"), getPeakMemory()
+    record["peak_rss_increase_mb"] = None if peak is None else round(peak - start_peak, 1)
+    start_peak, peak = record.pop("start_workers_peak"), getPeakMemory(children = True)
+    record["workers_peak_rss_increase_mb"] = None if peak is None else round(peak - start_peak, 1)
+    record["rows_out"] = rows_out
+
+# Define function to save the run report
+def saveRunReport(report, outputfile):
+    """
+    Saves report to outputfile as JSON, with the total wall time and peak 
+    memory of the run (of the main process and of its largest worker process,
+    see getPeakMemory). The file is written to a temporary file first and then
+    moved into place.
+
+    Parameters
+    ----------
+    report : dictionary
+        Run report (see startStage).
+    outputfile : str
+        Path of the JSON file.
+
+    Returns
+    -------
+    None.
+    """
+    stages = report.get("stages", [])
+    report["total_seconds"] = round(sum(record.get("seconds", 0) for record in stages), 4)
+    report["peak_rss_mb"] = getPeakMemory()
+    report["workers_peak_rss_mb"] = getPeakMemory(children = True)
+    with open(outputfile + ".tmp", "w") as f:
+        json.dump(report, f, indent = 2, default = str)
+    os.replace(outputfile + ".tmp", outputfile)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 """
-This script pulls daily updates of Ontario temperatures and precipitation data,
-appends daily updates to the master climate data file, and generates weighted
-2016 Census divisions averages to creates a daily temperatures data set.
+This script pulls daily updates of Ontario (or any other province, or all of 
+Canada) temperatures and precipitation data, appends daily updates to the 
+master climate data file, and generates weighted 2016 Census divisions 
+averages to creates a daily temperatures data set.
 
 Author:       Minnie Cui
 Date written: 4 June 2020 
@@ -20,193 +21,172 @@ census_d = "census_divisions"
 # Census subdivisions file (created by transformCoordinates.py)
 census_sd = "census_subdivisions"
 
+# Ontario boundaries geometry bundle folder (created by buildGeometryBundle.py), used instead of 
+# census_d and census_sd if it exists
+geometry_bundle = "ontario_geometry"
+
+# Subdivisions lookup grid file in geometry_bundle (created by buildGeometryBundle.py), used to match new 
+# weather stations to subdivisions by array lookup if it exists, with exact tests only near boundaries 
+# (None to always test exactly)
+sd_grid = "census_subdivisions_grid.npz"
+
 # Census subdivisions population estimates file (created by cleanPop.do)
 pop_sd = "subdivisions_pop"
 
+# Station to subdivision matches cache file (rebuilt if census_sd changes)
+station_cache = "station_subdivisions.csv"
+
+# Folder in which the output of each stage is cached, so that stages whose inputs have not changed 
+# are not re-executed (None to always re-execute all stages)
+stage_cache = "stage_cache"
+
+# Climate-daily API items collection
+api_url = "https://api.weather.gc.ca/collections/climate-daily/items"
+
+# Province to calculate averages for (2-letter code, e.g. "ON") or None for all of Canada; geometry_bundle 
+# (or census_d and census_sd if it doesn't exist), pop_sd and the raw daily climate data in the project 
+# directory must cover the same province (runs stop if geometry_bundle does not, e.g. the Ontario bundle 
+# with None)
+province = "ON"
+
+# First date of the daily climate data
+start_date = "2018-01-01"
+
+# Number of trailing days recalculated if the averages have been calculated before (all days since the 
+# last pull are recalculated if it is older)
+recalc_days = 10
+
+# Averages recalculated if they have been calculated before: those of the last recalc_days days ("window") 
+# or only those of the divisions and dates whose readings were added, revised or removed since the last 
+# pull, and of the divisions whose gaps are filled with them ("changes"); in "changes" mode, hashes of all
+# readings and the divisions averages before gap filling are saved to change_state in the project directory
+recalc_mode = "window"
+change_state = "change_state.pkl"
+
+# Pull only the last fetch_window days (or all days since the last pull if it is older) and merge into the
+# master data ("incremental") or pull all days ("full")
+fetch_mode = "incremental"
+fetch_window = 30
+
+# Pull monthly pages with fetch_workers threads, saving completed pages to fetch_checkpoint so an 
+# interrupted pull resumes where it stopped
+fetch_workers = 4
+fetch_checkpoint = "daily_climate_pages"
+
+# Format of the raw daily climate data: CSV master file in daily_climate ("csv") or typed, monthly 
+# partitioned store in climate_store ("parquet", requires pyarrow and the "strtree" sd_engine)
+master_format = "csv"
+climate_store = "daily_climate_store"
+
+# Read the raw daily climate data one month at a time instead of all at once (True, "window" recalc_mode 
+# only), so peak memory does not grow with the length of the history; the latest readings are also pulled
+# and saved one month at a time, the CSV master file is first split into monthly files in stream_dir, 
+# reading about stream_memory_mb megabytes of readings at a time, and stages are not cached
+stream_master = False
+stream_memory_mb = 512
+stream_dir = "daily_climate_chunks"
+
 # Output file (average climate by Census divisions)
 outputfile = "daily_cd_climate.csv"
 
+# Format of the output: single CSV outputfile ("csv") or monthly partitioned store output_store in 
+# which only recalculated days are replaced ("parquet", requires pyarrow), optionally exported to 
+# outputfile after each run
+output_format = "csv"
+output_store = "daily_cd_climate_store"
+export_csv = False
+
+# Folder next to the output in which the whole output is also saved as memory-mapped arrays indexed by 
+# division and date after each run, for fast queries with climateIndex.py (None to not save it)
+output_index = None
+
 # Number of districts to average if no weather station or if weather station not working
 num_district = 3
 
-###############################################################################
-# IMPORT REQUIRED PACKAGES
-import os
-import pandas as pd
-import numpy as np
-from datetime import date, timedelta
-from functions import getSDAvgs, getWtAvg, closestDivisions, getAvg
-import shapefile as sf
-from shapely.geometry.polygon import Polygon
-  
-# CHANGE PROJECT DIRECTORY
-os.chdir(directory)
-print("\nProject directory successfully set to: " + directory)
+# Climate-daily API columns to average in one pass (None for MEAN_TEMPERATURE, MIN_TEMPERATURE, 
+# MAX_TEMPERATURE and TOTAL_PRECIPITATION, saved as avg_temp, min_temp, max_temp and avg_precip); other
+# columns are saved in lower case, e.g. ["MEAN_TEMPERATURE", "TOTAL_PRECIPITATION", "SNOW_ON_GROUND"];
+# if the output already exists, only the last recalc_days days are calculated with new variables 
+# (recalculate earlier days with the backfill command of climateCLI.py; a climate store saved before all
+# columns were stored must first be pulled again with fetch_mode "full")
+variables = None
 
-###############################################################################
-# PULL TODAY'S DATA
-print("\nGetting latest climate data...")
-
-# Generate today's date and first day to pull variables
-start = date(2018, 1, 1)
-today = date.today()
-todayfile = "daily_climate_" + str(start) + "_to_" + str(today) + ".csv"
-
-# Remove old master data if in daily_climate folder
-if len(os.listdir("./daily_climate")) != 0 and todayfile not in os.listdir("./daily_climate"):
-    os.remove("./daily_climate/" + os.listdir("./daily_climate")[0])
-
-# Update master data with today's data if it hasn't been pulled already
-if todayfile not in os.listdir("./daily_climate"):
-    url = "https://api.weather.gc.ca/collections/climate-daily/items?datetime=2018-01-01%2000:00:00/" + str(today) + "%2000:00:00&PROVINCE_CODE=ON&sortby=PROVINCE_CODE,CLIMATE_IDENTIFIER,LOCAL_DATE&f=csv&limit=1500000&startindex=0"
-    master = pd.read_csv(url, parse_dates = ["LOCAL_DATE"], dtype = str)
-        
-    # Save new master to directory
-    master.to_csv("./daily_climate/" + todayfile, index = False) 
-    print("\nRaw daily climate data has been updated in folder.")
-else:
-    master = pd.read_csv("./daily_climate/" + todayfile, parse_dates = ["LOCAL_DATE"], dtype = str)
-    print("\nToday's climate data update is already in folder.")
-
-# Change variable type for columns that are float or int
-float_cols = [v for v in master if "_FLAG" not in v]
-int_cols = ["LOCAL_YEAR", "LOCAL_MONTH", "LOCAL_DAY"]
-for v in ["CLIMATE_IDENTIFIER", "STATION_NAME", "PROVINCE_CODE", "LOCAL_DATE", "ID"] + int_cols:
-    float_cols.remove(v)
-dtypes = {}
-for v in float_cols:
-    dtypes[v] = float
-for v in int_cols:
-    dtypes[v] = int
-for col, col_type in dtypes.items():
-    master[col] = master[col].astype(col_type)
-        
-###############################################################################
-# GENERATE AVERAGE CLIMATE VARIABLES BY SUBDIVISION
-print("\nGetting subdivisions climate variable averages...")
+# Flags of readings to leave out of the averages of their variable, e.g. ["E"] for estimated readings
+# (None to keep all readings)
+exclude_flags = None
 
-# Read in subdivisions shapefile data
-subdivisions = sf.Reader("./" + census_sd + "/" + census_sd, encoding="latin1")
-records = subdivisions.records()
-print("\nSubdivisions boundary data loaded.")
+# Method used to match weather stations to subdivisions ("strtree" or "loop")
+sd_engine = "strtree"
 
-# Generate list of subdivisions in Ontario
-on_sds = list(i for i in range(0, len(records)) if records[i][3] == "35")
+# Number of processes to calculate subdivisions averages with
+sd_workers = 1
 
-# Read in subdivisions 2019 population estimates data
-pop = pd.read_csv("./" + pop_sd + "/" + pop_sd + ".csv")
+# Format of the subdivisions averages: dataframe with one row and list of weather stations per 
+# subdivision and day ("frame") or float32 arrays per variable with the weather stations stored once 
+# as offsets and indices ("compact", uses the "strtree" sd_engine in a single process and a fraction of 
+# the memory, with averages rounded to float32)
+sd_format = "frame"
 
-# Generate subdivisions climate averages data 
-if outputfile in os.listdir(".."):
-    start = today - timedelta(10)
-df = getSDAvgs(master, subdivisions, on_sds, start, today) 
-print("\nSubdivisions averages dataset complete.")
+# Method used to calculate population weighted division averages ("groupby", "loop", or "sparse" to 
+# calculate them directly from station readings with sparse weights, skipping the subdivisions 
+# averages and sd_engine; requires scipy)
+cd_engine = "groupby"
 
-# Change ID variable types to int
-dtypes = {"csduid": int,
-          "cduid": int}
-for col, col_type in dtypes.items():
-    df[col] = df[col].astype(col_type)
+# Method used to fill divisions missing climate variables ("array" or "loop")
+fill_engine = "array"
 
-###############################################################################
-# GENERATE AVERAGE CLIMATE VARIABLES BY CENSUS DIVISION, WEIGHTED BY SUBDIVISION POPULATION
-print("\nGetting divisions averages, weighted by subdivision population...")
-
-# Merge subdivision averages with subdivision population estimates
-df_pop = pd.merge(df, pop, on = ["cduid", "csduid"])
-print("\nSubdivisions averages dataset successfully merged with subdivisions population estimates.")
-
-# Generate divisions climate weighted averages data 
-data = []
-cduid_list = list(dict.fromkeys(list(df_pop.cduid)))
-for uid in cduid_list:
-    sub_df = df_pop[df_pop.cduid == uid]
-    for single_date in pd.date_range(start=start, end=today):
-        sub_df_date = sub_df[sub_df.date == single_date]
-        if len(sub_df_date) != 0:
-            data.append([uid, single_date, getWtAvg(sub_df_date, 5), getWtAvg(sub_df_date, 6), getWtAvg(sub_df_date, 7), getWtAvg(sub_df_date, 8)])
-        else:
-            data.append([uid, single_date, np.nan, np.nan, np.nan, np.nan])
-col_names = ["cduid", "date", "avg_temp", "min_temp", "max_temp", "avg_precip"]     
-df_cd = pd.DataFrame(data, columns = col_names)
-print("\nDivisions averages dataset complete.")
-
-# Drop dates that have fewer than 3 Census districts with observations
-for single_date in list(dict.fromkeys(list(df_cd.date))):
-    sub_df = df_cd[df_cd.date == single_date]
-    if sum(sub_df.avg_temp.isnull().values) > 49 - num_district:
-        df_cd = df_cd[df_cd.date != single_date]
-
-# Check how many divisions have no weather stations
-all_null = []
-for uid in cduid_list:
-    sub_df = df_cd[df_cd.cduid == uid]
-    if sub_df.avg_temp.isnull().all() == True and sub_df.min_temp.isnull().all() == True and sub_df.max_temp.isnull().all() == True and sub_df.avg_precip.isnull().all() == True:
-        all_null.append(uid)
-print("\n" + str(len(all_null)) + " have no average climate variables.")
-print(str(all_null))
+# Run report file saved next to the output, with the wall time, increase of peak memory (of the main 
+# process and, separately, of its largest worker process) and row counts of each stage and the peak 
+# memory of the whole run
+run_report = "daily_cd_climate_report.json"
+
+# Stage to profile with cProfile, saved next to the output as profile_<stage>.prof ("fetch", 
+# "convert", "boundaries", "changes", "split", "chunks", "subdivisions", "divisions", "fill", "save", "index" or None)
+profile_stage = None
 
 ###############################################################################
-# FOR CENSUS DIVISIONS WITH NO WEATHER STATIONS OR FAILED WEATHER STATIONS, GET AVERAGE OF 3 CLOSEST DIVISIONS
-print("\nGetting average of " + str(num_district) + " closest divisions for divisions with no average climate variable...")
-
-# Create dictionaries of all division codes and dates that need filling in
-empty_list = []
-for _ in range(len(cduid_list)):
-    empty_list.append([])
-
-           
-# Read in divisions data
-divisions = sf.Reader("./" + census_d + "/" + census_d, encoding="latin1")
-records = divisions.records()
-print("\nDivisions boundary data loaded.") 
-   
-# Get average of closest 3 weather stations on the given day
-for v in range(2, 6):
-    data = []
-    fill = dict()
-    sub_df_cd = df_cd
-    for j in df_cd.index:
-        if str(df_cd.loc[j][v]) == "nan":
-            fill[(df_cd.loc[j].cduid, df_cd.loc[j].date)] = list(df_cd.loc[j].values)
-            sub_df_cd = sub_df_cd.drop(j)        
-    for uid in list(dict.fromkeys(list(key[0] for key in fill.keys()))):
-        for single_date in list(key[1] for key in fill.keys() if key[0] == uid):
-            sub_data = fill[(uid, single_date)]
-            sub_df = sub_df_cd[sub_df_cd.date == single_date]
-            centroids = {}
-            for i in list(i for i in range(0, len(records)) if int(records[i][0]) in list(dict.fromkeys(list(sub_df.cduid)))):
-                polygon = Polygon(divisions.shape(i).points)
-                centroid = polygon.centroid
-                centroids[int(records[i][0])] = centroid
-            polygons = {}
-            for i in list(i for i in range(0, len(records)) if int(records[i][0]) in [uid]):
-               polygon = Polygon(divisions.shape(i).points)
-               polygons[int(records[i][0])] = polygon 
-            closest = closestDivisions(polygons, centroids, num_district)
-            sub_df_date = sub_df[sub_df.cduid.isin(closest[uid])]
-            sub_data[v] = getAvg(sub_df_date, v)
-            data.append(sub_data)
-    df_cd = pd.concat([sub_df_cd, pd.DataFrame(data, columns = col_names)], ignore_index = True)
-
-print("\nDivisions averages of divisions without weather stations dataset complete.")
+# IMPORT REQUIRED PACKAGES
+from pipeline import runPipeline
 
 ###############################################################################
-# SAVE FINAL DATA SET
-print("\nSaving final divisions averages dataset...")
-
-# Save divisions average data to file
-if start == date(2018, 1, 1):
-    df_cd = df_cd.sort_values(by = ['cduid', 'date'], ignore_index = True)
-    df_cd.to_csv("../" + outputfile, index = False)
-else: 
-    df_cd_master = pd.read_csv("../" + outputfile, parse_dates = ["date"])
-    for single_date in pd.date_range(start=start, end=today):
-        df_cd_master = df_cd_master[df_cd_master.date != single_date]
-    df_cd_master = pd.concat([df_cd_master, df_cd], ignore_index = True)
-    df_cd_master = df_cd_master.drop_duplicates(keep = "last")
-    df_cd_master = df_cd_master.sort_values(by = ['cduid', 'date'], ignore_index = True)
-    df_cd_master.to_csv("../" + outputfile, index = False)
-
-print("\nFinal divisions averages dataset successfully saved.")
-print("\nEnd of code.")
\ No newline at end of file
+# RUN PIPELINE
+if __name__ == "__main__":
+    runPipeline({"directory": directory,
+                 "census_d": census_d,
+                 "census_sd": census_sd,
+                 "geometry_bundle": geometry_bundle,
+                 "sd_grid": sd_grid,
+                 "pop_sd": pop_sd,
+                 "station_cache": station_cache,
+                 "stage_cache": stage_cache,
+                 "api_url": api_url,
+                 "province": province,
+                 "start_date": start_date,
+                 "recalc_days": recalc_days,
+                 "recalc_mode": recalc_mode,
+                 "change_state": change_state,
+                 "fetch_mode": fetch_mode,
+                 "fetch_window": fetch_window,
+                 "fetch_workers": fetch_workers,
+                 "fetch_checkpoint": fetch_checkpoint,
+                 "master_format": master_format,
+                 "climate_store": climate_store,
+                 "stream_master": stream_master,
+                 "stream_memory_mb": stream_memory_mb,
+                 "stream_dir": stream_dir,
+                 "outputfile": outputfile,
+                 "output_format": output_format,
+                 "output_store": output_store,
+                 "export_csv": export_csv,
+                 "output_index": output_index,
+                 "num_district": num_district,
+                 "variables": variables,
+                 "exclude_flags": exclude_flags,
+                 "sd_engine": sd_engine,
+                 "sd_workers": sd_workers,
+                 "sd_format": sd_format,
+                 "cd_engine": cd_engine,
+                 "fill_engine": fill_engine,
+                 "run_report": run_report,
+                 "profile_stage": profile_stage})
+    print("\nEnd of code.")
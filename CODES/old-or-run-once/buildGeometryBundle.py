@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+This script reads in the transformed 2016 Canada Census divisions and 
+subdivisions boundaries data (created by transformCoordinates.py) and saves 
+the Ontario boundaries to a compact geometry bundle that getCDAverages.py 
+loads in one read instead of parsing the national shapefiles on every run, 
+along with a lookup grid of the subdivisions used to match weather stations
+to subdivisions by array lookup.
+
+Author:       Minnie Cui
+Date written: 16 October 2026 
+Last updated: ---
+"""
+###############################################################################
+# DEFINE REQUIRED VARIABLES
+
+# Project directory
+directory = ("C:/Users/minni/Research/COVID_ON/AVG_CLIMATE/DATA")
+
+# Census divisions file (created by transformCoordinates.py)
+census_d = "census_divisions"
+
+# Census subdivisions file (created by transformCoordinates.py)
+census_sd = "census_subdivisions"
+
+# Geometry bundle folder
+geometry_bundle = "ontario_geometry"
+
+# Province code of boundaries to keep (None to keep all provinces, as needed to run getCDAverages.py with 
+# province None)
+province = "35"
+
+# Subdivisions lookup grid file in the geometry bundle folder and width of its cells in degrees
+sd_grid = "census_subdivisions_grid.npz"
+grid_cell_size = 0.01
+
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+from functions import buildGeometryBundle, buildSubdivisionGrid
+
+# CHANGE PROJECT DIRECTORY
+os.chdir(directory)
+
+###############################################################################
+# BUILD CENSUS DIVISIONS BUNDLE
+buildGeometryBundle("./" + census_d + "/" + census_d, "./" + geometry_bundle + "/" + census_d + ".parquet", province)
+print("\nCensus divisions geometry bundle successfully built!")
+
+# BUILD CENSUS SUBDIVISIONS BUNDLE
+buildGeometryBundle("./" + census_sd + "/" + census_sd, "./" + geometry_bundle + "/" + census_sd + ".parquet", province)
+print("\nCensus subdivisions geometry bundle successfully built!")
+
+# BUILD CENSUS SUBDIVISIONS LOOKUP GRID
+buildSubdivisionGrid("./" + geometry_bundle + "/" + census_sd + ".parquet", "./" + geometry_bundle + "/" + sd_grid, grid_cell_size)
+print("\nCensus subdivisions lookup grid successfully built!")
+
+# Finish
+print("\nEnd of geometry bundle build.")
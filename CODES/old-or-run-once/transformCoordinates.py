@@ -27,7 +27,7 @@ output_census_sd = "census_subdivisions"
 # IMPORT REQUIRED PACKAGES
 import os
 import pyproj as pj
-from functions import applyTransform
+from transformFunctions import applyTransforms
 
 # CHANGE PROJECT DIRECTORY
 os.chdir(directory)
@@ -41,16 +41,13 @@ lcc = "+proj=lcc +lon_0=-91.866667 +lat_0=63.390675 +lat_1=49.000000 +lat_2=77.0
 # Output coordinate system using system programming
 wgs84 = "epsg:4326"
 
-# Define transformation function 
-lcc_to_wgs84 = pj.Transformer.from_proj(lcc, wgs84)
+# Define transformation function (longitude, latitude order as in the climate data)
+lcc_to_wgs84 = pj.Transformer.from_proj(lcc, wgs84, always_xy = True)
     
 ###############################################################################
-# TRANSFORM CENSUS DIVISIONS DATA
-applyTransform(lcc_to_wgs84, input_census_d, output_census_d)
+# TRANSFORM CENSUS DIVISIONS AND SUBDIVISIONS DATA (IN PARALLEL)
+applyTransforms(lcc_to_wgs84, [(input_census_d, output_census_d), (input_census_sd, output_census_sd)])
 print("\nCensus divisions boundary coordinates successfully transformed!")
-
-# TRANSFORM CENSUS SUBDIVISIONS DATA
-applyTransform(lcc_to_wgs84, input_census_sd, output_census_sd)
 print("\nCensus subdivisions boundary coordinates successfully transformed!")
 
 # Finish
@@ -0,0 +1,1056 @@
+# -*- coding: utf-8 -*-
+"""
+This script defines the stages of the daily Census divisions climate averages
+workflow (pull, type conversion, subdivisions averages, population weighted
+divisions averages, gap filling and save) as functions that take an explicit
+configuration, so the workflow can be run from getCDAverages.py or imported.
+The output of each stage is cached on disk under a hash of its inputs, so a
+stage is only re-executed when its inputs have changed. Any date range can also
+be recalculated in month or year chunks calculated in parallel (runBackfill),
+only the divisions and dates whose station readings changed since the last
+pull can be recalculated instead of a fixed window (runChangedPipeline), and 
+the raw data can be read one month at a time with bounded memory 
+(runStreamedPipeline).
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+import shutil
+import hashlib
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from datetime import datetime, timedelta
+import shapefile as sf
+from climateIndex import saveClimateIndex
+from pipelineConfig import province_ids, getConfig, getOutputExists
+from fetchFunctions import readClimateCSV, convertClimateTypes, splitClimateFile, loadClimateStore, savePartitions, loadPartitions, exportPartitions, getLastPull, getFetchStart, getRecalcStart, fetchClimate
+from functions import getSDAvgs, getSDAvgsCompact, getCDAvgs, getCDAvgsCompact, getCDAvgsSparse, getDivisionNeighbours, fillDivisions, dropSparseDates, getFileHash, getCachedStationSubdivisions, loadSubdivisionGrid, loadGeometryBundle, getBoundaryRecords, startStage, endStage, saveRunReport, getFrameHash, loadStageCache, saveStageCache, getClimateVars, getReadingHashes, getChangedReadings, getChangedSubdivisionDays, getFillDependents
+
+###############################################################################
+# DEFINE PIPELINE FUNCTIONS
+
+# Define function to get the columns of the daily climate readings used by the averages
+def getClimateColumns(config):
+    """
+    Returns the columns of the daily climate readings read by the pipeline:
+    the station location and identifiers, the date, and the climate 
+    variables averaged (see getClimateVars) with their flag columns.
+    """
+    var_names = list(getClimateVars(config["variables"]).values())
+    return (["x", "y", "CLIMATE_IDENTIFIER", "PROVINCE_CODE", "LOCAL_DATE"] + var_names + 
+            [var + "_FLAG" for var in var_names])
+
+# Define function to load the daily climate readings with numeric types
+def loadClimate(config, files, master, load_start):
+    """
+    Returns dataframe of the daily climate readings with numeric types, from
+    the CSV master file (or master if it was just pulled) or from the dates 
+    from load_start onwards in the climate store. Only the columns of 
+    getClimateColumns are read.
+    """
+    columns = getClimateColumns(config)
+    if config["master_format"] == "csv":
+        if master is None:
+            master = readClimateCSV(files[0], columns)
+        return convertClimateTypes(master[columns])
+    else:
+        return loadClimateStore(os.path.join(config["directory"], config["climate_store"]), load_start, config["end_date"],
+                                columns = columns)
+
+# Define function to check that a geometry bundle covers the province of the configuration
+def checkBundleProvince(config, records, bundlefile):
+    """
+    Raises ValueError if the boundaries of geometry bundle bundlefile, with 
+    the given records, are not in the province of config (field PRUID) or, 
+    if province is None, do not cover all provinces, e.g. if the Ontario 
+    bundle built by buildGeometryBundle.py is used for all of Canada.
+    """
+    provinces = set(str(record[3]) for record in records)
+    if config["province"] is None:
+        needed = set(province_ids.values())
+    else:
+        needed = {province_ids[config["province"]]}
+    missing = sorted(needed - provinces)
+    if len(missing) > 0:
+        raise ValueError("ERROR! The geometry bundle " + bundlefile + " has no boundaries in provinces " + str(missing) + 
+                         "; build it for these provinces with buildGeometryBundle.py or set geometry_bundle to a bundle that covers them.")
+
+# Define function to load the Census subdivisions boundaries and population estimates
+def loadSubdivisions(config):
+    """
+    Returns the Census subdivisions boundaries (geometry bundle if it exists,
+    or else shapefile), the list of positions of subdivisions in the province
+    of config (or all subdivisions if province is None), a hash of the 
+    boundary files and selected subdivisions, and the subdivisions population
+    estimates.
+    """
+    directory = config["directory"]
+    census_sd = config["census_sd"]
+    if os.path.exists(os.path.join(directory, config["geometry_bundle"])):
+        sd_files = [os.path.join(directory, config["geometry_bundle"], census_sd + ".parquet")]
+        subdivisions = loadGeometryBundle(sd_files[0])
+        records = getBoundaryRecords(subdivisions)
+        checkBundleProvince(config, records, sd_files[0])
+    else:
+        sd_files = [os.path.join(directory, census_sd, census_sd + ext) for ext in [".shp", ".shx", ".dbf"]]
+        subdivisions = sf.Reader(os.path.join(directory, census_sd, census_sd), encoding="latin1")
+        records = getBoundaryRecords(subdivisions)
+    print("\nSubdivisions boundary data loaded.")
+
+    # Generate list of subdivisions in the province (field PRUID)
+    pruid = None if config["province"] is None else province_ids[config["province"]]
+    sd_list = list(i for i in range(0, len(records)) if pruid is None or records[i][3] == pruid)
+    if len(sd_list) == 0:
+        raise ValueError("ERROR! There are no Census subdivisions in province " + str(config["province"]) + " in the boundary data.")
+
+    # Read in subdivisions 2019 population estimates data
+    pop = pd.read_csv(os.path.join(directory, config["pop_sd"], config["pop_sd"] + ".csv"))
+    return subdivisions, sd_list, getFileHash(sd_files, str(sd_list)), pop
+
+# Define function to match weather stations to subdivisions using the station cache
+def getStationMatches(config, stations, subdivisions, sd_list, sd_hash):
+    """
+    Returns the station to subdivision matches of stations (see 
+    getCachedStationSubdivisions), with new stations matched using the 
+    subdivisions lookup grid of the geometry bundle if it exists.
+    """
+    grid = None
+    if config["sd_grid"] is not None:
+        gridfile = os.path.join(config["directory"], config["geometry_bundle"], config["sd_grid"])
+        if os.path.exists(gridfile):
+            grid = loadSubdivisionGrid(gridfile)
+    return getCachedStationSubdivisions(stations, subdivisions, sd_list,
+                                        os.path.join(config["directory"], config["station_cache"]), sd_hash, 
+                                        grid = grid)
+
+# Define function to generate the subdivisions climate averages
+def getSubdivisionAverages(config, master, subdivisions, sd_list, sd_hash, start_date, matches = None):
+    """
+    Returns dataframe of daily climate averages by Census subdivision between
+    start_date and end_date (see getSDAvgs), with integer division and
+    subdivision codes, or compact arrays of the averages (see 
+    getSDAvgsCompact) if sd_format is "compact". Station to subdivision 
+    matches are read from the station cache unless matches is given.
+    """
+    if matches is None:
+        matches = getStationMatches(config, master, subdivisions, sd_list, sd_hash)
+    if config["sd_format"] == "compact":
+        return getSDAvgsCompact(master, subdivisions, sd_list, start_date, config["end_date"], matches = matches,
+                                variables = config["variables"], exclude_flags = config["exclude_flags"])
+    df = getSDAvgs(master, subdivisions, sd_list, start_date, config["end_date"], engine = config["sd_engine"],
+                   matches = matches, workers = config["sd_workers"], variables = config["variables"],
+                   exclude_flags = config["exclude_flags"])
+
+    # Change ID variable types to int
+    dtypes = {"csduid": int,
+              "cduid": int}
+    for col, col_type in dtypes.items():
+        df[col] = df[col].astype(col_type)
+    return df
+
+# Define function to generate the divisions climate averages weighted by subdivision population
+def getDivisionAverages(config, df, pop, start_date, check = True):
+    """
+    Returns dataframe of daily population weighted climate averages by Census
+    division between start_date and end_date (see getCDAvgs), without dates
+    that have too few divisions with observations if check is True.
+    """
+    if isinstance(df, dict):
+        df_cd = getCDAvgsCompact(df, pop)
+        print("\nDivisions averages dataset complete.")
+        if not check:
+            return df_cd
+        return checkDivisionAverages(config, df_cd, list(dict.fromkeys(list(df_cd.cduid))))
+
+    # Merge subdivision averages with subdivision population estimates
+    df_pop = pd.merge(df, pop, on = ["cduid", "csduid"])
+    print("\nSubdivisions averages dataset successfully merged with subdivisions population estimates.")
+
+    # Generate divisions climate weighted averages data
+    cduid_list = list(dict.fromkeys(list(df_pop.cduid)))
+    df_cd = getCDAvgs(df_pop, start_date, config["end_date"], engine = config["cd_engine"], 
+                      variables = config["variables"])
+    print("\nDivisions averages dataset complete.")
+    if not check:
+        return df_cd
+    return checkDivisionAverages(config, df_cd, cduid_list)
+
+# Define function to generate the divisions climate averages directly from station readings
+def getSparseDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, start_date, matches = None,
+                              check = True):
+    """
+    Returns the same dataframe as getDivisionAverages applied to the output of
+    getSubdivisionAverages, calculated with sparse station to division 
+    weights (see getCDAvgsSparse) without the subdivisions averages.
+    """
+    if matches is None:
+        matches = getStationMatches(config, master, subdivisions, sd_list, sd_hash)
+    df_cd = getCDAvgsSparse(master, subdivisions, sd_list, pop, start_date, config["end_date"], matches = matches,
+                            variables = config["variables"], exclude_flags = config["exclude_flags"])
+    print("\nDivisions averages dataset complete.")
+    if not check:
+        return df_cd
+    return checkDivisionAverages(config, df_cd, list(dict.fromkeys(list(df_cd.cduid))))
+
+# Define function to drop sparse dates from the divisions climate averages
+def checkDivisionAverages(config, df_cd, cduid_list):
+    """
+    Returns df_cd without dates that have too few divisions with observations
+    (see dropSparseDates), and prints the divisions without any averages.
+    """
+    # Drop dates that have fewer than 3 Census districts with observations of the first variable
+    col_names = list(getClimateVars(config["variables"]))
+    df_cd = dropSparseDates(df_cd, len(cduid_list), config["num_district"], col_names[0])
+
+    # Check how many divisions have no weather stations
+    empty = df_cd[col_names].isnull().all(axis = 1).groupby(df_cd.cduid).all()
+    all_null = [uid for uid in cduid_list if empty.get(uid, True)]
+    print("\n" + str(len(all_null)) + " have no average climate variables.")
+    print(str(all_null))
+    return df_cd
+
+# Define function to get the files of the Census divisions boundaries
+def getDivisionFiles(config):
+    """
+    Returns the path of the Census divisions boundaries to read and the list of
+    files they are read from.
+    """
+    directory = config["directory"]
+    census_d = config["census_d"]
+    if os.path.exists(os.path.join(directory, config["geometry_bundle"])):
+        path = os.path.join(directory, config["geometry_bundle"], census_d + ".parquet")
+        return path, [path]
+    else:
+        path = os.path.join(directory, census_d, census_d)
+        return path, [path + ext for ext in [".shp", ".shx", ".dbf"]]
+
+# Define function to rank the Census divisions by distance to each division
+def loadDivisionNeighbours(config, cduid_list):
+    """
+    Reads the Census divisions boundaries and returns the divisions of 
+    cduid_list ranked by distance to each division (see 
+    getDivisionNeighbours).
+    """
+    path, files = getDivisionFiles(config)
+    if path.endswith(".parquet"):
+        divisions = loadGeometryBundle(path)
+        checkBundleProvince(config, getBoundaryRecords(divisions), path)
+    else:
+        divisions = sf.Reader(path, encoding="latin1")
+    print("\nDivisions boundary data loaded.")
+    return getDivisionNeighbours(divisions, cduid_list)
+
+# Define function to fill divisions without climate averages with the average of the closest divisions
+def fillDivisionGaps(config, df_cd, neighbours = None):
+    """
+    Returns df_cd with missing climate averages filled with the average of the
+    num_district closest divisions with observations (see fillDivisions). 
+    Divisions are ranked by distance from the divisions boundaries unless 
+    neighbours is given.
+    """
+    print("\nGetting average of " + str(config["num_district"]) + " closest divisions for divisions with no average climate variable...")
+
+    # Rank divisions by distance to each division once
+    if neighbours is None:
+        neighbours = loadDivisionNeighbours(config, list(dict.fromkeys(list(df_cd.cduid))))
+
+    # Get average of closest 3 weather stations on the given day
+    df_cd = fillDivisions(df_cd, neighbours, config["num_district"], engine = config["fill_engine"])
+    print("\nDivisions averages of divisions without weather stations dataset complete.")
+    return df_cd
+
+# Define function to save the divisions climate averages
+def saveDivisionAverages(config, df_cd, start_date, end_date = None):
+    """
+    Saves df_cd to the output file (replacing the dates from start_date to
+    end_date, or to the end_date of config if None, unless they span all 
+    dates of config) or output store, and returns the number of rows in the
+    output file (or of df_cd for the store).
+    """
+    output_dir = config["output_dir"]
+    outputfile = os.path.join(output_dir, config["outputfile"])
+    today = config["end_date"] if end_date is None else end_date
+    rows_saved = len(df_cd)
+    if config["output_format"] == "csv":
+        if (start_date <= config["start_date"] and today >= config["end_date"]) or not os.path.exists(outputfile):
+            df_cd = df_cd.sort_values(by = ['cduid', 'date'], ignore_index = True)
+            df_cd.to_csv(outputfile, index = False)
+        else:
+            df_cd_master = pd.read_csv(outputfile, parse_dates = ["date"], float_precision = "round_trip")
+            df_cd_master = df_cd_master[(df_cd_master.date < pd.Timestamp(start_date)) | (df_cd_master.date > pd.Timestamp(today))]
+            df_cd_master = pd.concat([df_cd_master, df_cd], ignore_index = True)
+            df_cd_master = df_cd_master.drop_duplicates(keep = "last")
+            df_cd_master = df_cd_master.sort_values(by = ['cduid', 'date'], ignore_index = True)
+            df_cd_master.to_csv(outputfile, index = False)
+            rows_saved = len(df_cd_master)
+    else:
+        output_store = os.path.join(output_dir, config["output_store"])
+        savePartitions(df_cd, output_store, start_date, today, "date", ["cduid", "date"])
+        if config["export_csv"]:
+            exportPartitions(output_store, "date", ["cduid", "date"], outputfile)
+    return rows_saved
+
+# Define function to save the whole divisions climate averages output to the indexed binary format
+def saveDivisionIndex(config):
+    """
+    Reads the whole output file (or store) of config and saves it to the
+    output_index directory (see saveClimateIndex), returning its number of 
+    rows.
+    """
+    output_dir = config["output_dir"]
+    if config["output_format"] == "csv":
+        df_cd = pd.read_csv(os.path.join(output_dir, config["outputfile"]), parse_dates = ["date"])
+    else:
+        df_cd = loadPartitions(os.path.join(output_dir, config["output_store"]), "date")
+    saveClimateIndex(df_cd, os.path.join(output_dir, config["output_index"]))
+    return len(df_cd)
+
+# Define function to get the number of rows of the output of a stage
+def getRowCount(output):
+    """
+    Returns the number of rows of output, or of subdivisions and dates of 
+    compact subdivisions averages (see getSDAvgsCompact).
+    """
+    if isinstance(output, dict):
+        return int(output[output["variables"][0]].size)
+    return len(output)
+
+# Define function to run a pipeline stage unless its output is cached
+def runCachedStage(config, report, stage, inputs, rows_in, function, *args):
+    """
+    Returns the output of function(*args) for stage and a hash of the output,
+    loading them from the stage cache if the stage has already been run with
+    the same inputs. The stage is recorded in report (see startStage).
+
+    Parameters
+    ----------
+    config : dictionary
+        Complete configuration (see getConfig).
+    report : dictionary
+        Run report.
+    stage : str
+        Name of the stage.
+    inputs : list
+        Hashes of input data and values of settings that the output depends on.
+    rows_in : int
+        Number of input rows of the stage.
+    function : function
+        Function that returns the output dataframe of the stage.
+
+    Returns
+    -------
+    output : dataframe
+        Output of the stage.
+    output_hash : str
+        Hash of output (see getFrameHash).
+    """
+    startStage(report, stage, rows_in, config["profile_stage"], config["output_dir"])
+    key = hashlib.sha256(str([stage] + inputs).encode("utf-8")).hexdigest()
+    cache_dir = None
+    cached = None
+    if config["stage_cache"] is not None:
+        cache_dir = os.path.join(config["directory"], config["stage_cache"])
+        cached = loadStageCache(cache_dir, stage, key)
+    if cached is None:
+        output = function(*args)
+        output_hash = getFrameHash(output)
+        if cache_dir is not None:
+            saveStageCache(cache_dir, stage, key, output, output_hash)
+    else:
+        output, output_hash = cached
+        print("\nInputs of " + stage + " stage unchanged, output loaded from stage cache.")
+    endStage(report, getRowCount(output))
+    report["stages"][-1]["cached"] = cached is not None
+    return output, output_hash
+
+# Define function to run the whole pipeline
+def runPipeline(config = None, fetch = True):
+    """
+    Pulls the latest daily climate readings and generates daily population
+    weighted climate averages by Census division, saved to the output file (or
+    store) of config. Stages whose inputs have not changed since the last run
+    are loaded from the stage cache instead of being re-executed, and a run
+    report is saved next to the output.
+
+    Parameters
+    ----------
+    config : dictionary, optional
+        Configuration values to use instead of the defaults (see
+        default_config). The default is None.
+    fetch : bool, optional
+        Pull the latest daily climate readings if True, or only use the raw
+        data already in directory if False. The default is True.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing the recalculated daily climate averages by
+        Census division.
+    """
+    config = getConfig(config)
+    directory = config["directory"]
+    print("\nProject directory successfully set to: " + directory)
+    if config["recalc_mode"] == "changes":
+        return runChangedPipeline(config, fetch)
+    elif config["recalc_mode"] != "window":
+        raise ValueError("ERROR! Recalculation mode must be one of \"window\" or \"changes\".")
+    if config["stream_master"]:
+        return runStreamedPipeline(config, fetch)
+
+    # Check if averages have been calculated before (only the last recalc_days days, or the days since the
+    # last pull if it is older, are then recalculated)
+    output_exists = getOutputExists(config)
+    start = getRecalcStart(config)
+    report = {"started": datetime.now().isoformat(timespec = "seconds"), "output_exists": output_exists}
+
+    # Pull today's data and change variable type for columns that are float or int
+    print("\nGetting latest climate data...")
+    startStage(report, "fetch", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    files, master = fetchClimate(config, start, fetch)
+    endStage(report, None if master is None else len(master))
+    load_start = start if config["master_format"] != "csv" else config["start_date"]
+    master, master_hash = runCachedStage(config, report, "convert",
+                                         [getFileHash(files), config["master_format"], str(load_start), 
+                                          getClimateColumns(config)],
+                                         None if master is None else len(master),
+                                         loadClimate, config, files, master, start)
+
+    # Generate subdivisions climate averages data
+    print("\nGetting subdivisions climate variable averages...")
+    startStage(report, "boundaries", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    subdivisions, sd_list, sd_hash, pop = loadSubdivisions(config)
+    endStage(report, len(sd_list))
+    if config["cd_engine"] == "sparse":
+        print("\nGetting divisions averages, weighted by subdivision population...")
+        df_cd, df_cd_hash = runCachedStage(config, report, "divisions",
+                                           [master_hash, sd_hash, getFrameHash(pop), str(start), 
+                                            str(config["end_date"]), config["num_district"], config["cd_engine"],
+                                            config["variables"], config["exclude_flags"]],
+                                           len(master), getSparseDivisionAverages, config, master, subdivisions,
+                                           sd_list, sd_hash, pop, start)
+    else:
+        df, df_hash = runCachedStage(config, report, "subdivisions",
+                                     [master_hash, sd_hash, str(start), str(config["end_date"]), config["sd_engine"],
+                                      config["sd_format"], config["variables"], config["exclude_flags"]],
+                                     len(master), getSubdivisionAverages, config, master, subdivisions, sd_list,
+                                     sd_hash, start)
+        print("\nSubdivisions averages dataset complete.")
+
+        # Generate divisions climate averages data, weighted by subdivision population
+        print("\nGetting divisions averages, weighted by subdivision population...")
+        df_cd, df_cd_hash = runCachedStage(config, report, "divisions",
+                                           [df_hash, getFrameHash(pop), str(start), str(config["end_date"]),
+                                            config["num_district"], config["cd_engine"], config["variables"]],
+                                           getRowCount(df), getDivisionAverages, config, df, pop, start)
+
+    # Fill divisions with no weather stations or failed weather stations
+    df_cd, fill_hash = runCachedStage(config, report, "fill",
+                                      [df_cd_hash, getFileHash(getDivisionFiles(config)[1]),
+                                       config["num_district"], config["fill_engine"]],
+                                      len(df_cd), fillDivisionGaps, config, df_cd)
+
+    # Save final data set unless the same averages have already been saved to the output
+    print("\nSaving final divisions averages dataset...")
+    startStage(report, "save", len(df_cd), config["profile_stage"], config["output_dir"])
+    save_key = hashlib.sha256(str(["save", fill_hash, str(start), str(config["end_date"]), config["output_dir"],
+                                   config["output_format"], config["outputfile"], config["output_store"],
+                                   config["export_csv"]]).encode("utf-8")).hexdigest()
+    save_file = None
+    saved = False
+    if config["stage_cache"] is not None:
+        save_file = os.path.join(directory, config["stage_cache"], "save.key")
+        if output_exists and os.path.exists(save_file):
+            with open(save_file) as f:
+                saved = f.read() == save_key
+    if saved:
+        rows_saved = None
+        print("\nInputs of save stage unchanged, final divisions averages dataset already saved.")
+    else:
+        rows_saved = saveDivisionAverages(config, df_cd, start)
+        if save_file is not None:
+            with open(save_file, "w") as f:
+                f.write(save_key)
+        print("\nFinal divisions averages dataset successfully saved.")
+    endStage(report, rows_saved)
+    report["stages"][-1]["cached"] = saved
+
+    # Update the indexed binary output if the output has changed
+    if config["output_index"] is not None:
+        startStage(report, "index", rows_saved, config["profile_stage"], config["output_dir"])
+        index_exists = os.path.exists(os.path.join(config["output_dir"], config["output_index"], "index.json"))
+        rows_indexed = None
+        if not (saved and index_exists):
+            rows_indexed = saveDivisionIndex(config)
+            print("\nIndexed divisions averages saved to " + config["output_index"] + ".")
+        endStage(report, rows_indexed)
+        report["stages"][-1]["cached"] = saved and index_exists
+
+    # Save run report
+    saveRunReport(report, os.path.join(config["output_dir"], config["run_report"]))
+    print("\nRun report saved to " + config["run_report"] + ".")
+    return df_cd
+
+###############################################################################
+# DEFINE BACKFILL FUNCTIONS
+
+# Data shared by all backfill worker processes (set once per process by initBackfillWorker)
+backfill_data = {}
+
+# Define function to split a date range into month or year chunks
+def getDateChunks(start_date, end_date, chunk = "month"):
+    """
+    Returns list of (first date, last date) tuples of the calendar months (or
+    years) between start_date and end_date, clipped to start_date and 
+    end_date.
+
+    Parameters
+    ----------
+    start_date : datetime
+        First date.
+    end_date : datetime
+        Last date.
+    chunk : str, optional
+        Length of the chunks, "month" or "year". The default is "month".
+
+    Raises
+    ------
+    ValueError
+        If chunk is not one of "month" or "year" or end_date is before
+        start_date.
+
+    Returns
+    -------
+    list of tuples (datetime, datetime)
+        First and last date of each chunk.
+    """
+    if chunk not in ["month", "year"]:
+        raise ValueError("ERROR! Backfill chunks must be one of \"month\" or \"year\".")
+    if end_date < start_date:
+        raise ValueError("ERROR! Backfill end date " + str(end_date) + " is before start date " + str(start_date) + ".")
+    periods = pd.period_range(start = start_date, end = end_date, freq = "M" if chunk == "month" else "Y")
+    return [(max(period.start_time.date(), start_date), min(period.end_time.date(), end_date)) for period in periods]
+
+# Define function to calculate the divisions climate averages of one chunk of dates
+def getChunkDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, first, last, matches = None,
+                             check = True):
+    """
+    Returns dataframe of daily climate averages by Census division between 
+    first and last, without dates that have too few divisions with 
+    observations if check is True, calculated from the readings of master 
+    with the stages of runPipeline.
+    """
+    config = {**config, "end_date": last}
+    if config["cd_engine"] == "sparse":
+        return getSparseDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, first,
+                                         matches = matches, check = check)
+    df = getSubdivisionAverages(config, master, subdivisions, sd_list, sd_hash, first, matches = matches)
+    return getDivisionAverages(config, df, pop, first, check = check)
+
+# Define function to load the data shared by all backfill worker processes once per process
+def initBackfillWorker(config, master, matches):
+    """
+    Stores config, the daily climate readings (or None to load each chunk
+    from the climate store) and the station to subdivision matches, and loads
+    the Census subdivisions boundaries and population estimates, for 
+    getBackfillChunk.
+    """
+    subdivisions, sd_list, sd_hash, pop = loadSubdivisions(config)
+    backfill_data.update({"config": config, "master": master, "matches": matches, "subdivisions": subdivisions,
+                          "sd_list": sd_list, "sd_hash": sd_hash, "pop": pop})
+
+# Define function to calculate the divisions climate averages of one backfill chunk
+def getBackfillChunk(dates):
+    """
+    Returns dataframe of daily climate averages by Census division between the
+    first and last date of dates, without dates that have too few divisions 
+    with observations, calculated with the stages of runPipeline. The 
+    averages of each day only depend on the readings of that day, so they are
+    the same as when calculated in one pass.
+    """
+    first, last = dates
+    config = backfill_data["config"]
+    if backfill_data["master"] is None:
+        master = loadClimateStore(os.path.join(config["directory"], config["climate_store"]), first, last,
+                                  columns = getClimateColumns(config))
+    else:
+        master = backfill_data["master"]
+        master = master[(master.LOCAL_DATE >= pd.Timestamp(first)) & (master.LOCAL_DATE <= pd.Timestamp(last))]
+    return getChunkDivisionAverages(config, master, backfill_data["subdivisions"], backfill_data["sd_list"],
+                                    backfill_data["sd_hash"], backfill_data["pop"], first, last,
+                                    matches = backfill_data["matches"])
+
+# Define function to recalculate a date range of the output in parallel chunks
+def runBackfill(config = None, start_date = None, end_date = None, chunk = "month", workers = 4):
+    """
+    Recalculates the daily population weighted climate averages by Census
+    division between start_date and end_date from the raw daily climate data
+    already pulled (see runPipeline), e.g. after a change of methodology. The
+    date range is split into month (or year) chunks whose divisions averages
+    are calculated by up to workers processes, the gaps of all chunks are 
+    filled at once, and the results replace the dates of the range in the
+    output file (or only the monthly files of the range in the output store).
+    Sparse dates and gap filling are decided day by day, so the results are
+    the same as those of one pass over the whole range.
+
+    Parameters
+    ----------
+    config : dictionary, optional
+        Configuration values to use instead of the defaults (see 
+        default_config). The default is None.
+    start_date : datetime, optional
+        First date to recalculate, or None for the start_date of config. The
+        default is None.
+    end_date : datetime, optional
+        Last date to recalculate, or None for the end_date of config. The
+        default is None.
+    chunk : str, optional
+        Length of the chunks, "month" or "year". The default is "month".
+    workers : int, optional
+        Number of chunks calculated at the same time. The default is 4.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing the recalculated daily climate averages by
+        Census division.
+    """
+    config = getConfig(config)
+    dates = getConfig({**config, "start_date": start_date or config["start_date"], 
+                       "end_date": end_date or config["end_date"]})
+    start, end = dates["start_date"], dates["end_date"]
+    chunks = getDateChunks(start, end, chunk)
+    print("\nBackfilling " + str(start) + " to " + str(end) + " in " + str(len(chunks)) + " " + chunk + " chunks...")
+    report = {"started": datetime.now().isoformat(timespec = "seconds"), 
+              "backfill": {"start_date": str(start), "end_date": str(end), "chunk": chunk, "workers": workers}}
+
+    # Load the raw data already pulled and match its stations to subdivisions once for all chunks
+    startStage(report, "boundaries", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    subdivisions, sd_list, sd_hash, pop = loadSubdivisions(config)
+    if config["master_format"] == "csv":
+        files, master = fetchClimate(config, start, pull = False)
+        master = loadClimate(config, files, master, start)
+        stations = master
+    else:
+        master = None
+        stations = loadClimateStore(os.path.join(config["directory"], config["climate_store"]), start, end,
+                                    columns = ["CLIMATE_IDENTIFIER", "x", "y"])
+    matches = getStationMatches(config, stations, subdivisions, sd_list, sd_hash)
+    endStage(report, len(matches))
+
+    # Calculate the chunks in parallel
+    startStage(report, "chunks", None if master is None else len(master), config["profile_stage"], config["output_dir"])
+    if workers > 1 and len(chunks) > 1:
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        with ProcessPoolExecutor(max_workers = min(workers, len(chunks)), mp_context = context, 
+                                 initializer = initBackfillWorker, initargs = (config, master, matches)) as executor:
+            data = list(executor.map(getBackfillChunk, chunks))
+    else:
+        initBackfillWorker(config, master, matches)
+        data = [getBackfillChunk(dates) for dates in chunks]
+        backfill_data.clear()
+    df_cd = pd.concat(data, ignore_index = True)
+    endStage(report, len(df_cd))
+
+    # Order the averages of all chunks by division and date, as in one pass
+    df_cd = df_cd.iloc[pd.factorize(df_cd.cduid)[0].argsort(kind = "stable")].reset_index(drop = True)
+
+    # Fill divisions with no weather stations or failed weather stations in all chunks at once, so the
+    # averages of the closest divisions are summed in the same order as in one pass
+    startStage(report, "fill", len(df_cd), config["profile_stage"], config["output_dir"])
+    df_cd = fillDivisionGaps({**config, "end_date": end}, df_cd)
+    endStage(report, len(df_cd))
+
+    # Replace the dates of the range in the output
+    print("\nSaving backfilled divisions averages...")
+    startStage(report, "save", len(df_cd), config["profile_stage"], config["output_dir"])
+    rows_saved = saveDivisionAverages(config, df_cd, start, end)
+
+    # Remove the save stage marker, so the next daily run saves its averages again
+    if config["stage_cache"] is not None:
+        save_file = os.path.join(config["directory"], config["stage_cache"], "save.key")
+        if os.path.exists(save_file):
+            os.remove(save_file)
+    endStage(report, rows_saved)
+    print("\nBackfilled divisions averages successfully saved.")
+    if config["output_index"] is not None:
+        startStage(report, "index", rows_saved, config["profile_stage"], config["output_dir"])
+        endStage(report, saveDivisionIndex(config))
+        print("\nIndexed divisions averages saved to " + config["output_index"] + ".")
+
+    # Save run report
+    saveRunReport(report, os.path.join(config["output_dir"], config["run_report"]))
+    print("\nRun report saved to " + config["run_report"] + ".")
+    return df_cd
+
+###############################################################################
+# DEFINE CHANGE DETECTION FUNCTIONS
+
+# Define function to split dates into runs of consecutive dates
+def getDateRuns(dates):
+    """
+    Returns list of (first date, last date) tuples of the runs of consecutive
+    dates in dates.
+    """
+    dates = pd.DatetimeIndex(sorted(set(dates)))
+    if len(dates) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(dates.values) != np.timedelta64(1, "D")) + 1
+    firsts = np.concatenate([[0], breaks])
+    lasts = np.concatenate([breaks, [len(dates)]]) - 1
+    return [(dates[a].date(), dates[b].date()) for a, b in zip(firsts, lasts)]
+
+# Define function to recalculate the divisions climate averages of changed divisions and dates
+def getChangedDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, matches, cells):
+    """
+    Returns dataframe of the daily population weighted climate averages by
+    Census division (before gap filling) of the divisions and dates of cells,
+    calculated with the stages of runPipeline one run of consecutive dates at
+    a time, from the subdivisions of the changed divisions only.
+    """
+    records = getBoundaryRecords(subdivisions)
+    sd_cduid = np.array([int(records[i][5]) for i in sd_list])
+    data = []
+    for first, last in getDateRuns(cells.date):
+        run = cells[(cells.date >= pd.Timestamp(first)) & (cells.date <= pd.Timestamp(last))]
+
+        # Keep the subdivisions of the changed divisions and the readings of their stations
+        keep = np.flatnonzero(np.isin(sd_cduid, run.cduid.unique()))
+        run_list = [sd_list[k] for k in keep]
+        run_matches = matches[matches.sd_pos.isin(keep)].copy()
+        run_matches["sd_pos"] = pd.Index(keep).get_indexer(run_matches.sd_pos)
+        in_run = (master.LOCAL_DATE >= pd.Timestamp(first)) & (master.LOCAL_DATE <= pd.Timestamp(last))
+        run_master = master[in_run & master.CLIMATE_IDENTIFIER.isin(run_matches.CLIMATE_IDENTIFIER)]
+        df_cd = getChunkDivisionAverages(config, run_master, subdivisions, run_list, sd_hash, pop, first, last,
+                                         matches = run_matches, check = False)
+        cell = pd.MultiIndex.from_arrays([df_cd.cduid, df_cd.date])
+        data.append(df_cd[cell.isin(pd.MultiIndex.from_arrays([run.cduid, run.date]))])
+    return pd.concat(data, ignore_index = True)
+
+# Define function to merge changed divisions averages into divisions averages read from the output
+def mergeDivisionCells(df_cd, df_cells, dropped):
+    """
+    Returns df_cd without the dates of dropped and with the averages of the 
+    divisions and dates of df_cells replaced, sorted by division and date.
+    """
+    df_cd = df_cd.reindex(columns = df_cells.columns)
+    df_cd = df_cd[~df_cd.date.isin(dropped)]
+    df_cd = pd.concat([df_cd, df_cells], ignore_index = True)
+    df_cd = df_cd.drop_duplicates(subset = ["cduid", "date"], keep = "last")
+    return df_cd.sort_values(by = ["cduid", "date"], ignore_index = True)
+
+# Define function to replace the averages of single divisions and dates in the output
+def updateDivisionCells(config, df_cells, dates, dropped):
+    """
+    Replaces the averages of the divisions and dates of df_cells in the 
+    output file (or store) and removes the dates of dropped (see 
+    mergeDivisionCells). Only the monthly files of the runs of consecutive 
+    dates of dates are read and rewritten in the output store. Returns the 
+    number of rows in the output file (or of df_cells for the store).
+    """
+    output_dir = config["output_dir"]
+    outputfile = os.path.join(output_dir, config["outputfile"])
+    if not getOutputExists(config):
+        return saveDivisionAverages(config, df_cells, config["start_date"])
+    if config["output_format"] == "csv":
+        df_cd = pd.read_csv(outputfile, parse_dates = ["date"], float_precision = "round_trip")
+        df_cd = mergeDivisionCells(df_cd, df_cells, dropped)
+        df_cd.to_csv(outputfile, index = False)
+        return len(df_cd)
+    output_store = os.path.join(output_dir, config["output_store"])
+    for first, last in getDateRuns(dates):
+        df_cd = mergeDivisionCells(loadPartitions(output_store, "date", first, last), df_cells, dropped)
+        savePartitions(df_cd, output_store, first, last, "date", ["cduid", "date"])
+    if config["export_csv"]:
+        exportPartitions(output_store, "date", ["cduid", "date"], outputfile)
+    return len(df_cells)
+
+# Define function to run the pipeline on the divisions and dates whose readings changed since the last run
+def runChangedPipeline(config = None, fetch = True):
+    """
+    Pulls the latest daily climate readings and recalculates only the daily
+    population weighted climate averages by Census division that depend on
+    readings added, revised or removed since the last run, instead of the 
+    last recalc_days days (see runPipeline). Each reading is hashed and 
+    compared to the hashes of the last run saved to change_state, giving the
+    changed subdivisions and dates, then the changed divisions and dates, and
+    then the divisions whose gaps are filled with the changed divisions (see
+    getFillDependents). Only the averages of those divisions and dates are 
+    replaced in the output. The divisions averages before gap filling are 
+    also kept in change_state, so that sparse dates and gaps are decided with
+    all divisions of each changed date, as in one pass. All dates are 
+    calculated if there is no change state yet or if the boundaries, 
+    population estimates or averaging settings have changed since it was 
+    saved.
+
+    Parameters
+    ----------
+    config : dictionary, optional
+        Configuration values to use instead of the defaults (see
+        default_config). The default is None.
+    fetch : bool, optional
+        Pull the latest daily climate readings if True, or only use the raw
+        data already in directory if False. The default is True.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing the recalculated daily climate averages by
+        Census division.
+    """
+    config = getConfig(config)
+    directory = config["directory"]
+    start, end = config["start_date"], config["end_date"]
+    report = {"started": datetime.now().isoformat(timespec = "seconds"), "output_exists": getOutputExists(config),
+              "recalc_mode": "changes"}
+
+    # Load the boundaries first, as the change state is only valid for the same boundaries and settings
+    startStage(report, "boundaries", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    subdivisions, sd_list, sd_hash, pop = loadSubdivisions(config)
+    records = getBoundaryRecords(subdivisions)
+    pop_sds = set(pop.csduid)
+    cduid_list = list(dict.fromkeys(int(records[i][5]) for i in sd_list if int(records[i][0]) in pop_sds))
+    neighbours = loadDivisionNeighbours(config, cduid_list)
+    endStage(report, len(sd_list))
+    state_file = os.path.join(directory, config["change_state"])
+    fingerprint = hashlib.sha256(str([sd_hash, getFrameHash(pop), getFileHash(getDivisionFiles(config)[1]),
+                                      str(start), config["num_district"], config["variables"],
+                                      config["exclude_flags"]]).encode("utf-8")).hexdigest()
+    state = None
+    if report["output_exists"] and os.path.exists(state_file):
+        state = pd.read_pickle(state_file)
+        if state["fingerprint"] != fingerprint:
+            print("\nBoundaries or settings changed since the last run, recalculating all dates...")
+            state = None
+    load_start = start
+    if state is not None and config["master_format"] != "csv" and config["fetch_mode"] == "incremental":
+        load_start = getFetchStart(config, getLastPull(config))
+
+    # Pull today's data and change variable type for columns that are float or int
+    print("\nGetting latest climate data...")
+    startStage(report, "fetch", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    files, master = fetchClimate(config, load_start, fetch)
+    endStage(report, None if master is None else len(master))
+    startStage(report, "convert", None if master is None else len(master), config["profile_stage"], config["output_dir"])
+    master = loadClimate(config, files, master, load_start)
+    endStage(report, len(master))
+
+    # Find the divisions and dates whose averages depend on readings changed since the last run
+    print("\nFinding readings changed since the last run...")
+    startStage(report, "changes", len(master), config["profile_stage"], config["output_dir"])
+    hashes = getReadingHashes(master)
+    stations = master[["CLIMATE_IDENTIFIER", "x", "y"]]
+    if state is not None:
+        changed = getChangedReadings(hashes, state["hashes"], load_start, end)
+        stations = pd.concat([stations, changed[["CLIMATE_IDENTIFIER", "x", "y"]]], ignore_index = True)
+    matches = getStationMatches(config, stations, subdivisions, sd_list, sd_hash)
+    if state is None:
+        cells = pd.MultiIndex.from_product([cduid_list, pd.date_range(start, end)], names = ["cduid", "date"])
+        cells = cells.to_frame(index = False)
+    else:
+        sd_cells = getChangedSubdivisionDays(changed, matches, subdivisions, sd_list)
+        print("\n" + str(len(changed)) + " readings changed in " + str(len(sd_cells)) + " subdivisions and dates.")
+
+        # Dates after the last run are calculated for all divisions
+        new_dates = pd.date_range(state["end_date"] + timedelta(1), end)
+        cells = pd.concat([sd_cells[["cduid", "date"]],
+                           pd.MultiIndex.from_product([cduid_list, new_dates], names = ["cduid", "date"]).to_frame(index = False)],
+                          ignore_index = True).drop_duplicates(ignore_index = True)
+        cells = cells[cells.cduid.isin(cduid_list) & (cells.date >= pd.Timestamp(start)) & (cells.date <= pd.Timestamp(end))]
+        kept_hashes = (state["hashes"].LOCAL_DATE < pd.Timestamp(load_start)) | (state["hashes"].LOCAL_DATE > pd.Timestamp(end))
+        hashes = pd.concat([state["hashes"][kept_hashes], hashes], ignore_index = True)
+    dates = pd.DatetimeIndex(sorted(set(cells.date)))
+    endStage(report, len(cells))
+    print("\n" + str(len(cells)) + " divisions and dates depend on changed readings.")
+
+    # Recalculate the divisions averages of changed divisions and dates, keeping all divisions averages
+    # before gap filling in the change state
+    print("\nGetting divisions averages of changed divisions and dates...")
+    startStage(report, "divisions", len(cells), config["profile_stage"], config["output_dir"])
+    divisions = None if state is None else state["divisions"]
+    df_cd = pd.DataFrame(columns = ["cduid", "date"] + list(getClimateVars(config["variables"])))
+    if len(cells) > 0:
+        df_changed = getChangedDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, matches, cells)
+        old_days = df_changed.iloc[:0] if divisions is None else divisions[divisions.date.isin(dates)]
+        divisions = pd.concat([divisions, df_changed], ignore_index = True)
+        divisions = divisions.drop_duplicates(subset = ["cduid", "date"], keep = "last")
+        position = {uid: k for k, uid in enumerate(cduid_list)}
+        divisions = divisions.iloc[np.lexsort((divisions.date.values, divisions.cduid.map(position).values))]
+        divisions = divisions.reset_index(drop = True)
+        new_days = divisions[divisions.date.isin(dates)]
+    endStage(report, 0 if len(cells) == 0 else len(df_changed))
+
+    # Fill gaps of the changed dates, keeping the changed divisions, the divisions whose gaps are filled
+    # with them and all divisions of dates that were sparse before
+    startStage(report, "fill", len(cells), config["profile_stage"], config["output_dir"])
+    if len(cells) > 0:
+        col = list(getClimateVars(config["variables"]))[0]
+        kept = dropSparseDates(new_days, len(cduid_list), config["num_district"], col)
+        was_kept = dropSparseDates(old_days, len(cduid_list), config["num_district"], col).date.unique()
+        df_cd = fillDivisionGaps(config, kept, neighbours)
+        dependents = getFillDependents(old_days, new_days, cells, neighbours, config["num_district"])
+        update = pd.concat([cells, dependents], ignore_index = True)
+        cell = pd.MultiIndex.from_arrays([df_cd.cduid, df_cd.date])
+        df_cd = df_cd[cell.isin(pd.MultiIndex.from_arrays([update.cduid, update.date])) | ~df_cd.date.isin(was_kept)]
+        df_cd = df_cd.reset_index(drop = True)
+        dropped = dates[~dates.isin(kept.date)]
+    endStage(report, len(df_cd))
+
+    # Replace the changed averages in the output, then save the change state
+    print("\nSaving changed divisions averages...")
+    startStage(report, "save", len(df_cd), config["profile_stage"], config["output_dir"])
+    rows_saved = None
+    if len(cells) > 0:
+        rows_saved = updateDivisionCells(config, df_cd, dates, dropped)
+
+        # Remove the save stage marker, so the next run in window mode saves its averages again
+        if config["stage_cache"] is not None:
+            save_file = os.path.join(directory, config["stage_cache"], "save.key")
+            if os.path.exists(save_file):
+                os.remove(save_file)
+        print("\n" + str(len(df_cd)) + " divisions averages successfully saved.")
+    pd.to_pickle({"fingerprint": fingerprint, "end_date": end, "hashes": hashes, "divisions": divisions},
+                 state_file + ".tmp")
+    os.replace(state_file + ".tmp", state_file)
+    endStage(report, rows_saved)
+
+    # Update the indexed binary output if the output has changed
+    if config["output_index"] is not None:
+        startStage(report, "index", rows_saved, config["profile_stage"], config["output_dir"])
+        index_exists = os.path.exists(os.path.join(config["output_dir"], config["output_index"], "index.json"))
+        rows_indexed = None
+        if len(cells) > 0 or not index_exists:
+            rows_indexed = saveDivisionIndex(config)
+            print("\nIndexed divisions averages saved to " + config["output_index"] + ".")
+        endStage(report, rows_indexed)
+
+    # Save run report
+    saveRunReport(report, os.path.join(config["output_dir"], config["run_report"]))
+    print("\nRun report saved to " + config["run_report"] + ".")
+    return df_cd
+
+###############################################################################
+# DEFINE STREAMING FUNCTIONS
+
+# Define function to run the pipeline reading the daily climate readings one month at a time
+def runStreamedPipeline(config = None, fetch = True):
+    """
+    Runs the stages of runPipeline with the daily climate readings read one
+    month at a time instead of all at once, so that peak memory does not grow
+    with the length of the history. The latest readings are pulled and saved
+    one month at a time (see fetchClimate) and the CSV master file is then 
+    split into monthly files in stream_dir, reading at most about 
+    stream_memory_mb megabytes of readings at a time (see splitClimateFile),
+    while the monthly files of the climate store are read directly. The 
+    divisions averages of each month are calculated in turn and the gaps of 
+    all months are filled at once, as in runBackfill, so the results are the
+    same as those of runPipeline. Stages are not cached.
+
+    Parameters
+    ----------
+    config : dictionary, optional
+        Configuration values to use instead of the defaults (see
+        default_config). The default is None.
+    fetch : bool, optional
+        Pull the latest daily climate readings if True, or only use the raw
+        data already in directory if False. The default is True.
+
+    Returns
+    -------
+    dataframe
+        Panel dataframe containing the recalculated daily climate averages by
+        Census division.
+    """
+    config = getConfig(config)
+    directory = config["directory"]
+
+    # Check if averages have been calculated before (only the last recalc_days days, or the days since the
+    # last pull if it is older, are then recalculated)
+    output_exists = getOutputExists(config)
+    start, end = getRecalcStart(config), config["end_date"]
+    report = {"started": datetime.now().isoformat(timespec = "seconds"), "output_exists": output_exists,
+              "stream": {"memory_mb": config["stream_memory_mb"]}}
+
+    # Pull today's data, keeping only the path of the raw data
+    print("\nGetting latest climate data...")
+    startStage(report, "fetch", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    files, master = fetchClimate(config, start, fetch)
+    endStage(report, None if master is None else len(master))
+    master = None
+    startStage(report, "boundaries", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    subdivisions, sd_list, sd_hash, pop = loadSubdivisions(config)
+    endStage(report, len(sd_list))
+
+    # Split the CSV master file into monthly files, reading a bounded number of readings at a time
+    spill_dir = None
+    if config["master_format"] == "csv":
+        print("\nSplitting raw daily climate data into monthly files...")
+        startStage(report, "split", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+        spill_dir = os.path.join(directory, config["stream_dir"])
+        endStage(report, splitClimateFile(files[0], spill_dir, start, end, config["stream_memory_mb"]))
+
+    # Calculate the divisions averages of one month at a time; months without readings have no dates with
+    # enough divisions with observations
+    print("\nGetting divisions averages one month at a time...")
+    startStage(report, "chunks", profile_stage = config["profile_stage"], profile_dir = config["output_dir"])
+    data = []
+    rows_read = 0
+    for first, last in getDateChunks(start, end, "month"):
+        if spill_dir is None:
+            master = loadClimateStore(os.path.join(directory, config["climate_store"]), first, last,
+                                      columns = getClimateColumns(config))
+        else:
+            path = os.path.join(spill_dir, str(pd.Period(first, "M")) + ".csv")
+            if not os.path.exists(path):
+                continue
+            master = convertClimateTypes(readClimateCSV(path, getClimateColumns(config)))
+        if len(master) == 0:
+            continue
+        rows_read += len(master)
+        matches = getStationMatches(config, master, subdivisions, sd_list, sd_hash)
+        data.append(getChunkDivisionAverages(config, master, subdivisions, sd_list, sd_hash, pop, first, last,
+                                             matches = matches))
+    master = None
+    if spill_dir is not None:
+        shutil.rmtree(spill_dir)
+    if len(data) == 0:
+        raise ValueError("ERROR! There are no daily climate readings between " + str(start) + " and " + str(end) + ".")
+    df_cd = pd.concat(data, ignore_index = True)
+    report["stages"][-1]["rows_in"] = rows_read
+    endStage(report, len(df_cd))
+
+    # Order the averages of all months by division and date and fill their gaps at once, as in one pass
+    df_cd = df_cd.iloc[pd.factorize(df_cd.cduid)[0].argsort(kind = "stable")].reset_index(drop = True)
+    startStage(report, "fill", len(df_cd), config["profile_stage"], config["output_dir"])
+    df_cd = fillDivisionGaps(config, df_cd)
+    endStage(report, len(df_cd))
+
+    # Save final data set
+    print("\nSaving final divisions averages dataset...")
+    startStage(report, "save", len(df_cd), config["profile_stage"], config["output_dir"])
+    rows_saved = saveDivisionAverages(config, df_cd, start)
+
+    # Remove the save stage marker, so the next cached run saves its averages again
+    if config["stage_cache"] is not None:
+        save_file = os.path.join(directory, config["stage_cache"], "save.key")
+        if os.path.exists(save_file):
+            os.remove(save_file)
+    endStage(report, rows_saved)
+    print("\nFinal divisions averages dataset successfully saved.")
+    if config["output_index"] is not None:
+        startStage(report, "index", rows_saved, config["profile_stage"], config["output_dir"])
+        endStage(report, saveDivisionIndex(config))
+        print("\nIndexed divisions averages saved to " + config["output_index"] + ".")
+
+    # Save run report
+    saveRunReport(report, os.path.join(config["output_dir"], config["run_report"]))
+    print("\nRun report saved to " + config["run_report"] + ".")
+    return df_cd
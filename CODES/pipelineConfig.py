@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+This script defines the default configuration of the daily Census divisions
+climate averages workflow (pipeline.py) and the function that completes a
+configuration. It only uses the standard library, so the configuration can be
+read and checked (e.g. by the status command of climateCLI.py) without 
+importing pandas or the boundary packages.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+from datetime import date, datetime
+
+###############################################################################
+# DEFINE DEFAULT CONFIGURATION
+
+# Census province codes (PRUID) of the climate-daily API province codes (PROVINCE_CODE)
+province_ids = {"NL": "10", "PE": "11", "NS": "12", "NB": "13", "QC": "24", "ON": "35", "MB": "46",
+                "SK": "47", "AB": "48", "BC": "59", "YT": "60", "NT": "61", "NU": "62"}
+
+# Default configuration of runPipeline (see getCDAverages.py for a description of each value);
+# output_dir defaults to the parent of directory and end_date to today
+default_config = {"directory": ".",
+                  "output_dir": None,
+                  "census_d": "census_divisions",
+                  "census_sd": "census_subdivisions",
+                  "geometry_bundle": "ontario_geometry",
+                  "sd_grid": "census_subdivisions_grid.npz",
+                  "pop_sd": "subdivisions_pop",
+                  "station_cache": "station_subdivisions.csv",
+                  "stage_cache": "stage_cache",
+                  "api_url": "https://api.weather.gc.ca/collections/climate-daily/items",
+                  "province": "ON",
+                  "start_date": date(2018, 1, 1),
+                  "end_date": None,
+                  "recalc_days": 10,
+                  "recalc_mode": "window",
+                  "change_state": "change_state.pkl",
+                  "fetch_mode": "incremental",
+                  "fetch_window": 30,
+                  "fetch_workers": 4,
+                  "fetch_checkpoint": "daily_climate_pages",
+                  "master_format": "csv",
+                  "climate_store": "daily_climate_store",
+                  "stream_master": False,
+                  "stream_memory_mb": 512,
+                  "stream_dir": "daily_climate_chunks",
+                  "outputfile": "daily_cd_climate.csv",
+                  "output_format": "csv",
+                  "output_store": "daily_cd_climate_store",
+                  "export_csv": False,
+                  "output_index": None,
+                  "num_district": 3,
+                  "variables": None,
+                  "exclude_flags": None,
+                  "sd_engine": "strtree",
+                  "sd_workers": 1,
+                  "sd_format": "frame",
+                  "cd_engine": "groupby",
+                  "fill_engine": "array",
+                  "run_report": "daily_cd_climate_report.json",
+                  "profile_stage": None}
+
+# Define function to complete a configuration with the default values
+def getConfig(config = None):
+    """
+    Returns a copy of config with default values (see default_config) for
+    missing keys and start_date and end_date converted to dates.
+
+    Parameters
+    ----------
+    config : dictionary, optional
+        Configuration values to use instead of the defaults. The default is
+        None.
+
+    Raises
+    ------
+    ValueError
+        If config contains a key that is not a configuration value or an 
+        unknown province.
+
+    Returns
+    -------
+    dictionary
+        Complete configuration.
+    """
+    config = dict(config or {})
+    unknown = [key for key in config if key not in default_config]
+    if len(unknown) > 0:
+        raise ValueError("ERROR! Unknown configuration values: " + str(unknown))
+    config = {**default_config, **config}
+    if config["province"] is not None and config["province"] not in province_ids:
+        raise ValueError("ERROR! Province must be one of " + str(list(province_ids)) + " or None for all provinces.")
+    if config["output_dir"] is None:
+        config["output_dir"] = os.path.join(config["directory"], "..")
+    if config["end_date"] is None:
+        config["end_date"] = date.today()
+    for key in ["start_date", "end_date"]:
+        if isinstance(config[key], str):
+            config[key] = datetime.fromisoformat(config[key])
+        if isinstance(config[key], datetime):
+            config[key] = config[key].date()
+    return config
+
+# Define function to check if the divisions averages have been calculated before
+def getOutputExists(config):
+    """
+    Returns True if the output file (or store) of config already exists, in
+    which case only the last recalc_days days are recalculated.
+    """
+    if config["output_format"] == "csv":
+        return os.path.exists(os.path.join(config["output_dir"], config["outputfile"]))
+    else:
+        return os.path.exists(os.path.join(config["output_dir"], config["output_store"]))
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+This script benchmarks the stages of getCDAverages.py on synthetic weather
+station readings and Census boundaries at several sizes, without network
+access. Each stage is timed for the current and original ("loop") engines,
+and the results of the two are checked to be exactly the same (both read
+boundaries with all their parts, so results for boundaries with several
+parts differ from data sets published before October 2026; see README.md);
+gap filling is checked against the original per-day search for the closest
+divisions. One subdivision has two parts, and the averages of a list of
+variables with flagged readings excluded are also checked. Timings are
+appended to a CSV file (ignored by git) so that regressions are visible
+between runs.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# DEFINE REQUIRED VARIABLES
+
+# Sizes to benchmark (number of days, number of weather stations, number of Census divisions, number
+# of subdivisions across each division); the last two are a national daily update (11 days 
+# recalculated, about 5,000 subdivisions and 290 divisions) and a national year
+scales = [(10, 50, 12, 2), (30, 200, 49, 2), (365, 500, 49, 3), (1730, 500, 49, 3), (11, 1500, 290, 4),
+          (365, 1500, 290, 4)]
+
+# Largest number of days and subdivisions for which to also run the original engines (they scale 
+# with days x subdivisions x stations)
+legacy_max_days = 30
+legacy_max_subdivisions = 200
+
+# Time limit in seconds of all stages of a daily update (at most 11 days) with the current engines
+time_limit = 60
+
+# Number of districts to average if no weather station or if weather station not working
+num_district = 3
+
+# Share of missing station readings
+missing_share = 0.05
+
+# Share of station readings flagged as estimated (flag E)
+estimated_share = 0.05
+
+# Climate variables and flags of readings to exclude checked with variables and exclude_flags
+flag_variables = ["MEAN_TEMPERATURE", "TOTAL_PRECIPITATION", "SNOW_ON_GROUND"]
+flag_exclude = ["E"]
+
+# Output file (benchmark timings, appended to on every run; ignored by git)
+outputfile = "benchmark_results.csv"
+
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import os
+import time
+import pandas as pd
+import numpy as np
+from datetime import date, datetime, timedelta
+from shapely.geometry import Polygon, MultiPolygon
+from functions import (getSDAvgs, getSDAvgsCompact, getCDAvgs, getCDAvgsCompact, getCDAvgsSparse, dropSparseDates, getDivisionNeighbours, closestDivisions, 
+                       fillDivisions, getAvg, getClimateVars)
+
+###############################################################################
+# DEFINE SYNTHETIC DATA FUNCTIONS
+
+# Define function to get synthetic Census division and subdivision boundaries
+def getSyntheticBoundaries(num_cds, sd_split = 2):
+    """
+    Returns geometry bundles (see loadGeometryBundle) of a grid of num_cds
+    square Census divisions over Ontario, each split into a grid of sd_split x
+    sd_split subdivisions. The first and last subdivisions of the first 
+    division are one subdivision with two parts (a multipolygon), as islands
+    are in the Census boundaries.
+
+    Parameters
+    ----------
+    num_cds : int
+        Number of Census divisions.
+    sd_split : int, optional
+        Number of subdivisions across each division. The default is 2.
+
+    Returns
+    -------
+    subdivisions : dataframe
+        Geometry bundle of Census subdivisions.
+    divisions : dataframe
+        Geometry bundle of Census divisions.
+    """
+    num_x = int(np.ceil(np.sqrt(num_cds)))
+    width = 14 / num_x
+    sd_rows = []
+    cd_rows = []
+    for k in range(num_cds):
+        cduid = str(3500 + k + 1)
+        x0 = -90 + (k % num_x) * width
+        y0 = 42 + (k // num_x) * width
+        cd_rows.append([cduid, "CD " + cduid, "CDR", "35", "Ontario",
+                        Polygon([(x0, y0), (x0, y0 + width), (x0 + width, y0 + width), (x0 + width, y0)])])
+        sd_width = width / sd_split
+        squares = []
+        for s in range(sd_split ** 2):
+            sx = x0 + (s % sd_split) * sd_width
+            sy = y0 + (s // sd_split) * sd_width
+            squares.append(Polygon([(sx, sy), (sx, sy + sd_width), (sx + sd_width, sy + sd_width), (sx + sd_width, sy)]))
+        if k == 0:
+            squares = [MultiPolygon([squares[0], squares[-1]])] + squares[1:-1]
+        for s, square in enumerate(squares):
+            sd_rows.append([cduid + str(s + 1).zfill(3), "CSD", "MU", "35", "Ontario", cduid, square])
+    subdivisions = pd.DataFrame(sd_rows, columns = ["CSDUID", "CSDNAME", "CSDTYPE", "PRUID", "PRNAME",
+                                                    "CDUID", "geometry"])
+    divisions = pd.DataFrame(cd_rows, columns = ["CDUID", "CDNAME", "CDTYPE", "PRUID", "PRNAME", "geometry"])
+    return subdivisions, divisions
+
+# Define function to get synthetic daily climate readings
+def getSyntheticMaster(num_days, num_stations, num_cds, seed = 0):
+    """
+    Returns dataframe of synthetic daily climate readings with the columns of
+    the climate-daily API, converted as in getCDAverages.py. Stations are
+    placed at random over the boundaries of getSyntheticBoundaries, some
+    readings are missing or flagged as estimated (flag E) and some stations 
+    do not report every day. The first station is placed on the second part
+    of the two-part subdivision of getSyntheticBoundaries.
+
+    Parameters
+    ----------
+    num_days : int
+        Number of days ending today.
+    num_stations : int
+        Number of weather stations.
+    num_cds : int
+        Number of Census divisions.
+    seed : int, optional
+        Random seed. The default is 0.
+
+    Returns
+    -------
+    dataframe
+        Dataframe containing daily climate readings.
+    """
+    rng = np.random.default_rng(seed)
+    num_x = int(np.ceil(np.sqrt(num_cds)))
+    num_y = int(np.ceil(num_cds / num_x))
+    width = 14 / num_x
+    x = np.round(rng.uniform(-90, -90 + num_x * width, num_stations), 4)
+    y = np.round(rng.uniform(42, 42 + num_y * width, num_stations), 4)
+    x[0], y[0] = round(-90 + 0.95 * width, 4), round(42 + 0.95 * width, 4)
+    dates = pd.date_range(end = pd.Timestamp(date.today()), periods = num_days)
+    station = np.repeat(np.arange(num_stations), num_days)
+    local_date = np.tile(dates.values, num_stations)
+    keep = rng.random(len(station)) > missing_share
+    station, local_date = station[keep], local_date[keep]
+    n = len(station)
+    master = pd.DataFrame({"x": x[station], "y": y[station],
+                           "STATION_NAME": ["Station " + str(s) for s in station],
+                           "CLIMATE_IDENTIFIER": [str(6100000 + s) for s in station],
+                           "ID": [str(6100000 + s) + "." + str(d)[:10] for s, d in zip(station, local_date)],
+                           "LOCAL_DATE": local_date, "PROVINCE_CODE": "ON",
+                           "LOCAL_YEAR": pd.DatetimeIndex(local_date).year,
+                           "LOCAL_MONTH": pd.DatetimeIndex(local_date).month,
+                           "LOCAL_DAY": pd.DatetimeIndex(local_date).day})
+    for var, mean in [("MEAN_TEMPERATURE", 5), ("MIN_TEMPERATURE", -2), ("MAX_TEMPERATURE", 12),
+                      ("TOTAL_PRECIPITATION", 2), ("SNOW_ON_GROUND", 10)]:
+        values = np.round(rng.normal(mean, 5, n), 1)
+        values[rng.random(n) < missing_share] = np.nan
+        master[var] = values
+        master[var + "_FLAG"] = np.where(np.isnan(values), "M", np.where(rng.random(n) < estimated_share, "E", ""))
+    return master
+
+# Define function to fill missing division climate variables as the original code did
+def originalFill(df_cd, divisions, num_closest):
+    """
+    Returns df_cd with missing climate variables filled as in the original 
+    getCDAverages.py: for each variable, division and day to fill, the 
+    num_closest closest divisions with data on that day are searched again 
+    with closestDivisions and their values averaged with getAvg.
+    """
+    col_names = list(df_cd.columns)
+    polygons = {int(uid): polygon for uid, polygon in zip(divisions.CDUID, divisions.geometry)}
+    for v in range(2, len(col_names)):
+        data = []
+        fill = dict()
+        sub_df_cd = df_cd
+        for j in df_cd.index:
+            if str(df_cd.loc[j].iloc[v]) == "nan":
+                fill[(df_cd.loc[j].cduid, df_cd.loc[j].date)] = list(df_cd.loc[j].values)
+                sub_df_cd = sub_df_cd.drop(j)
+        for uid in list(dict.fromkeys(list(key[0] for key in fill.keys()))):
+            for single_date in list(key[1] for key in fill.keys() if key[0] == uid):
+                sub_data = fill[(uid, single_date)]
+                sub_df = sub_df_cd[sub_df_cd.date == single_date]
+                centroids = {cd: polygons[cd].centroid for cd in polygons if cd in set(sub_df.cduid)}
+                closest = closestDivisions({uid: polygons[uid]}, centroids, num_closest)
+                sub_data[v] = getAvg(sub_df[sub_df.cduid.isin(closest[uid])], v)
+                data.append(sub_data)
+        df_cd = pd.concat([sub_df_cd, pd.DataFrame(data, columns = col_names)], ignore_index = True)
+    return df_cd
+
+# Define function to check that two dataframes of averages contain the same numbers
+def sameResults(df1, df2, cols, atol = 0):
+    """
+    Returns True if columns cols of df1 and df2 are exactly equal (nan equal
+    to nan, or equal up to atol if atol is given, e.g. for float32 averages)
+    after sorting both by all other columns.
+    """
+    keys = [c for c in df1.columns if c not in cols and c != "wsuid_list"]
+    df1 = df1.sort_values(by = keys, ignore_index = True)
+    df2 = df2.sort_values(by = keys, ignore_index = True)
+    if len(df1) != len(df2) or not (df1[keys].astype(str).values == df2[keys].astype(str).values).all():
+        return False
+    values1, values2 = df1[cols].to_numpy(dtype = float), df2[cols].to_numpy(dtype = float)
+    if atol == 0:
+        return np.array_equal(values1, values2, equal_nan = True)
+    return np.allclose(values1, values2, rtol = 0, atol = atol, equal_nan = True)
+
+###############################################################################
+# RUN BENCHMARKS
+results = []
+run_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+var_cols = ["avg_temp", "min_temp", "max_temp", "avg_precip"]
+for num_days, num_stations, num_cds, sd_split in scales:
+    subdivisions, divisions = getSyntheticBoundaries(num_cds, sd_split)
+    print("\nBenchmarking " + str(num_days) + " days, " + str(num_stations) + " stations, " +
+          str(num_cds) + " divisions, " + str(len(subdivisions)) + " subdivisions...")
+    legacy = num_days <= legacy_max_days and len(subdivisions) <= legacy_max_subdivisions
+    master = getSyntheticMaster(num_days, num_stations, num_cds)
+    id_list = list(range(len(subdivisions)))
+    start = date.today() - timedelta(num_days - 1)
+    today = date.today()
+    pop = pd.DataFrame({"cduid": subdivisions.CDUID.astype(int), "csdname": subdivisions.CSDNAME,
+                        "csduid": subdivisions.CSDUID.astype(int),
+                        "pop": np.random.default_rng(1).integers(100, 100000, len(subdivisions))})
+
+    # Time each stage with the current engine and, for small sizes, the original engine
+    def timeStage(stage, label, function, *args, **kwargs):
+        t0 = time.perf_counter()
+        output = function(*args, **kwargs)
+        seconds = time.perf_counter() - t0
+        results.append([run_time, num_days, num_stations, num_cds, len(subdivisions), stage, label, seconds])
+        print(stage + " (" + label + "): " + str(round(seconds, 3)) + "s")
+        if label not in ["loop", "sparse", "compact", "flags"]:
+            current_seconds.append(seconds)
+        return output
+    current_seconds = []
+    checks = []
+
+    # Subdivision averages
+    df = timeStage("getSDAvgs", "strtree", getSDAvgs, master, subdivisions, id_list, start, today)
+    checks.append(("getSDAvgs (multipart subdivision)",
+                   any("6100000" in list(ids) for ids in df[df.csduid.astype(int) == 3501001].wsuid_list)))
+    if legacy:
+        df_loop = timeStage("getSDAvgs", "loop", getSDAvgs, master, subdivisions, id_list, start, today,
+                            engine = "loop")
+        checks.append(("getSDAvgs", sameResults(df, df_loop, var_cols) and
+                       list(df.wsuid_list) == list(df_loop.wsuid_list)))
+    for col in ["csduid", "cduid"]:
+        df[col] = df[col].astype(int)
+    df_pop = pd.merge(df, pop, on = ["cduid", "csduid"])
+
+    # Population weighted division averages
+    df_cd = timeStage("getCDAvgs", "groupby", getCDAvgs, df_pop, start, today)
+    if legacy:
+        df_cd_loop = timeStage("getCDAvgs", "loop", getCDAvgs, df_pop, start, today, engine = "loop")
+        checks.append(("getCDAvgs", sameResults(df_cd, df_cd_loop, var_cols)))
+
+    # Division averages directly from station readings (replaces both stages above)
+    df_cd_sparse = timeStage("getCDAvgsSparse", "sparse", getCDAvgsSparse, master, subdivisions, id_list, pop, start,
+                             today)
+    checks.append(("getCDAvgsSparse", sameResults(df_cd, df_cd_sparse, var_cols)))
+
+    # Division averages from compact float32 subdivisions averages
+    compact = timeStage("getSDAvgsCompact", "compact", getSDAvgsCompact, master, subdivisions, id_list, start, today)
+    df_cd_compact = timeStage("getCDAvgsCompact", "compact", getCDAvgsCompact, compact, pop)
+    checks.append(("getCDAvgsCompact", sameResults(df_cd, df_cd_compact, var_cols, atol = 1e-4)))
+
+    # Averages of a list of variables with flagged readings excluded, which must match the averages of 
+    # the same readings removed beforehand
+    flag_cols = list(getClimateVars(flag_variables))
+    master_masked = master.copy()
+    for var in flag_variables:
+        master_masked.loc[master_masked[var + "_FLAG"].isin(flag_exclude), var] = np.nan
+    df_flags = timeStage("getSDAvgs", "flags", getSDAvgs, master, subdivisions, id_list, start, today,
+                         variables = flag_variables, exclude_flags = flag_exclude)
+    df_masked = getSDAvgs(master_masked, subdivisions, id_list, start, today, variables = flag_variables)
+    checks.append(("getSDAvgs (exclude_flags)", sameResults(df_flags, df_masked, flag_cols)))
+    if legacy:
+        df_flags_loop = timeStage("getSDAvgs", "loop", getSDAvgs, master, subdivisions, id_list, start, today,
+                                  engine = "loop", variables = flag_variables, exclude_flags = flag_exclude)
+        checks.append(("getSDAvgs (exclude_flags, loop)", sameResults(df_flags, df_flags_loop, flag_cols)))
+    for col in ["csduid", "cduid"]:
+        df_flags[col] = df_flags[col].astype(int)
+    df_cd_flags = getCDAvgs(pd.merge(df_flags, pop, on = ["cduid", "csduid"]), start, today, variables = flag_variables)
+    df_cd_flags_sparse = timeStage("getCDAvgsSparse", "flags", getCDAvgsSparse, master, subdivisions, id_list, pop,
+                                   start, today, variables = flag_variables, exclude_flags = flag_exclude)
+    checks.append(("getCDAvgsSparse (exclude_flags)", sameResults(df_cd_flags, df_cd_flags_sparse, flag_cols)))
+    df_cd = timeStage("dropSparseDates", "groupby", dropSparseDates, df_cd, num_cds, num_district)
+
+    # Closest divisions
+    cduid_list = list(dict.fromkeys(list(df_cd.cduid)))
+    neighbours = timeStage("getDivisionNeighbours", "matrix", getDivisionNeighbours, divisions, cduid_list)
+    if legacy:
+        polygons = {int(uid): polygon for uid, polygon in zip(divisions.CDUID, divisions.geometry)}
+        centroids = {uid: polygon.centroid for uid, polygon in polygons.items()}
+        closest = {}
+        def getClosest():
+            for uid in polygons:
+                closest.update(closestDivisions({uid: polygons[uid]}, centroids, num_district))
+        timeStage("getDivisionNeighbours", "loop", getClosest)
+        checks.append(("getDivisionNeighbours",
+                       all(neighbours[uid][:num_district] == closest[uid] for uid in polygons)))
+
+    # Gap fill
+    try:
+        df_fill = timeStage("fillDivisions", "array", fillDivisions, df_cd, neighbours, num_district)
+        if legacy:
+            df_fill_loop = timeStage("fillDivisions", "loop", originalFill, df_cd, divisions, num_district)
+            checks.append(("fillDivisions", sameResults(df_fill, df_fill_loop, var_cols)))
+    except ValueError:
+        print("fillDivisions skipped: too few divisions with data on some days.")
+    for stage, same in checks:
+        print(stage + " results match original engine: " + str(same))
+        if not same:
+            raise ValueError("ERROR! " + stage + " results differ from the original engine.")
+
+    # Total time of all stages with the current default engines
+    print("All stages (default engines): " + str(round(sum(current_seconds), 3)) + "s")
+    if num_days <= 11 and sum(current_seconds) > time_limit:
+        print("WARNING! Daily update took longer than the time limit of " + str(time_limit) + "s.")
+
+# Save timings
+results = pd.DataFrame(results, columns = ["run", "days", "stations", "divisions", "subdivisions", "stage",
+                                           "engine", "seconds"])
+results.to_csv(outputfile, mode = "a", index = False, header = not os.path.exists(outputfile))
+print("\nBenchmark timings saved to " + outputfile + ".")
+print("\nEnd of benchmarks.")
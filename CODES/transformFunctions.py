@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+This script defines the functions required by transformCoordinates.py (and the
+transform command of climateCLI.py). They only require numpy and pyshp, so the
+coordinate transformations do not import pandas or shapely.
+
+Author:       Minnie Cui
+Date written: 16 October 2026
+Last updated: ---
+"""
+###############################################################################
+# IMPORT REQUIRED PACKAGES
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shapefile as sf
+
+###############################################################################
+# FUNCTIONS REQUIRED BY transformCoordinates.py
+
+# Define apply transformation function
+def applyTransform(transformation, inputfile, outputfile):
+    """
+    Returns shapefile with transformed coordinates projections. All points of 
+    all shapes are transformed in a single array call and each shape keeps 
+    its parts (e.g. islands).
+    
+    Parameters
+    ----------
+    transformation : pyproj.Transformer.from_proj
+        Function defining type of coordinate transformation to apply to the 
+        shapes of inputfile.
+    inputfile : shapefile
+        Input shapefile whose shape coordinates will be transformed by 
+        transformation.
+    outputfile : shapefile
+        Output shapefile with identical records as inputfile and shape 
+        coordinates that have been transformed by transformation.
+
+    Returns
+    -------
+    None.
+
+    """
+    # Read in input data
+    data = sf.Reader("./" + outputfile + "/" + inputfile, encoding="latin1")
+    
+    # Write out required attributes
+    shape_data = data.shapes()
+    nonshape_data = data.records()
+    
+    # Write output data
+    output = sf.Writer("./" + outputfile + "/" + outputfile)
+    
+    # Duplicate fields (except deletion flag, which is not a record field)
+    fields = data.fields
+    for name in fields:
+        if name[0] == "DeletionFlag":
+            continue
+        else:
+            args = name
+            output.field(*args)
+    
+    # Duplicate records
+    for row in nonshape_data:
+        args = row
+        output.record(*args)
+        
+    # Apply transformation to points of all polygons at once
+    counts = [len(shape.points) for shape in shape_data]
+    all_points = np.array([pt[:2] for shape in shape_data for pt in shape.points], dtype = float).reshape(-1, 2)
+    xx, yy = transformation.transform(all_points[:, 0], all_points[:, 1])
+    transformed = np.column_stack([xx, yy])
+    
+    # Split points back into polygons and parts
+    offset = 0
+    for i in range(0, len(shape_data)):
+        bounds = list(shape_data[i].parts) + [counts[i]]
+        parts = []
+        for k in range(len(bounds) - 1):
+            parts.append(transformed[offset + bounds[k]:offset + bounds[k + 1]].tolist())
+        output.poly(parts)
+        offset += counts[i]
+            
+    # Save file
+    output.close()
+
+# Define function to apply a transformation to several shapefiles in parallel
+def applyTransforms(transformation, file_list, workers = 2):
+    """
+    Applies applyTransform to each pair of input and output shapefiles in 
+    file_list, using up to workers processes.
+
+    Parameters
+    ----------
+    transformation : pyproj.Transformer.from_proj
+        Function defining type of coordinate transformation to apply.
+    file_list : list of tuples (str, str)
+        List of (inputfile, outputfile) pairs (see applyTransform).
+    workers : int, optional
+        Number of shapefiles to transform at the same time. The default is 2.
+
+    Returns
+    -------
+    None.
+
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    with ProcessPoolExecutor(max_workers = workers, mp_context = context) as executor:
+        list(executor.map(applyTransform, [transformation] * len(file_list), 
+                          [inputfile for inputfile, _ in file_list], 
+                          [outputfile for _, outputfile in file_list]))